@@ -0,0 +1,357 @@
+import json
+from bisect import bisect_right
+from hashlib import blake2b
+from itertools import chain
+from multiprocessing import Pool, get_start_method
+from types import CodeType
+
+from src.definitions.factors import MissingValuePolicy, SortOrder
+from src.utils.data_utils import deep_get
+from src.utils.formatting_utils import format_decimal
+from src.utils.math_utils import calculate_sorted_percentiles, index_groups, is_close_to_zero, sort_percentile_entries
+from src.utils.rank_utils import RankFactor
+from src.utils.snapshot_utils import HASH_DIGEST_SIZE
+
+
+CASH_FLOW_PATH = ['CASH_FLOW', 'cashflow', 0, 'cashFlow']
+
+# Upper bounds of the micro, small, mid and large cap buckets (anything above is mega cap)
+MARKET_CAP_BUCKETS = [3 * 10 ** 8, 2 * 10 ** 9, 10 ** 10, 2 * 10 ** 11]
+
+# Smallest number of stocks worth evaluating in a worker process
+MIN_SHARD_SIZE = 1000
+
+# Engine and stocks of a sharded evaluation, inherited by forked worker processes
+_shard_state = None
+
+
+def earnings_yield(ebitda, enterprise_value):
+    # EBITDA / EV
+    if ebitda is None:
+        return None
+
+    if enterprise_value is None or enterprise_value <= 0:
+        enterprise_value = 1
+
+    return ebitda / float(enterprise_value)
+
+
+def price_to_cash_flow_ratio(price, cash_flow):
+    if price is None:
+        return None
+
+    if cash_flow is None or is_close_to_zero(cash_flow):
+        return None
+
+    return price / float(cash_flow)
+
+
+def market_cap_bucket(market_cap):
+    return None if market_cap is None else bisect_right(MARKET_CAP_BUCKETS, market_cap)
+
+
+def callable_name(function):
+    """ :returns: identifier of a function (or class) for cache keys and parameters: its qualified name, plus for
+    functions a hash of their code, defaults and closure, so that e.g. two lambdas in the same module never collide.
+    Closures over values without a stable repr get a new hash in every process, so they're never served from a cache.
+    """
+
+    name = '%s.%s' % (function.__module__, function.__qualname__)
+    code = getattr(function, '__code__', None)
+    if code is None:
+        return name
+
+    fingerprint = [_code_fingerprint(code), repr(function.__defaults__),
+                   [repr(cell.cell_contents) for cell in function.__closure__ or []]]
+    digest = blake2b(json.dumps(fingerprint).encode('utf-8'), digest_size=HASH_DIGEST_SIZE).hexdigest()
+    return '%s:%s' % (name, digest)
+
+
+class FactorSpec:
+    """ Declarative definition of a ranking factor: where its inputs come from, how they combine and how the factor
+    is ranked and displayed. """
+
+    def __init__(self, name, priority, sources, formula=None, sort_order=SortOrder.ASCENDING,
+                 missing_value_policy=MissingValuePolicy.MEDIAN, format_function=format_decimal, ranked=True,
+                 composite=True, weight=1.0, default=None):
+        """ Constructor.
+
+        :param name: factor (column) name.
+        :param priority: column sort priority in ranking tables.
+        :param sources: list of inputs, each either a stock data path (as passed to deep_get) or a function of a stock.
+        :param formula: (optional) function combining the source values into the factor value (defaults to the single
+        source's value).
+        :param sort_order: whether lower (ASCENDING) or higher (DESCENDING) values are better.
+        :param missing_value_policy: how missing values are treated when ranking.
+        :param format_function: function to use when formatting this factor.
+        :param ranked: whether the factor's value is its percentile (True) or its raw value (False).
+        :param composite: whether the factor contributes to the stock's comparison value.
+        :param weight: weight of the factor in the stock's comparison value.
+        :param default: raw value to use when the factor is missing.
+        """
+
+        self.name = name
+        self.priority = priority
+        self.sources = sources
+        self.formula = formula
+        self.sort_order = sort_order
+        self.missing_value_policy = missing_value_policy
+        self.format_function = format_function
+        self.ranked = ranked
+        self.composite = composite
+        self.weight = weight
+        self.default = default
+
+    def to_rank_factor(self):
+        """ :returns: ranking table column for this factor. """
+        return RankFactor(self.name, self.priority, self.format_function)
+
+    def get_value(self, stock):
+        """ :returns: the factor's raw (unranked) value for a single stock. """
+
+        values = [s(stock) if callable(s) else deep_get(stock.stock_data, s) for s in self.sources]
+        return self.formula(*values) if self.formula is not None else values[0]
+
+    def rank(self, values, groups=None):
+        """ Ranks raw factor values according to the factor's sort order and missing value policy.
+
+        :param values: list of raw factor values (None for missing values).
+        :param groups: (optional) list of group keys, one per value, to rank within.
+        :return: list of percentiles, in the same order as the values.
+        """
+
+        group_ids = [0] * len(values) if groups is None else index_groups(groups)
+        return self.rank_sorted(self.sort_values(values, group_ids), group_ids)
+
+    def sort_values(self, values, group_ids, offset=0):
+        """ Sorts raw factor values into a run of entries for rank_sorted; runs of consecutive slices of the values can
+        be sorted separately, then concatenated and re-sorted (which merges them).
+
+        :param values: list of raw factor values (None for missing values).
+        :param group_ids: list of integer group ids (see index_groups), one per value.
+        :param offset: index of the first value among all the values being ranked.
+        :return: sorted list of (group id, signed value, index) entries.
+        """
+        return sort_percentile_entries(values, group_ids, self.sort_order == SortOrder.DESCENDING, offset)
+
+    def rank_sorted(self, entries, group_ids):
+        """ Ranks raw factor values from their sorted entries (see sort_values).
+
+        :param entries: sorted entries of all the values being ranked.
+        :param group_ids: list of integer group ids, one per value.
+        :return: list of percentiles, in the same order as the values.
+        """
+
+        reverse = self.sort_order == SortOrder.DESCENDING
+        if self.missing_value_policy == MissingValuePolicy.WORST:
+            return calculate_sorted_percentiles(entries, group_ids, reverse, False, 100.0)
+
+        return calculate_sorted_percentiles(entries, group_ids, reverse)
+
+    def get_parameters(self):
+        """ :returns: JSON-serializable description of how the factor is computed and ranked (functions by name). """
+
+        return {
+            'name': self.name,
+            'sources': [callable_name(s) if callable(s) else s for s in self.sources],
+            'formula': None if self.formula is None else callable_name(self.formula),
+            'sort_order': self.sort_order.name,
+            'missing_value_policy': self.missing_value_policy.name,
+            'ranked': self.ranked,
+            'composite': self.composite,
+            'weight': self.weight,
+            'default': self.default
+        }
+
+
+class FactorEngine:
+    """ Evaluates a set of factor specs over a whole universe of stocks at once. Each distinct source is extracted into
+    a single column, formulas are applied column-wise and each ranked factor costs one sort.
+
+    Where processes are forked, large universes can be split into shards evaluated in a pool of worker processes, which
+    inherit the stocks rather than receiving them pickled. Each worker extracts its shard's columns and sorts a run of
+    each ranked factor's values; the parent merges the runs (one pass of the C sort over presorted runs) and assigns
+    percentiles exactly as a single process would, so the results are identical. The merge, the percentile pass and
+    building the per-stock dictionaries stay serial (returning dictionaries from workers costs as much pickling as
+    building them), which bounds the speedup at roughly the parent's share of a single-process evaluation. """
+
+    def __init__(self, factor_specs, num_processes=1):
+        """ Constructor.
+
+        :param factor_specs: list of FactorSpecs to evaluate.
+        :param num_processes: maximum number of worker processes to evaluate shards of at least MIN_SHARD_SIZE stocks in
+        (1, or a start method other than fork, evaluates every stock in this process).
+        """
+
+        self.factor_specs = factor_specs
+        self.num_processes = num_processes
+
+        # Compile the specs: de-duplicate sources shared between factors (e.g. price, EV)
+        self.sources = {}
+        for spec in factor_specs:
+            for source in spec.sources:
+                self.sources.setdefault(self._source_key(source), source)
+
+        # Kept from the last evaluation, so factors can be updated when a source changes
+        self.groups = None
+        self.source_columns = None
+        self.formula_columns = {}
+        self.factor_columns = None
+
+    def evaluate(self, stocks, groups=None):
+        """ Evaluates every factor for every stock.
+
+        :param stocks: list of stocks to evaluate.
+        :param groups: (optional) list of group keys, one per stock, to rank factors within (e.g. sector).
+        :return: tuple of (list of factor value dictionaries, list of comparison metric dictionaries), one per stock.
+        """
+
+        self.groups = groups
+        num_shards = min(self.num_processes, len(stocks) // MIN_SHARD_SIZE)
+        if num_shards > 1 and get_start_method() == 'fork':
+            self.factor_columns = self._evaluate_shards(stocks, num_shards)
+        else:
+            self.source_columns = {key: self._extract(source, stocks) for key, source in self.sources.items()}
+            self.factor_columns = [self._evaluate_factor(spec) for spec in self.factor_specs]
+
+        return self._collect(len(stocks))
+
+    def update_source(self, source, updated_values):
+        """ Re-evaluates the factors reading a source after its value changed for some of the last evaluated stocks.
+        Formulas are only re-applied for those stocks; ranked factors are re-ranked from the kept values.
+
+        :param source: stock data path whose values changed (e.g. ['PRICE']).
+        :param updated_values: dictionary mapping stock indexes (into the last evaluated stocks) to new source values.
+        :return: tuple of (list of factor value dictionaries, list of comparison metric dictionaries), one per stock.
+        """
+
+        source_key = self._source_key(source)
+        source_column = self.source_columns[source_key]
+        for i, value in updated_values.items():
+            source_column[i] = value
+
+        for j, spec in enumerate(self.factor_specs):
+            if source_key in [self._source_key(s) for s in spec.sources]:
+                self.factor_columns[j] = self._evaluate_factor(spec, updated_values.keys())
+
+        return self._collect(len(source_column))
+
+    def _collect(self, num_stocks):
+        # Builds each stock's dictionaries row by row from the columns (zip keeps the per-stock work in C)
+        names = [spec.name for spec in self.factor_specs]
+        composite_columns = [(s, column) for s, column in zip(self.factor_specs, self.factor_columns) if s.composite]
+        composite_names = [spec.name for spec, _ in composite_columns]
+        weighted_columns = [[spec.weight * value for value in column] for spec, column in composite_columns]
+
+        factor_values = _zip_rows(names, self.factor_columns, num_stocks)
+        return factor_values, _zip_rows(composite_names, weighted_columns, num_stocks)
+
+    def _evaluate_factor(self, spec, updated_indexes=None):
+        columns = [self.source_columns[self._source_key(s)] for s in spec.sources]
+        if spec.formula is None:
+            values = columns[0]
+        elif updated_indexes is None:
+            values = self.formula_columns[spec.name] = list(map(spec.formula, *columns))
+        else:
+            values = self.formula_columns[spec.name]
+            for i in updated_indexes:
+                values[i] = spec.formula(*[column[i] for column in columns])
+
+        return self._rank_factor(spec, values)
+
+    def _evaluate_shard(self, shard_stocks, shard_group_ids, offset):
+        # Extracts one shard's columns and sorts a run of each ranked factor; only scalar columns and runs are pickled
+        # back (source keys may be functions)
+        self.source_columns = {key: self._extract(source, shard_stocks) for key, source in self.sources.items()}
+        self.formula_columns = {
+            spec.name: list(map(spec.formula, *[self.source_columns[self._source_key(s)] for s in spec.sources]))
+            for spec in self.factor_specs if spec.formula is not None
+        }
+        sorted_runs = {
+            spec.name: spec.sort_values(self._get_values(spec), shard_group_ids, offset)
+            for spec in self.factor_specs if spec.ranked
+        }
+
+        return list(self.source_columns.values()), self.formula_columns, sorted_runs
+
+    def _evaluate_shards(self, stocks, num_shards):
+        # Evaluates contiguous shards in worker processes, then merges their sorted runs to rank each ranked factor
+        global _shard_state
+
+        n = len(stocks)
+        shard_bounds = [(n * k // num_shards, n * (k + 1) // num_shards) for k in range(num_shards)]
+        group_ids = [0] * n if self.groups is None else index_groups(self.groups)
+
+        try:
+            _shard_state = (self, stocks, group_ids)
+            with Pool(num_shards) as pool:
+                shard_results = pool.map(_evaluate_shard, shard_bounds)
+        finally:
+            _shard_state = None
+
+        self.source_columns = {
+            key: list(chain.from_iterable(columns[j] for columns, _, _ in shard_results))
+            for j, key in enumerate(self.sources.keys())
+        }
+        self.formula_columns = {
+            spec.name: list(chain.from_iterable(columns[spec.name] for _, columns, _ in shard_results))
+            for spec in self.factor_specs if spec.formula is not None
+        }
+
+        factor_columns = []
+        for spec in self.factor_specs:
+            if not spec.ranked:
+                factor_columns.append(self._rank_factor(spec, self._get_values(spec)))
+                continue
+
+            # The runs are sorted, so this sort only merges them
+            entries = list(chain.from_iterable(runs[spec.name] for _, _, runs in shard_results))
+            entries.sort()
+            factor_columns.append(spec.rank_sorted(entries, group_ids))
+
+        return factor_columns
+
+    def _get_values(self, spec):
+        # Raw (unranked) values of a factor from the current source and formula columns
+        if spec.formula is not None:
+            return self.formula_columns[spec.name]
+
+        return self.source_columns[self._source_key(spec.sources[0])]
+
+    def _rank_factor(self, spec, values):
+        if not spec.ranked:
+            return values if spec.default is None else [spec.default if v is None else v for v in values]
+
+        return spec.rank(values, self.groups)
+
+    @staticmethod
+    def _extract(source, stocks):
+        if callable(source):
+            return [source(stock) for stock in stocks]
+
+        return [deep_get(stock.stock_data, source) for stock in stocks]
+
+    @staticmethod
+    def _source_key(source):
+        return source if callable(source) else tuple(source)
+
+
+def _code_fingerprint(code):
+    # Bytecode, referenced names and constants of a code object, recursing into nested functions' code
+    constants = [_code_fingerprint(c) if isinstance(c, CodeType) else repr(c) for c in code.co_consts]
+    return [code.co_code.hex(), list(code.co_names), constants]
+
+
+def _evaluate_shard(shard_bounds):
+    # Worker process entry point: the engine, stocks and group ids are inherited from the parent rather than pickled
+    engine, stocks, group_ids = _shard_state
+    start, end = shard_bounds
+    return engine._evaluate_shard(stocks[start:end], group_ids[start:end], start)
+
+
+def _zip_rows(names, columns, num_rows):
+    # One dictionary per row, mapping the names to the row's values in the columns
+    if len(columns) == 0:
+        return [{} for _ in range(num_rows)]
+
+    return [dict(zip(names, row)) for row in zip(*columns)]
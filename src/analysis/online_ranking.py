@@ -0,0 +1,207 @@
+from bisect import bisect_left
+from os import listdir
+from statistics import median
+
+from src.analysis.stock import RankedStock
+from src.analysis.trending_value import TRENDING_VALUE_FACTOR_SPECS, TrendingValue
+from src.definitions.factors import MissingValuePolicy, SortOrder
+from src.utils.file_utils import load_json, save_json
+from src.utils.sketch_utils import DEFAULT_SKETCH_CAPACITY, QuantileSketch
+from src.utils.snapshot_utils import is_snapshot, load_stock_data
+from src.utils.universe_utils import SymbolUniverse
+
+
+class OnlineRanker:
+    """ Provisional ranking by a strategy's composite factors (e.g. Trending Value's Value Composite) while stock
+    data is still being ingested. Each factor's distribution is kept in a mergeable QuantileSketch, so percentiles, and
+    the composite values summed from them, come with worst-case error bounds relative to the stocks ingested so far. """
+
+    def __init__(self, factor_specs=TRENDING_VALUE_FACTOR_SPECS, strategy_class=TrendingValue, universe=None,
+                 sketch_capacity=DEFAULT_SKETCH_CAPACITY):
+        """ Constructor.
+
+        :param factor_specs: the strategy's factor specs (only ranked, composite factors are used).
+        :param strategy_class: Strategy class whose eligibility predicates ingested stocks must pass.
+        :param universe: (optional) SymbolUniverse of the symbols to rank (defaults to the persisted universe).
+        :param sketch_capacity: capacity of each factor's QuantileSketch (larger is more accurate).
+        """
+
+        self.factor_specs = [spec for spec in factor_specs if spec.ranked and spec.composite]
+        self.strategy_class = strategy_class
+        self.universe = universe or SymbolUniverse.load()
+        self.sketches = {spec.name: QuantileSketch(sketch_capacity) for spec in self.factor_specs}
+        self.num_missing = {spec.name: 0 for spec in self.factor_specs}
+
+        # Raw factor values of every ingested eligible stock, and the partial files read so far
+        self.factor_values = {}
+        self.partial_files = set()
+
+        # Median of each factor's sketch, kept until more stocks are added
+        self.signed_medians = {}
+
+    def add(self, stock_data):
+        """ Folds newly ingested stock data (e.g. one partial) into the ranking. Symbols already added are skipped.
+
+        :param stock_data: dictionary mapping symbols to complete stock data.
+        """
+
+        for symbol, symbol_data in stock_data.items():
+            if symbol in self.factor_values or not self.universe.is_included(symbol) or \
+                    not self.strategy_class.is_eligible(symbol_data):
+                continue
+
+            stock = RankedStock(symbol, symbol_data)
+            self.signed_medians = {}
+            self.factor_values[symbol] = {spec.name: spec.get_value(stock) for spec in self.factor_specs}
+            for spec in self.factor_specs:
+                value = self.factor_values[symbol][spec.name]
+                if value is None:
+                    self.num_missing[spec.name] += 1
+                else:
+                    self.sketches[spec.name].add(_signed(spec, value))
+
+    def add_partial_files(self, input_dir):
+        """ Folds in every partial file in the directory that hasn't been added yet.
+
+        :param input_dir: partials directory (e.g. the one update_stock_data is writing to).
+        :return: number of partial files added.
+        """
+
+        partial_files = sorted([f for f in listdir(input_dir) if f.endswith('.json') or is_snapshot(f)])
+        new_files = [f for f in partial_files if f not in self.partial_files]
+        for partial_file in new_files:
+            self.add(load_stock_data(input_dir, partial_file))
+            self.partial_files.add(partial_file)
+
+        return len(new_files)
+
+    def merge(self, other):
+        """ Merges another ranker (e.g. from a parallel ingestion worker over a disjoint set of symbols) into this one.
+
+        :param other: OnlineRanker over the same factor specs.
+        """
+
+        for spec in self.factor_specs:
+            self.sketches[spec.name].merge(other.sketches[spec.name])
+            self.num_missing[spec.name] += other.num_missing[spec.name]
+
+        self.factor_values.update(other.factor_values)
+        self.partial_files.update(other.partial_files)
+        self.signed_medians = {}
+
+    def get_percentile(self, spec, value):
+        """ Estimates a raw factor value's percentile among the stocks ingested so far, treating missing values as
+        calculate_percentiles does.
+
+        :param spec: FactorSpec of the factor.
+        :param value: raw factor value.
+        :return: tuple of (estimated percentile, maximum absolute error).
+        """
+
+        if value is None:
+            return (100.0 if spec.missing_value_policy == MissingValuePolicy.WORST else 50.0), 0.0
+
+        sketch = self.sketches[spec.name]
+        signed_value = _signed(spec, value)
+        rank = sketch.rank(signed_value)
+        rank_error = min(sketch.max_rank_error, sketch.count)
+        min_rank, max_rank = max(rank - rank_error, 0), min(rank + rank_error, sketch.count)
+
+        # Missing values pad the distribution with the median, ranking ahead of values strictly worse than it
+        num_missing = self.num_missing[spec.name] if spec.missing_value_policy == MissingValuePolicy.MEDIAN else 0
+        if num_missing == 0:
+            padding = min_padding = max_padding = 0
+        elif rank_error == 0:
+            padding = min_padding = max_padding = num_missing if self._signed_median(spec) < signed_value else 0
+        else:
+            min_padding = num_missing if min_rank >= sketch.count // 2 + 1 else 0
+            max_padding = 0 if max_rank <= (sketch.count - 1) // 2 else num_missing
+            padding = min(max(num_missing if self._signed_median(spec) < signed_value else 0, min_padding), max_padding)
+
+        group_size = float(sketch.count + self.num_missing[spec.name])
+        estimated_rank = rank + padding
+        error = max(estimated_rank - min_rank - min_padding, max_rank + max_padding - estimated_rank)
+        return 100.0 * estimated_rank / group_size, 100.0 * error / group_size
+
+    def get_composite(self, symbol):
+        """ :returns: tuple of (estimated composite value, maximum absolute error) of an ingested stock. """
+
+        composite = 0.0
+        error = 0.0
+        for spec in self.factor_specs:
+            percentile, percentile_error = self.get_percentile(spec, self.factor_values[symbol][spec.name])
+            composite += spec.weight * percentile
+            error += abs(spec.weight) * percentile_error
+
+        return composite, error
+
+    def get_top(self, n):
+        """ Provisional top n of the stocks ingested so far, by composite value (lower is better).
+
+        :param n: number of stocks.
+        :return: list of (symbol, estimated composite value, maximum absolute error, whether the stock is certain to be
+        in the top n of the stocks ingested so far) tuples.
+        """
+
+        composites = {symbol: self.get_composite(symbol) for symbol in self.factor_values.keys()}
+        lower_bounds = sorted([composite - error for composite, error in composites.values()])
+
+        top = []
+        for symbol, (composite, error) in sorted(composites.items(), key=lambda c: c[1][0])[0:n]:
+            # Count the other stocks whose composite could be lower than this stock's worst case
+            num_possibly_better = bisect_left(lower_bounds, composite + error) - (1 if error > 0 else 0)
+            top.append((symbol, composite, error, num_possibly_better < n))
+
+        return top
+
+    def get_exact_composites(self):
+        """ Recomputes every ingested stock's composite value exactly from the retained raw factor values. Once
+        ingestion is complete, these equal the strategy's comparison values before its final re-ranking.
+
+        :return: dictionary mapping symbols to composite values.
+        """
+
+        symbols = list(self.factor_values.keys())
+        composites = [0.0] * len(symbols)
+        for spec in self.factor_specs:
+            percentiles = spec.rank([self.factor_values[s][spec.name] for s in symbols])
+            composites = [c + spec.weight * p for c, p in zip(composites, percentiles)]
+
+        return dict(zip(symbols, composites))
+
+    def get_exact_top(self, n):
+        """ :returns: list of (symbol, composite value) pairs of the exact top n stocks ingested so far. """
+        return sorted(self.get_exact_composites().items(), key=lambda c: c[1])[0:n]
+
+    def save(self, output_dir, file_name):
+        save_json(output_dir, file_name, {
+            'sketches': {name: sketch.to_dict() for name, sketch in self.sketches.items()},
+            'num_missing': self.num_missing,
+            'factor_values': self.factor_values,
+            'partial_files': sorted(self.partial_files)
+        }, indent=None)
+
+    @staticmethod
+    def load(input_dir, file_name, factor_specs=TRENDING_VALUE_FACTOR_SPECS, strategy_class=TrendingValue,
+             universe=None):
+        ranker_json = load_json(input_dir, file_name)
+        ranker = OnlineRanker(factor_specs, strategy_class, universe)
+        ranker.sketches = {name: QuantileSketch.from_dict(s) for name, s in ranker_json['sketches'].items()}
+        ranker.num_missing = ranker_json['num_missing']
+        ranker.factor_values = ranker_json['factor_values']
+        ranker.partial_files = set(ranker_json['partial_files'])
+        return ranker
+
+    def _signed_median(self, spec):
+        # Exact while the sketch hasn't compacted, else estimated; computed once per factor until stocks are added
+        if spec.name not in self.signed_medians:
+            sketch = self.sketches[spec.name]
+            self.signed_medians[spec.name] = median(sketch.levels[0]) if sketch.max_rank_error == 0 else \
+                sketch.quantile(0.5)
+
+        return self.signed_medians[spec.name]
+
+
+def _signed(spec, value):
+    # Negating values when higher is better makes lower signed values better for every factor
+    return -value if spec.sort_order == SortOrder.DESCENDING else value
@@ -0,0 +1,268 @@
+import csv
+import math
+from array import array
+from datetime import date, datetime
+from io import StringIO
+from mmap import ACCESS_READ, mmap
+from os import listdir, truncate
+from os.path import exists, getsize, join
+
+from src.analysis.factors import FactorSpec
+from src.definitions.config import PROCESSED_DATA_DIR
+from src.utils.file_utils import create_directory, load_json, save_json
+from src.utils.formatting_utils import format_decimal
+from src.utils.snapshot_utils import iter_snapshot, is_snapshot
+
+
+PRICE_HISTORY_DIR = join(PROCESSED_DATA_DIR, 'price_history')
+ROLLING_STATE_FILE = 'rolling_momentum_state.json'
+DATES_EXTENSION = '.dates'
+CLOSES_EXTENSION = '.closes'
+
+# Window lengths in trading days
+SKIP_WINDOW = 21
+VOLATILITY_WINDOW = 126
+RETURN_WINDOWS = {'3M RET': 63, '6M RET': 126, '12M RET': 252}
+TRADING_DAYS_PER_YEAR = 252
+
+HISTORICAL_DATE_FORMATS = ['%m/%d/%y', '%m/%d/%Y', '%Y-%m-%d']
+
+# Rank factor columns for the rolling factors, read from the PRICE_HISTORY entry merged into each stock's data
+ROLLING_MOMENTUM_FACTOR_SPECS = [
+    FactorSpec(name, 11 + i, [['PRICE_HISTORY', name]], format_function=format_decimal, ranked=False, composite=False)
+    for i, name in enumerate(list(RETURN_WINDOWS.keys()) + ['12-1M RET', '6M VOL', '12-1M RET/VOL'])
+]
+ROLLING_MOMENTUM_FACTORS = [spec.to_rank_factor() for spec in ROLLING_MOMENTUM_FACTOR_SPECS]
+
+
+class PriceHistoryStore:
+    """ Per-symbol daily closing prices, stored as flat binary arrays (int32 date ordinals and float64 closes) and read
+    through read-only memory maps. The two files are appended separately, so reads only see the records complete in
+    both (e.g. after an interrupted append), and the next append truncates both files to those records first. """
+
+    def __init__(self, directory=PRICE_HISTORY_DIR):
+        """ Constructor.
+
+        :param directory: directory holding the per-symbol arrays.
+        """
+
+        create_directory(directory)
+        self.directory = directory
+        self.mapped_arrays = {}
+
+    def get_symbols(self):
+        return sorted([f[:-len(CLOSES_EXTENSION)] for f in listdir(self.directory) if f.endswith(CLOSES_EXTENSION)])
+
+    def get_dates(self, symbol):
+        """ :returns: zero-copy view of the symbol's date ordinals, in ascending order. """
+        return self._map(symbol, DATES_EXTENSION, 'i')
+
+    def get_closes(self, symbol):
+        """ :returns: zero-copy view of the symbol's closing prices, parallel to get_dates. """
+        return self._map(symbol, CLOSES_EXTENSION, 'd')
+
+    def get_last_date(self, symbol):
+        dates = self.get_dates(symbol)
+        return date.fromordinal(dates[-1]) if len(dates) > 0 else None
+
+    def append(self, symbol, dated_prices):
+        """ Appends closing prices dated after the last stored date.
+
+        :param symbol: stock symbol.
+        :param dated_prices: iterable of (date, closing price) pairs.
+        :return: number of prices appended.
+        """
+
+        last_date = self.get_last_date(symbol)
+        new_prices = sorted([(d, p) for d, p in dated_prices if p is not None and (last_date is None or d > last_date)])
+
+        # De-duplicate dates, keeping the last price seen for each
+        prices_by_date = {d.toordinal(): float(p) for d, p in new_prices}
+        if len(prices_by_date) == 0:
+            return 0
+
+        ordinals = sorted(prices_by_date.keys())
+        self._release(symbol)
+        self._truncate(symbol)
+        with open(self._path(symbol, DATES_EXTENSION), 'ab') as df:
+            df.write(array('i', ordinals).tobytes())
+        with open(self._path(symbol, CLOSES_EXTENSION), 'ab') as cf:
+            cf.write(array('d', [prices_by_date[o] for o in ordinals]).tobytes())
+
+        return len(ordinals)
+
+    def _get_num_records(self, symbol):
+        # Number of records complete in both the dates and closes files
+        dates_path, closes_path = self._path(symbol, DATES_EXTENSION), self._path(symbol, CLOSES_EXTENSION)
+        if not exists(dates_path) or not exists(closes_path):
+            return 0
+
+        return min(getsize(dates_path) // array('i').itemsize, getsize(closes_path) // array('d').itemsize)
+
+    def _map(self, symbol, extension, type_code):
+        key = (symbol, extension)
+        if key not in self.mapped_arrays:
+            num_records = self._get_num_records(symbol)
+            if num_records == 0:
+                return memoryview(array(type_code))
+            with open(self._path(symbol, extension), 'rb') as f:
+                mapped = memoryview(mmap(f.fileno(), 0, access=ACCESS_READ))
+            self.mapped_arrays[key] = mapped[0:num_records * array(type_code).itemsize].cast(type_code)
+
+        return self.mapped_arrays[key]
+
+    def _path(self, symbol, extension):
+        return join(self.directory, symbol + extension)
+
+    def _release(self, symbol):
+        # Drops cached maps so the next read sees appended data
+        for extension in [DATES_EXTENSION, CLOSES_EXTENSION]:
+            self.mapped_arrays.pop((symbol, extension), None)
+
+    def _truncate(self, symbol):
+        # Drops records (and partial records) left in only one of the files, so appends stay aligned
+        num_records = self._get_num_records(symbol)
+        for extension, type_code in [(DATES_EXTENSION, 'i'), (CLOSES_EXTENSION, 'd')]:
+            path = self._path(symbol, extension)
+            size = num_records * array(type_code).itemsize
+            if exists(path) and getsize(path) != size:
+                truncate(path, size)
+
+
+class RollingMomentumEngine:
+    """ Computes return and volatility factors for every symbol in a price history store. Volatility is tracked with
+    running sums of daily log returns, so each update only processes newly appended prices. """
+
+    def __init__(self, store, state=None):
+        """ Constructor.
+
+        :param store: PriceHistoryStore to read prices from.
+        :param state: (optional) previously saved state, mapping symbols to [prices processed, sum, sum of squares].
+        """
+
+        self.store = store
+        self.state = state or {}
+
+    @staticmethod
+    def load(store):
+        return RollingMomentumEngine(store, load_json(store.directory, ROLLING_STATE_FILE))
+
+    def save(self):
+        save_json(self.store.directory, ROLLING_STATE_FILE, self.state, indent=None)
+
+    def update(self):
+        """ Folds prices appended since the last update into the running volatility sums. """
+
+        for symbol in self.store.get_symbols():
+            closes = self.store.get_closes(symbol)
+            processed, total, total_squares = self.state.get(symbol, [1, 0.0, 0.0])
+
+            # Return r_i is the log return from close i - 1 to close i; the window holds the latest VOLATILITY_WINDOW
+            for i in range(max(processed, 1), len(closes)):
+                total, total_squares = _add_return(closes, i, total, total_squares, 1)
+                if i - VOLATILITY_WINDOW >= 1:
+                    total, total_squares = _add_return(closes, i - VOLATILITY_WINDOW, total, total_squares, -1)
+
+            self.state[symbol] = [max(len(closes), 1), total, total_squares]
+
+    def compute(self):
+        """ Computes the rolling factors for the whole universe.
+
+        :return: dictionary mapping symbols to dictionaries of factor values (None where history is too short).
+        """
+
+        self.update()
+
+        factors = {}
+        for symbol in self.store.get_symbols():
+            closes = self.store.get_closes(symbol)
+            n = len(closes)
+
+            symbol_factors = {name: _period_return(closes, n - 1, window) for name, window in RETURN_WINDOWS.items()}
+            skip_month_return = _period_return(closes, n - 1 - SKIP_WINDOW, RETURN_WINDOWS['12M RET'] - SKIP_WINDOW)
+            volatility = self._volatility(symbol, n)
+
+            symbol_factors['12-1M RET'] = skip_month_return
+            symbol_factors['6M VOL'] = volatility
+            symbol_factors['12-1M RET/VOL'] = None if skip_month_return is None or not volatility else \
+                skip_month_return / volatility
+            factors[symbol] = symbol_factors
+
+        return factors
+
+    def _volatility(self, symbol, n):
+        # Annualized standard deviation of daily log returns over the volatility window
+        if n - 1 < VOLATILITY_WINDOW:
+            return None
+
+        _, total, total_squares = self.state[symbol]
+        variance = max(total_squares - total * total / VOLATILITY_WINDOW, 0.0) / (VOLATILITY_WINDOW - 1)
+        return math.sqrt(variance * TRADING_DAYS_PER_YEAR)
+
+
+def parse_historical_data(historical_csv):
+    """ Parses a FinancialContentAPI.get_historical_data response into (date, closing price) pairs.
+
+    :param historical_csv: CSV response text.
+    :return: list of (date, closing price) pairs.
+    """
+
+    dated_prices = []
+    for row in csv.DictReader(StringIO(historical_csv)):
+        row_date = _parse_date(row.get('Date'))
+        close = (row.get('Close') or '').replace(',', '')
+        try:
+            dated_prices.append((row_date, float(close)))
+        except ValueError:
+            continue
+
+    return [(d, p) for d, p in dated_prices if d is not None]
+
+
+def append_snapshot_prices(store, stock_data_file, as_of_date):
+    """ Appends the PRICE of every symbol in a daily stock data snapshot to the store.
+
+    :param store: PriceHistoryStore to append to.
+    :param stock_data_file: processed stock data file (JSON or snapshot).
+    :param as_of_date: date the snapshot's prices were captured.
+    :return: number of prices appended.
+    """
+
+    if is_snapshot(stock_data_file):
+        stock_data = iter_snapshot(PROCESSED_DATA_DIR, stock_data_file)
+    else:
+        stock_data = load_json(PROCESSED_DATA_DIR, stock_data_file).items()
+
+    appended = 0
+    for symbol, symbol_data in stock_data:
+        price = symbol_data.get('PRICE')
+        if isinstance(price, (int, float)):
+            appended += store.append(symbol, [(as_of_date, price)])
+
+    return appended
+
+
+def _add_return(closes, i, total, total_squares, sign):
+    if closes[i - 1] <= 0 or closes[i] <= 0:
+        return total, total_squares
+
+    log_return = math.log(closes[i] / closes[i - 1])
+    return total + sign * log_return, total_squares + sign * log_return * log_return
+
+
+def _parse_date(date_string):
+    for date_format in HISTORICAL_DATE_FORMATS:
+        try:
+            return datetime.strptime((date_string or '').strip(), date_format).date()
+        except ValueError:
+            continue
+
+    return None
+
+
+def _period_return(closes, end, window):
+    start = end - window
+    if start < 0 or end >= len(closes) or closes[start] <= 0:
+        return None
+
+    return closes[end] / closes[start] - 1
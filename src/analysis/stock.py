@@ -1,5 +1,6 @@
+from src.analysis.factors import CASH_FLOW_PATH, earnings_yield, price_to_cash_flow_ratio
 from src.utils.data_utils import deep_get
-from src.utils.math_utils import is_close_to_zero, MAX_VALUE
+from src.utils.math_utils import MAX_VALUE
 
 
 class Stock:
@@ -45,34 +46,13 @@ class Stock:
         return deep_get(self.stock_data, ['ADVANCED_STATS', 'month6ChangePercent'])
 
     def cash_flow(self):
-        cash_flow_array = deep_get(self.stock_data, ['CASH_FLOW', 'cashflow'])
-        if cash_flow_array is None or len(cash_flow_array) == 0:
-            return None
-
-        return cash_flow_array[0].get('cashFlow', None)
+        return deep_get(self.stock_data, CASH_FLOW_PATH)
 
     def earnings_yield(self):
-        # EBIDTA / EV
-        ebidta = self.ebdita()
-        if ebidta is None:
-            return None
-
-        ev = self.enterprise_value()
-        if ev is None or ev <= 0:
-            ev = 1
-
-        return ebidta / float(ev)
+        return earnings_yield(self.ebdita(), self.enterprise_value())
 
     def price_to_cash_flow_ratio(self):
-        price = self.price()
-        if price is None:
-            return None
-
-        cash_flow = self.cash_flow()
-        if cash_flow is None or is_close_to_zero(cash_flow):
-            return None
-
-        return price / float(cash_flow)
+        return price_to_cash_flow_ratio(self.price(), self.cash_flow())
 
 
 class RankedStock(Stock):
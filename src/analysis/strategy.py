@@ -1,45 +1,132 @@
+import inspect
 import json
 from datetime import datetime
+from functools import wraps
 from os.path import join
 from tabulate import tabulate
 
+from src.analysis.factors import FactorSpec, callable_name
+from src.analysis.price_history import RollingMomentumEngine
 from src.analysis.stock import RankedStock
+from src.definitions.config import RAW_DATA_DIR, TICKER_DETAILS
+from src.utils.data_utils import project
 from src.utils.file_utils import save_file, save_json
 from src.utils.formatting_utils import format_currency, format_rank
 from src.utils.math_utils import MAX_VALUE
 from src.utils.rank_utils import RankFactor
+from src.utils.snapshot_utils import hash_payload, iter_stock_data, load_stock_data
+from src.utils.universe_utils import SYMBOL_HEALTH_FILE, SymbolUniverse
 
 
 CONFIG = json.load(open('config.json', 'r'))
 PROCESSED_DATA_DIR = join(CONFIG['DATA_DIRECTORY'], 'processed')
 
-STOCK_INFO_FACTORS = [
-    RankFactor('Rank', 0, format_rank),
-    RankFactor('Company Name', 1, lambda x: x),
-    RankFactor('Symbol', 2, lambda x: x),
-    RankFactor('Price', 3, format_currency)
+STOCK_INFO_FACTOR_SPECS = [
+    FactorSpec('Company Name', 1, [['ADVANCED_STATS', 'companyName']], format_function=lambda x: x, ranked=False,
+               composite=False, default='(N/A)'),
+    FactorSpec('Symbol', 2, [lambda stock: stock.get_symbol()], format_function=lambda x: x, ranked=False,
+               composite=False),
+    FactorSpec('Price', 3, [['PRICE']], format_function=format_currency, ranked=False, composite=False)
 ]
+STOCK_INFO_FACTORS = [RankFactor('Rank', 0, format_rank)] + [spec.to_rank_factor() for spec in STOCK_INFO_FACTOR_SPECS]
+
+
+def cached_ranking(rank_stocks):
+    """ Memoizes a strategy's rank_stocks method in the strategy's ranking cache (if it has one). Entries are keyed by
+    the stock data's content hash, the symbol universe, the strategy's parameters and the ranking arguments, so they
+    are invalidated whenever any of these change; on a hit, the stock data is never loaded. """
+
+    signature = inspect.signature(rank_stocks)
+
+    @wraps(rank_stocks)
+    def cached_rank_stocks(self, *args, **kwargs):
+        # Nested calls (e.g. a subclass ranking on top of its parent's ranking) are part of the outer call
+        if self.is_ranking:
+            return rank_stocks(self, *args, **kwargs)
+
+        arguments = signature.bind(self, *args, **kwargs)
+        arguments.apply_defaults()
+        self.ranking_arguments = {k: v for k, v in arguments.arguments.items() if k != 'self'}
+
+        cache_key = None
+        if self.ranking_cache is not None and self.price_history_store is None and not self.has_live_prices:
+            cache_key = self._get_ranking_cache_key(self.ranking_arguments)
+            ranked_stocks = self.ranking_cache.get(cache_key)
+            if ranked_stocks is not None:
+                self.ranked_stocks = ranked_stocks
+                return
+
+        self._load_stocks()
+        self.is_ranking = True
+        try:
+            rank_stocks(self, *args, **kwargs)
+        finally:
+            self.is_ranking = False
+
+        if cache_key is not None:
+            self.ranking_cache.put(cache_key, self.ranked_stocks)
+
+    return cached_rank_stocks
 
 
 class Strategy:
     """ Base class for an investment strategy. """
 
-    def __init__(self, rank_factors, stock_data_file='stock_data_master.json'):
+    # Predicates over a symbol's stock data that must all hold for the symbol to be ranked
+    ELIGIBILITY_PREDICATES = []
+
+    # Stock data paths (as passed to deep_get) retained when streaming stock data; None retains full payloads
+    STOCK_DATA_FIELDS = None
+
+    def __init__(self, rank_factors, stock_data_file='stock_data_master.json', price_history_store=None,
+                 streaming=False, ranking_cache=None):
         """ Constructor.
 
         :param rank_factors: list of ranking factors to include in output ranking in addition to STOCK_INFO_FACTORS.
-        :param stock_data_file: JSON file containing structured stock data.
+        :param stock_data_file: JSON file or snapshot (.jsonl/.jsonl.gz) containing structured stock data.
+        :param price_history_store: (optional) PriceHistoryStore whose rolling momentum factors are merged into each
+        stock's data under PRICE_HISTORY.
+        :param streaming: whether to parse stock data one symbol at a time, keeping only the declared fields of
+        eligible stocks (bounds memory by the retained metrics rather than the file size).
+        :param ranking_cache: (optional) RankingCache to memoize rankings in. Stock data is then only loaded when a
+        ranking isn't cached (rankings using a price history store or live prices are never cached).
         """
 
-        self.stock_data = json.load(open(join(PROCESSED_DATA_DIR, stock_data_file), 'r'))
-        self.stocks = self._initialize_stocks()
-        self.num_stocks = len(self.stocks)
+        self.stock_data_file = stock_data_file
+        self.price_history_store = price_history_store
+        self.streaming = streaming
+        self.ranking_cache = ranking_cache
         self.rank_factors = sorted(STOCK_INFO_FACTORS + rank_factors)
 
+        # Set when the stock data is loaded (on first access to stocks, unless the strategy has no ranking cache)
+        self.universe = None
+        self.stock_data = None
+        self._stocks = None
+
+        # Set once live prices have been applied, after which the stocks no longer match the stock data file
+        self.has_live_prices = False
+
         # Set after ranking
+        self.is_ranking = False
+        self.ranking_arguments = {}
         self.ranked_stocks = []
         self.ranking_table = []
 
+        if ranking_cache is None:
+            self._load_stocks()
+
+    @property
+    def stocks(self):
+        """ Stocks to rank (eligible stocks in the pruned symbol universe), loading the stock data on first access. """
+
+        self._load_stocks()
+        return self._stocks
+
+    @property
+    def num_stocks(self):
+        return len(self.stocks)
+
+    @cached_ranking
     def rank_stocks(self):
         """ Rank the stocks. """
 
@@ -87,13 +174,104 @@ class Strategy:
         json_ranking = {s.get_symbol(): s.get_rank_factors() for s in self.ranked_stocks}
         save_json(output_dir, ranking_file_prefix + '.json', json_ranking)
 
+    @classmethod
+    def is_eligible(cls, stock_data):
+        """ Whether a symbol with the given (possibly partial) stock data should be ranked by this strategy. """
+        return all(predicate(stock_data) for predicate in cls.ELIGIBILITY_PREDICATES)
+
+    def get_stock_data_fields(self):
+        """ :returns: stock data paths the strategy reads (None if it needs full payloads). """
+        return self.STOCK_DATA_FIELDS
+
+    def get_cache_parameters(self):
+        """ :returns: JSON-serializable parameters that, with the stock data, determine the strategy's ranking. """
+
+        return {
+            'eligibility_predicates': [callable_name(p) for p in self.ELIGIBILITY_PREDICATES],
+            'filtered_symbols': sorted(CONFIG['FILTERED_SYMBOLS']),
+            'rank_factors': [[f.name, f.priority] for f in self.rank_factors],
+            'streaming': self.streaming
+        }
+
     def get_ranked_stocks(self):
         """ Returns ranked stocks. """
         return self.ranked_stocks
 
+    def get_symbols(self):
+        """ :returns: symbols of the stocks the strategy ranks (loading stock data if it hasn't been yet). """
+        return [stock.get_symbol() for stock in self.stocks]
+
+    def _apply_prices(self, prices):
+        """ Sets live prices on the stocks to rank.
+
+        :param prices: dictionary mapping symbols to their latest prices.
+        :return: dictionary mapping the indexes (into self.stocks) of stocks whose price moved to their new price.
+        """
+
+        moved_prices = {}
+        for i, stock in enumerate(self.stocks):
+            price = prices.get(stock.get_symbol())
+            if isinstance(price, (int, float)) and price != stock.stock_data.get('PRICE'):
+                stock.stock_data['PRICE'] = price
+                moved_prices[i] = price
+
+        self.has_live_prices = self.has_live_prices or len(moved_prices) > 0
+        return moved_prices
+
+    def _get_ranking_cache_key(self, ranking_arguments):
+        universe_files = [TICKER_DETAILS, join(RAW_DATA_DIR, SYMBOL_HEALTH_FILE)]
+        return hash_payload({
+            'strategy': callable_name(type(self)),
+            'parameters': self.get_cache_parameters(),
+            'arguments': ranking_arguments,
+            'stock_data': self.ranking_cache.get_stock_data_hash(PROCESSED_DATA_DIR, self.stock_data_file),
+            'universe': [self.ranking_cache.get_file_hash(f) for f in universe_files]
+        })
+
     def _initialize_stocks(self):
-        """ Initialize set of stocks to analyze. """
-        return [RankedStock(symbol, stock_data) for symbol, stock_data in self.stock_data.items()]
+        """ Initialize set of stocks to analyze (eligible stocks in the pruned symbol universe). """
+        return [
+            RankedStock(symbol, stock_data) for symbol, stock_data in self.stock_data.items()
+            if self.universe.is_included(symbol) and self.is_eligible(stock_data)
+        ]
+
+    def _load_stocks(self):
+        """ Loads the symbol universe and stock data and initializes the stocks to rank (once). """
+
+        if self._stocks is not None:
+            return
+
+        self.universe = SymbolUniverse.load()
+        if self.streaming:
+            self.stock_data = self._stream_stock_data(self.stock_data_file)
+        else:
+            self.stock_data = load_stock_data(PROCESSED_DATA_DIR, self.stock_data_file)
+        if self.price_history_store is not None:
+            self._merge_price_history_factors(self.price_history_store)
+        self._stocks = self._initialize_stocks()
+
+    def _merge_price_history_factors(self, price_history_store):
+        """ Computes rolling momentum factors for the whole universe and merges them into the stock data. The rolling
+        state is only saved where prices are appended (see update_price_history), so ranking never writes to the store.
+        """
+
+        price_history_factors = RollingMomentumEngine.load(price_history_store).compute()
+
+        for symbol, stock_data in self.stock_data.items():
+            stock_data['PRICE_HISTORY'] = price_history_factors.get(symbol, {})
+
+    def _stream_stock_data(self, stock_data_file):
+        """ Streams stock data, retaining only the declared fields of eligible stocks in the symbol universe. """
+
+        stock_data_fields = self.get_stock_data_fields()
+        stock_data = {}
+
+        for symbol, symbol_data in iter_stock_data(PROCESSED_DATA_DIR, stock_data_file):
+            if not self.universe.is_included(symbol) or not self.is_eligible(symbol_data):
+                continue
+            stock_data[symbol] = symbol_data if stock_data_fields is None else project(symbol_data, stock_data_fields)
+
+        return stock_data
 
     def _set_ranks(self):
         """ Set the Rank column on newly ranked stocks. """
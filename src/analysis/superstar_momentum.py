@@ -1,27 +1,61 @@
-from src.analysis.strategy import STOCK_INFO_FACTORS
+from src.analysis.factors import FactorEngine, FactorSpec
+from src.analysis.strategy import STOCK_INFO_FACTORS, cached_ranking
 from src.analysis.trending_value import TrendingValue, TRENDING_VALUE_RANK_FACTORS, VALUE_FACTORS
-from src.utils.data_utils import append_if_exists, pad_with_median
-from src.utils.math_utils import calculate_percentile
+from src.definitions.factors import SortOrder
 from src.utils.rank_utils import RankFactor
 
 
 SUPERSTAR_MOMENTUM_FACTOR = [RankFactor('S-M FACTOR', 4)]
+SIX_MONTH_MOMENTUM_SOURCE = ['ADVANCED_STATS', 'month6ChangePercent']
+
+
+def superstar_rank(stock):
+    # Cardinality of the stock's value factors in the top 10th percentile
+    rank_factors = stock.get_rank_factors()
+    return sum([1 if rank_factors[vf.name] <= 10 else 0 for vf in VALUE_FACTORS])
+
+
+def superstar_momentum_factor_specs(superstar_weight, momentum_weight, momentum_source=SIX_MONTH_MOMENTUM_SOURCE):
+    return [
+        FactorSpec('Superstar', None, [superstar_rank], sort_order=SortOrder.DESCENDING, weight=superstar_weight),
+        FactorSpec('Momentum', None, [momentum_source], sort_order=SortOrder.DESCENDING, weight=momentum_weight)
+    ]
 
 
 class SuperstarMomentum(TrendingValue):
     """ Custom ranking methodology that extends Trending Value. """
 
-    def __init__(self, rank_factors=TRENDING_VALUE_RANK_FACTORS, stock_data_file='stock_data_master.json'):
+    def __init__(self, rank_factors=TRENDING_VALUE_RANK_FACTORS, stock_data_file='stock_data_master.json',
+                 rank_group=None, price_history_store=None, momentum_source=SIX_MONTH_MOMENTUM_SOURCE, streaming=False,
+                 ranking_cache=None, num_processes=1):
         """ Constructor.
 
         :param rank_factors: dictionary mapping rank factor names to formatted column headings.
         :param stock_data_file: JSON file containing structured stock data.
+        :param rank_group: (optional) RankGroup within which to rank value factors (defaults to the whole universe).
+        :param price_history_store: (optional) PriceHistoryStore providing rolling momentum factors.
+        :param momentum_source: stock data path of the price momentum factor (e.g. ['PRICE_HISTORY', '12-1M RET'] to
+        use skip-month momentum from the price history store).
+        :param streaming: whether to stream stock data, retaining only the fields the strategy reads.
+        :param ranking_cache: (optional) RankingCache to memoize rankings in.
+        :param num_processes: maximum number of worker processes to evaluate factors in (see FactorEngine).
         """
 
-        TrendingValue.__init__(self, rank_factors, stock_data_file)
+        self.momentum_source = momentum_source
+        TrendingValue.__init__(self, rank_factors, stock_data_file, rank_group=rank_group,
+                               price_history_store=price_history_store, streaming=streaming,
+                               ranking_cache=ranking_cache, num_processes=num_processes)
         updated_tv_factors = [rf.init(rf.priority + 1) for rf in rank_factors]
         self.rank_factors = sorted(STOCK_INFO_FACTORS + SUPERSTAR_MOMENTUM_FACTOR + updated_tv_factors)
 
+    def get_stock_data_fields(self):
+        """ :returns: stock data paths read by Trending Value plus the momentum source. """
+        return TrendingValue.get_stock_data_fields(self) + [self.momentum_source]
+
+    def get_cache_parameters(self):
+        return dict(TrendingValue.get_cache_parameters(self), momentum_source=self.momentum_source)
+
+    @cached_ranking
     def rank_stocks(self, superstar_weight=0.4, momentum_weight=0.6):
         """ Rank the stocks. Methodology:
 
@@ -36,29 +70,31 @@ class SuperstarMomentum(TrendingValue):
 
         # First apply VC2 strategy
         TrendingValue.rank_stocks(self)
+        self._rank_by_superstar_momentum(superstar_weight, momentum_weight)
+
+    def update_prices(self, prices):
+        """ Applies live prices and re-ranks the stocks, using the weights of the last ranking (see
+        TrendingValue.update_prices).
+
+        :param prices: dictionary mapping symbols to their latest prices.
+        :return: list of symbols whose price moved.
+        """
+
+        moved_symbols = TrendingValue.update_prices(self, prices)
+        if len(moved_symbols) > 0:
+            self._rank_by_superstar_momentum(**self.ranking_arguments)
+
+        return moved_symbols
+
+    def _rank_by_superstar_momentum(self, superstar_weight=0.4, momentum_weight=0.6):
+        # Weighted combination of Superstar Rank and price momentum percentiles is the S-M (superstar-momentum) factor
+        factor_specs = superstar_momentum_factor_specs(superstar_weight, momentum_weight, self.momentum_source)
+        factor_engine = FactorEngine(factor_specs, self.factor_engine.num_processes)
+        _, comparison_metrics = factor_engine.evaluate(self.ranked_stocks)
 
-        # Calculate Superstar Rank for each stock
-        superstar_ranks = []
-        momentum_factors = []
-
-        for stock in self.ranked_stocks:
-            rank_factors = stock.get_rank_factors()
-            superstar_rank = sum([1 if rank_factors[vf.name] <= 10 else 0 for vf in VALUE_FACTORS])
-            stock.update_rank_factors({'S-M FACTOR': superstar_rank})
-            append_if_exists(superstar_ranks, superstar_rank)
-            append_if_exists(momentum_factors, stock.six_month_percent_delta())
-
-        # Calculate percentiles and set S-M (superstar-momentum) factor
-        n = len(self.ranked_stocks)
-        superstar_ranks = sorted(pad_with_median(superstar_ranks, n), reverse=True)
-        momentum_factors = sorted(pad_with_median(momentum_factors, n), reverse=True)
-
-        for stock in self.ranked_stocks:
-            superstar_percentile = calculate_percentile(stock.get_rank_factors()['S-M FACTOR'], superstar_ranks, n)
-            momentum_percentile = calculate_percentile(stock.six_month_percent_delta(), momentum_factors, n)
-            superstar_momentum = (superstar_weight * superstar_percentile) + (momentum_weight * momentum_percentile)
-            stock.update_rank_factors({'S-M FACTOR': superstar_momentum})
-            stock.set_comparison_value(superstar_momentum)
+        for stock, stock_comparison_metrics in zip(self.ranked_stocks, comparison_metrics):
+            stock.set_comparison_metrics(stock_comparison_metrics)
+            stock.update_rank_factors({'S-M FACTOR': stock.comparison_value})
 
         self.ranked_stocks = sorted(self.ranked_stocks)
         self._set_ranks()
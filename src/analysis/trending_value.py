@@ -1,43 +1,87 @@
 import json
+import logging
 import math
 from copy import deepcopy
 from os.path import join
 
-from src.analysis.stock import RankedStock
-from src.analysis.strategy import Strategy
-from src.utils.data_utils import append_if_exists, deep_get, merge_dictionaries, pad_with_median
-from src.utils.math_utils import calculate_percentile
-from src.utils.rank_utils import RankFactor
+from src.analysis.factors import CASH_FLOW_PATH, FactorEngine, FactorSpec, earnings_yield, market_cap_bucket, \
+    price_to_cash_flow_ratio
+from src.analysis.strategy import STOCK_INFO_FACTOR_SPECS, Strategy, cached_ranking
+from src.definitions.factors import RankGroup, SortOrder
+from src.utils.data_utils import deep_get
 
 
 CONFIG = json.load(open('config.json', 'r'))
 PROCESSED_DATA_DIR = join(CONFIG['DATA_DIRECTORY'], 'processed')
 
 MIN_MARKET_CAP = 2 * math.pow(10, 8)
-MOMENTUM_FACTOR = [RankFactor('6M P/P', 4)]
-VALUE_FACTORS = [
-    RankFactor('P/B', 5),
-    RankFactor('P/E', 6),
-    RankFactor('P/CF', 7),
-    RankFactor('P/S', 8),
-    RankFactor('DY%', 9),
-    RankFactor('EY%', 10)
+
+# Stocks missing their rank group (e.g. no sector in either advanced stats or the ticker details) are ranked together in
+# this group; a warning is logged when it holds more than MAX_MISSING_RANK_GROUP_FRACTION of the universe
+MISSING_RANK_GROUP = '(N/A)'
+MAX_MISSING_RANK_GROUP_FRACTION = 0.5
+MOMENTUM_FACTOR_SPECS = [
+    FactorSpec('6M P/P', 4, [['ADVANCED_STATS', 'month6ChangePercent']], ranked=False, composite=False)
+]
+VALUE_FACTOR_SPECS = [
+    FactorSpec('P/B', 5, [['ADVANCED_STATS', 'priceToBook']]),
+    FactorSpec('P/E', 6, [['ADVANCED_STATS', 'peRatio']]),
+    FactorSpec('P/CF', 7, [['PRICE'], CASH_FLOW_PATH], price_to_cash_flow_ratio),
+    FactorSpec('P/S', 8, [['ADVANCED_STATS', 'priceToSales']]),
+    FactorSpec('DY%', 9, [['ADVANCED_STATS', 'dividendYield']], sort_order=SortOrder.DESCENDING),
+    FactorSpec('EY%', 10, [['ADVANCED_STATS', 'EBITDA'], ['ADVANCED_STATS', 'enterpriseValue']], earnings_yield,
+               sort_order=SortOrder.DESCENDING)
 ]
+TRENDING_VALUE_FACTOR_SPECS = MOMENTUM_FACTOR_SPECS + VALUE_FACTOR_SPECS
+
+MOMENTUM_FACTOR = [spec.to_rank_factor() for spec in MOMENTUM_FACTOR_SPECS]
+VALUE_FACTORS = [spec.to_rank_factor() for spec in VALUE_FACTOR_SPECS]
 TRENDING_VALUE_RANK_FACTORS = MOMENTUM_FACTOR + VALUE_FACTORS
 
 
+def has_min_market_cap(stock_data):
+    # Key stats carry market cap too, so this also works on tiered ingestion's screening payloads
+    market_cap = deep_get(stock_data, ['ADVANCED_STATS', 'marketcap'], deep_get(stock_data, ['KEY_STATS', 'marketcap']))
+    return market_cap is not None and market_cap >= MIN_MARKET_CAP
+
+
 class TrendingValue(Strategy):
     """ Implementation of the James O’Shaughnessy’s trending value stock ranking methodology. """
 
-    def __init__(self, rank_factors=TRENDING_VALUE_RANK_FACTORS, stock_data_file='stock_data_master.json'):
+    # Filters out any companies with a market cap under $200M
+    ELIGIBILITY_PREDICATES = [has_min_market_cap]
+
+    # Fields read outside of the factor specs (eligibility, rank groups and the momentum re-ranking)
+    STOCK_DATA_FIELDS = [
+        ['ADVANCED_STATS', 'industry'],
+        ['ADVANCED_STATS', 'marketcap'],
+        ['ADVANCED_STATS', 'month6ChangePercent'],
+        ['ADVANCED_STATS', 'sector'],
+        ['KEY_STATS', 'marketcap']
+    ]
+
+    def __init__(self, rank_factors=TRENDING_VALUE_RANK_FACTORS, stock_data_file='stock_data_master.json',
+                 factor_specs=TRENDING_VALUE_FACTOR_SPECS, rank_group=None, price_history_store=None, streaming=False,
+                 ranking_cache=None, num_processes=1):
         """ Constructor.
 
         :param rank_factors: dictionary mapping rank factor names to formatted column headings.
         :param stock_data_file: JSON file containing structured stock data.
+        :param factor_specs: factor specs to evaluate; composite (value) factors make up the Value Composite.
+        :param rank_group: (optional) RankGroup within which to rank value factors (defaults to the whole universe);
+        stocks missing it are ranked within MISSING_RANK_GROUP.
+        :param price_history_store: (optional) PriceHistoryStore providing rolling momentum factors (see
+        ROLLING_MOMENTUM_FACTOR_SPECS).
+        :param streaming: whether to stream stock data, retaining only the fields the factor specs read.
+        :param ranking_cache: (optional) RankingCache to memoize rankings in.
+        :param num_processes: maximum number of worker processes to evaluate factors in (see FactorEngine).
         """
 
-        Strategy.__init__(self, rank_factors, stock_data_file)
+        self.factor_engine = FactorEngine(STOCK_INFO_FACTOR_SPECS + factor_specs, num_processes)
+        self.rank_group = rank_group
+        Strategy.__init__(self, rank_factors, stock_data_file, price_history_store, streaming, ranking_cache)
 
+    @cached_ranking
     def rank_stocks(self):
         """ Rank the stocks. Methodology:
 
@@ -46,7 +90,69 @@ class TrendingValue(Strategy):
         """
 
         self._calculate_metrics()
+        self._rank_top_decile_by_momentum()
+
+    def update_prices(self, prices):
+        """ Applies live prices (e.g. from a QuotePoller) and re-ranks the stocks. Price-dependent factors (such as
+        P/CF) are only recomputed for the stocks whose price moved; rankings with live prices aren't cached.
+
+        :param prices: dictionary mapping symbols to their latest prices.
+        :return: list of symbols whose price moved.
+        """
+
+        # Rankings restored from the cache need the factors evaluated once before they can be updated
+        if self.factor_engine.factor_columns is None:
+            self._calculate_metrics()
+
+        moved_prices = self._apply_prices(prices)
+        if len(moved_prices) == 0:
+            return []
+
+        self._set_metrics(*self.factor_engine.update_source(['PRICE'], moved_prices))
+        self._rank_top_decile_by_momentum()
+        return [self.stocks[i].get_symbol() for i in moved_prices.keys()]
+
+    def get_stock_data_fields(self):
+        """ :returns: stock data paths read by the factor specs and the strategy itself. """
 
+        spec_fields = [s for spec in self.factor_engine.factor_specs for s in spec.sources if not callable(s)]
+        return self.STOCK_DATA_FIELDS + spec_fields
+
+    def get_cache_parameters(self):
+        """ :returns: Strategy cache parameters plus the factor specs, market cap threshold and rank group. """
+
+        return dict(Strategy.get_cache_parameters(self), **{
+            'factor_specs': [spec.get_parameters() for spec in self.factor_engine.factor_specs],
+            'min_market_cap': MIN_MARKET_CAP,
+            'rank_group': None if self.rank_group is None else self.rank_group.value
+        })
+
+    def _calculate_metrics(self):
+        """ Calculate value metric percentiles (within each rank group, if set) and momentum factor (6-month price %
+        delta). """
+
+        groups = None if self.rank_group is None else self._get_rank_groups()
+        self._set_metrics(*self.factor_engine.evaluate(self.stocks, groups))
+
+    def _get_rank_group(self, stock):
+        if self.rank_group == RankGroup.MARKET_CAP:
+            return market_cap_bucket(deep_get(stock.stock_data, ['ADVANCED_STATS', 'marketcap']))
+
+        # Sector and industry come from advanced stats where present, else from the ticker details (blank means missing)
+        group_name = self.rank_group.value
+        ticker_detail = self.universe.get_detail(stock.get_symbol(), group_name)
+        return deep_get(stock.stock_data, ['ADVANCED_STATS', group_name]) or ticker_detail or None
+
+    def _get_rank_groups(self):
+        groups = [self._get_rank_group(stock) for stock in self.stocks]
+        num_missing = groups.count(None)
+        if num_missing > MAX_MISSING_RANK_GROUP_FRACTION * len(groups):
+            logging.warning('%d of %d stocks have no %s, so they are ranked together in the %s group', num_missing,
+                            len(groups), self.rank_group.value, MISSING_RANK_GROUP)
+
+        return [MISSING_RANK_GROUP if group is None else group for group in groups]
+
+    def _rank_top_decile_by_momentum(self):
         # Select top 10% of stocks based on intermediate ranking
         decile = int(self.num_stocks * 0.1)
         top_decile = deepcopy(sorted(self.stocks)[0:decile])
@@ -59,66 +165,10 @@ class TrendingValue(Strategy):
         self.ranked_stocks = sorted(top_decile, reverse=True)
         self._set_ranks()
 
-    def _calculate_metrics(self):
-        """ Calculate value metric percentiles and momentum factor (6-month price % delta). """
-
-        price_to_book_ratios = []
-        price_to_earnings_ratios = []
-        price_to_cash_flow_ratios = []
-        price_to_sales_ratios = []
-        divided_yields = []
-        earnings_yields = []
-
-        # Get metrics for each stock
-        for stock in self.stocks:
-            append_if_exists(price_to_book_ratios, stock.price_to_book_ratio())
-            append_if_exists(price_to_earnings_ratios, stock.price_to_earnings_ratio())
-            append_if_exists(price_to_cash_flow_ratios, stock.price_to_cash_flow_ratio())
-            append_if_exists(price_to_sales_ratios, stock.price_to_sales_ratio())
-            append_if_exists(divided_yields, stock.dividend_yield())
-            append_if_exists(earnings_yields, stock.earnings_yield())
-
-        # Sort each metric in order of descending goodness
-        n = self.num_stocks
-        price_to_book_ratios = sorted(pad_with_median(price_to_book_ratios, n))
-        price_to_earnings_ratios = sorted(pad_with_median(price_to_earnings_ratios, n))
-        price_to_cash_flow_ratios = sorted(pad_with_median(price_to_cash_flow_ratios, n))
-        price_to_sales_ratios = sorted(pad_with_median(price_to_sales_ratios, n))
-        divided_yields = sorted(pad_with_median(divided_yields, n), reverse=True)
-        earnings_yields = sorted(pad_with_median(earnings_yields, n), reverse=True)
-
-        # Generate ranking factors for each stock
-        for stock in self.stocks:
-            info_factors = {
-                'Company Name': stock.get_company_name(),
-                'Symbol': stock.get_symbol(),
-                'Price': stock.price()
-            }
-            momentum_factor = {'6M P/P': stock.six_month_percent_delta()}
-            value_factors = {
-                'P/B': calculate_percentile(stock.price_to_book_ratio(), price_to_book_ratios, n),
-                'P/E': calculate_percentile(stock.price_to_earnings_ratio(), price_to_earnings_ratios, n),
-                'P/CF': calculate_percentile(stock.price_to_cash_flow_ratio(), price_to_cash_flow_ratios, n),
-                'P/S': calculate_percentile(stock.price_to_sales_ratio(), price_to_sales_ratios, n),
-                'DY%': calculate_percentile(stock.dividend_yield(), divided_yields, n),
-                'EY%': calculate_percentile(stock.earnings_yield(), earnings_yields, n),
-            }
-
-            rank_factors = merge_dictionaries([info_factors, momentum_factor, value_factors])
-            stock.set_rank_factors(rank_factors)
-            stock.set_comparison_metrics(value_factors)
-
-    def _initialize_stocks(self):
-        """ Initializes set of stocks by filtering out any companies with a market cap under $200M. """
-
-        stocks = []
-        for symbol, stock_data in self.stock_data.items():
-            market_cap = deep_get(stock_data, ['ADVANCED_STATS', 'marketcap'])
-            if market_cap is None or market_cap < MIN_MARKET_CAP:
-                continue
-            stocks.append(RankedStock(symbol, stock_data))
-
-        return stocks
+    def _set_metrics(self, factor_values, comparison_metrics):
+        for stock, stock_factor_values, stock_comparison_metrics in zip(self.stocks, factor_values, comparison_metrics):
+            stock.set_rank_factors(stock_factor_values)
+            stock.set_comparison_metrics(stock_comparison_metrics)
 
 
 if __name__ == '__main__':
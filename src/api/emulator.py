@@ -0,0 +1,318 @@
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from src.api.stock_data_api import IEXCloudAPI
+from src.definitions.routes import *
+
+
+SECTORS = ['Consumer Services', 'Energy Minerals', 'Finance', 'Health Technology', 'Technology Services', 'Utilities']
+INDUSTRIES = ['Biotechnology', 'Electric Utilities', 'Oil & Gas Production', 'Packaged Software', 'Regional Banks']
+TRADING_DAYS_PER_MONTH = 21
+
+
+class FaultProfile:
+    """ Faults injected into emulator responses, each drawn independently per request. """
+
+    def __init__(self, latency=0.0, latency_jitter=0.0, rate_limit_rate=0.0, server_error_rate=0.0,
+                 truncation_rate=0.0, retry_after=1, seed=None):
+        """ Constructor.
+
+        :param latency: seconds added to every response.
+        :param latency_jitter: maximum seconds of uniformly distributed latency added on top of latency.
+        :param rate_limit_rate: fraction of requests answered with 429 Too Many Requests.
+        :param server_error_rate: fraction of requests answered with a 500 or 503.
+        :param truncation_rate: fraction of successful responses whose body is cut off mid-transfer.
+        :param retry_after: Retry-After header (in seconds) sent with 429 responses.
+        :param seed: (optional) random seed, for reproducible fault sequences.
+        """
+
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.truncation_rate = truncation_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self):
+        """ :returns: tuple of (delay in seconds, fault status code or None, whether to truncate the body). """
+
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.latency_jitter)
+            fault = self.random.random()
+            truncate = self.random.random() < self.truncation_rate
+            server_error = self.random.choice([500, 503])
+
+        if fault < self.rate_limit_rate:
+            return delay, 429, False
+        if fault < self.rate_limit_rate + self.server_error_rate:
+            return delay, server_error, False
+
+        return delay, None, truncate
+
+
+class StockDataEmulator:
+    """ Local HTTP server emulating the IEX Cloud and Financial Content routes used by the stock data APIs, serving
+    recorded stock data (keyed by endpoint name, as saved by update_stock_data) or synthetic payloads. """
+
+    def __init__(self, stock_data=None, fault_profile=None, synthesize=True, host='127.0.0.1', port=0):
+        """ Constructor.
+
+        :param stock_data: (optional) dictionary mapping symbols to recorded payloads by endpoint name.
+        :param fault_profile: (optional) FaultProfile of faults to inject.
+        :param synthesize: whether to serve synthetic payloads for symbols missing from stock_data (otherwise 404).
+        :param host: host to bind to.
+        :param port: port to bind to (0 picks a free port).
+        """
+
+        self.stock_data = stock_data or {}
+        self.fault_profile = fault_profile or FaultProfile()
+        self.synthesize = synthesize
+        self.server = ThreadingHTTPServer((host, port), _EmulatorRequestHandler)
+        self.server.daemon_threads = True
+        self.server.emulator = self
+        self.thread = None
+
+        # (route, status, seconds spent serving) per request
+        self.request_log = []
+        self.request_log_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def get_request_log(self):
+        with self.request_log_lock:
+            return list(self.request_log)
+
+    def reset_request_log(self):
+        with self.request_log_lock:
+            self.request_log = []
+
+    def get_symbol_data(self, symbol):
+        """ :returns: the symbol's payloads by endpoint name (None if the symbol is unknown). """
+
+        if symbol in self.stock_data:
+            return self.stock_data[symbol]
+
+        return synthesize_stock_data(symbol) if self.synthesize else None
+
+    def get_payload(self, symbol, endpoint_name):
+        symbol_data = self.get_symbol_data(symbol)
+        return None if symbol_data is None else symbol_data.get(endpoint_name, {})
+
+    def route(self, path, query):
+        """ Resolves a request to a response.
+
+        :param path: request path, without the leading slash.
+        :param query: dictionary mapping query parameter names to lists of values.
+        :return: tuple of (route name, status code, content type, body).
+        """
+
+        if path == IEXMarketDataEndpoint.BATCH.value:
+            return IEXMarketDataEndpoint.BATCH.name, 200, 'application/json', self._batch(query)
+
+        if path == IEXRefDataEndpoint.SYMBOLS.value:
+            return IEXRefDataEndpoint.SYMBOLS.name, 200, 'application/json', self._ref_data_symbols()
+
+        if path == FinancialContentEndpoint.DETAILED_QUOTE.value:
+            return FinancialContentEndpoint.DETAILED_QUOTE.name, *self._detailed_quote(query)
+
+        if path == FinancialContentEndpoint.HISTORICAL_DATA.value:
+            return FinancialContentEndpoint.HISTORICAL_DATA.name, *self._historical_data(query)
+
+        for endpoint in IEXStockDataEndpoint:
+            prefix, suffix = endpoint.value.split('%s')
+            symbol = path[len(prefix):len(path) - len(suffix)]
+            if path.startswith(prefix) and path.endswith(suffix) and symbol and '/' not in symbol:
+                payload = self.get_payload(symbol, endpoint.name)
+                if payload is None:
+                    return endpoint.name, 404, 'text/plain', b'Unknown symbol'
+                return endpoint.name, 200, 'application/json', json.dumps(payload).encode('utf-8')
+
+        return None, 404, 'text/plain', b'Not found'
+
+    def _batch(self, query):
+        symbols = _query_value(query, 'symbols').split(',')
+        batch_types = _query_value(query, 'types').split(',')
+        endpoint_names = {batch_type: name for name, batch_type in IEXCloudAPI.BATCH_TYPES.items()}
+
+        batch_json = {}
+        for symbol in filter(None, symbols):
+            symbol_data = self.get_symbol_data(symbol)
+            if symbol_data is not None:
+                batch_json[symbol] = {t: symbol_data.get(endpoint_names.get(t), {}) for t in batch_types}
+
+        return json.dumps(batch_json).encode('utf-8')
+
+    def _ref_data_symbols(self):
+        symbols = sorted(self.stock_data.keys())
+        ref_data = [
+            {'symbol': s, 'name': _company_name(s, self.stock_data[s]), 'exchange': 'NYS', 'type': 'cs',
+             'isEnabled': True}
+            for s in symbols
+        ]
+        return json.dumps(ref_data).encode('utf-8')
+
+    def _detailed_quote(self, query):
+        symbol = _fc_symbol(query)
+        price = self.get_payload(symbol, IEXStockDataEndpoint.PRICE.name)
+        if price is None:
+            return 404, 'text/html', b'<html><body>Symbol not found</body></html>'
+
+        html = '<html><body><h1>%s</h1><span class="last">%s</span></body></html>' % (symbol, price)
+        return 200, 'text/html', html.encode('utf-8')
+
+    def _historical_data(self, query):
+        symbol = _fc_symbol(query)
+        price = self.get_payload(symbol, IEXStockDataEndpoint.PRICE.name)
+        if price is None:
+            return 404, 'text/plain', b''
+
+        num_months = int(_query_value(query, 'Range') or 12)
+        rows = ['Date,Open,High,Low,Close,Volume']
+        for day, close in synthesize_price_history(symbol, price, num_months * TRADING_DAYS_PER_MONTH):
+            rows.append('%s,%.2f,%.2f,%.2f,%.2f,%d' % (day.strftime('%m/%d/%Y'), close, close, close, close, 100000))
+
+        return 200, 'text/csv', '\n'.join(rows).encode('utf-8')
+
+
+class _EmulatorRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        start = time.time()
+        emulator = self.server.emulator
+        url = urlparse(self.path)
+
+        route_name, status, content_type, body = emulator.route(url.path.lstrip('/'), parse_qs(url.query))
+        delay, fault_status, truncate = emulator.fault_profile.draw()
+        time.sleep(delay)
+
+        headers = {'Content-Type': content_type}
+        if status == 200 and fault_status is not None:
+            status, body = fault_status, b'Too Many Requests' if fault_status == 429 else b'Internal Server Error'
+            headers = {'Content-Type': 'text/plain'}
+            if fault_status == 429:
+                headers['Retry-After'] = str(emulator.fault_profile.retry_after)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        truncated = status == 200 and truncate
+        if truncated:
+            # Advertise the full length but hang up halfway through the body
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+        with emulator.request_log_lock:
+            emulator.request_log.append((route_name, 'truncated' if truncated else status, time.time() - start))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def synthesize_stock_data(symbol):
+    """ Generates plausible payloads for every IEXStockDataEndpoint, deterministically from the symbol.
+
+    :param symbol: stock symbol.
+    :return: dictionary mapping endpoint names to payloads.
+    """
+
+    r = random.Random(symbol)
+    price = round(r.uniform(2, 400), 2)
+    shares_outstanding = int(r.uniform(2e7, 2e9))
+    market_cap = int(price * shares_outstanding)
+    ebitda = r.uniform(-0.05, 0.25) * market_cap
+
+    key_stats = {
+        'companyName': symbol + ' Inc.',
+        'marketcap': market_cap,
+        'sharesOutstanding': shares_outstanding,
+        'dividendYield': r.choice([0, 0, r.uniform(0, 0.06)]),
+        'peRatio': round(r.uniform(-30, 80), 2),
+        'month6ChangePercent': r.uniform(-0.5, 1.0),
+        'year1ChangePercent': r.uniform(-0.6, 1.5)
+    }
+    advanced_stats = dict(key_stats, **{
+        'EBITDA': ebitda,
+        'enterpriseValue': market_cap * r.uniform(0.8, 1.5),
+        'priceToBook': round(r.uniform(0.3, 12), 2),
+        'priceToSales': round(r.uniform(0.2, 15), 2),
+        'sector': r.choice(SECTORS),
+        'industry': r.choice(INDUSTRIES)
+    })
+
+    return {
+        IEXStockDataEndpoint.ADVANCED_STATS.name: advanced_stats,
+        IEXStockDataEndpoint.CASH_FLOW.name: {
+            'symbol': symbol,
+            'cashflow': [{'cashFlow': ebitda * r.uniform(0.4, 0.9) / shares_outstanding}]
+        },
+        IEXStockDataEndpoint.KEY_STATS.name: key_stats,
+        IEXStockDataEndpoint.PRICE.name: price
+    }
+
+
+def synthesize_price_history(symbol, last_price, num_days):
+    """ Generates a daily random walk of closing prices ending at the given price, newest first.
+
+    :param symbol: stock symbol (seeds the walk).
+    :param last_price: most recent closing price.
+    :param num_days: number of trading days to generate.
+    :return: list of (date, closing price) pairs.
+    """
+
+    r = random.Random(symbol)
+    day = date.today()
+    close = float(last_price) if isinstance(last_price, (int, float)) else 100.0
+
+    history = []
+    while len(history) < num_days:
+        if day.weekday() < 5:
+            history.append((day, close))
+            close = max(close / (1 + r.gauss(0.0003, 0.02)), 0.01)
+        day -= timedelta(days=1)
+
+    return history
+
+
+def _company_name(symbol, symbol_data):
+    advanced_stats = symbol_data.get(IEXStockDataEndpoint.ADVANCED_STATS.name)
+    return (isinstance(advanced_stats, dict) and advanced_stats.get('companyName')) or symbol
+
+
+def _fc_symbol(query):
+    # Financial Content symbols are prefixed with their exchange (e.g. NY:IBM)
+    return _query_value(query, 'Symbol').split(':')[-1]
+
+
+def _query_value(query, name):
+    return (query.get(name) or [''])[0]
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+from src.api.stock_data_api import IEXCloudAPI
+from src.definitions.routes import IEXStockDataEndpoint
+
+
+class QuotePoller:
+    """ Keeps an in-memory table of the latest prices for a set of symbols up to date by polling IEX Cloud on an asyncio
+    event loop. Prices are fetched in batches where possible, with the blocking requests run in the loop's thread pool
+    and at most max_concurrency of them in flight. """
+
+    def __init__(self, api, symbols, interval=60, max_concurrency=4, batch_size=IEXCloudAPI.MAX_BATCH_SIZE,
+                 on_update=None):
+        """ Constructor.
+
+        :param api: IEXCloudAPI to fetch prices with.
+        :param symbols: symbols to poll.
+        :param interval: seconds between the starts of consecutive polls.
+        :param max_concurrency: maximum number of requests in flight at once.
+        :param batch_size: symbols per batch request (1 fetches each symbol's price individually).
+        :param on_update: (optional) function called with a dictionary of the symbols whose price moved during a poll
+        to their new prices (e.g. a strategy's update_prices).
+        """
+
+        self.api = api
+        self.symbols = symbols
+        self.interval = interval
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+        self.on_update = on_update
+        self.is_running = False
+
+        # Latest price and the time it was fetched, by symbol
+        self.prices = {}
+        self.updated_at = {}
+
+    async def poll(self):
+        """ Fetches the latest price of every symbol once.
+
+        :return: dictionary mapping the symbols whose price moved to their new prices.
+        """
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        batches = [self.symbols[i:i + self.batch_size] for i in range(0, len(self.symbols), self.batch_size)]
+        batch_prices = await asyncio.gather(*[self._fetch_prices(semaphore, batch) for batch in batches])
+
+        now = time.time()
+        moved_prices = {}
+        for prices in batch_prices:
+            for symbol, price in prices.items():
+                # Failed requests come back as empty payloads; keep the last known price
+                if not isinstance(price, (int, float)):
+                    continue
+                self.updated_at[symbol] = now
+                if self.prices.get(symbol) != price:
+                    moved_prices[symbol] = price
+
+        self.prices.update(moved_prices)
+        return moved_prices
+
+    async def run(self, num_polls=None):
+        """ Polls every interval seconds until stopped (or num_polls polls have run), passing moved prices to on_update.
+
+        :param num_polls: (optional) number of polls to run.
+        """
+
+        loop = asyncio.get_running_loop()
+        self.is_running = True
+        polls = 0
+
+        while self.is_running and (num_polls is None or polls < num_polls):
+            start = loop.time()
+            moved_prices = await self.poll()
+            polls += 1
+
+            if len(moved_prices) > 0 and self.on_update is not None:
+                self.on_update(moved_prices)
+            if num_polls is None or polls < num_polls:
+                await asyncio.sleep(max(self.interval - (loop.time() - start), 0))
+
+        self.is_running = False
+
+    def stop(self):
+        self.is_running = False
+
+    async def _fetch_prices(self, semaphore, symbols):
+        loop = asyncio.get_running_loop()
+        price_endpoint = IEXStockDataEndpoint.PRICE.name
+
+        async with semaphore:
+            if len(symbols) == 1:
+                return {symbols[0]: await loop.run_in_executor(None, self.api.get_price, symbols[0])}
+
+            batch_data = await loop.run_in_executor(None, self.api.get_batch, symbols, [price_endpoint])
+            if batch_data is None:
+                return {}
+
+            return {symbol: payloads.get(price_endpoint) for symbol, payloads in batch_data.items()}
@@ -1,11 +1,17 @@
 import logging
 import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from itertools import repeat
+from os.path import dirname
 
 from src.definitions.config import *
 from src.definitions.routes import *
-from src.utils.data_utils import merge_stock_data_partials
-from src.utils.file_utils import create_directory, load_stock_symbols, save_file, save_json
+from src.utils.data_utils import deep_get, merge_dictionaries, merge_stock_data_partials
+from src.utils.file_utils import create_directory, load_stock_symbols, save_file
+from src.utils.snapshot_utils import save_stock_data
+from src.utils.universe_utils import SymbolUniverse
 
 
 logging.basicConfig(filename=LOG_FILE, level=logging.DEBUG)
@@ -14,29 +20,50 @@ logging.basicConfig(filename=LOG_FILE, level=logging.DEBUG)
 class StockDataAPI:
     """ Base class for any API used to obtain stock data. """
 
-    def __init__(self, base_url, is_prod=True):
+    # Rate limiting and transient server errors, worth retrying
+    RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+    def __init__(self, base_url, is_prod=True, max_retries=0, retry_backoff=1.0):
         self.base_url = base_url
         self.is_prod = is_prod
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
 
     def _get_response(self, request_url, params={}, headers={}, verify=True):
-        # Make GET request using the given URL, handle any errors, and return response
+        # Make GET request using the given URL, handle (and retry) any errors, and return response
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = requests.get(request_url, params=params, headers=headers, verify=verify)
+                if response.status_code == 200:
+                    return response
+                response_context = self._error_response_context(response)
+                logging.warning('Got error code response from %s: %s', request_url, json.dumps(response_context))
+                if response.status_code not in self.RETRY_STATUS_CODES:
+                    return None
+                retry_after = response.headers.get('Retry-After')
+            except Exception as e:
+                logging.warning('The following exception occurred trying to make request to %s: %s', request_url,
+                                str(e))
+
+            if attempt < self.max_retries:
+                time.sleep(self._retry_delay(attempt, retry_after))
+
+        return None
+
+    def _retry_delay(self, attempt, retry_after=None):
+        # Honors the server's Retry-After (in seconds) when given, otherwise backs off exponentially
         try:
-            response = requests.get(request_url, params=params, headers=headers, verify=verify)
-            if response.status_code == 200:
-                return response
-            response_context = self._error_response_context(response)
-            logging.warning('Got error code response from %s: %s', request_url, json.dumps(response_context))
-            return None
-        except Exception as e:
-            logging.warning('The following exception occurred trying to make request to %s: %s', request_url, str(e))
-            return None
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return self.retry_backoff * 2 ** attempt
 
     def _error_response_context(self, response):
         return {
             'Status': response.status_code,
             'Reason': response.reason,
             'Content': response.text,
-            'Headers': json.loads(response.headers or {}),
+            'Headers': dict(response.headers or {}),
             'URL': response.url,
             'Prod?': self.is_prod
         }
@@ -50,8 +77,8 @@ class FinancialContentAPI(StockDataAPI):
         FinancialContentEndpoint.HISTORICAL_DATA.name: 'action/gethistoricaldata',
     }
 
-    def __init__(self):
-        StockDataAPI.__init__(self, CONFIG['FINANCIAL_CONTENT_API_URL'])
+    def __init__(self, base_url=None, max_retries=0, retry_backoff=1.0):
+        StockDataAPI.__init__(self, base_url or CONFIG['FINANCIAL_CONTENT_API_URL'], True, max_retries, retry_backoff)
 
     def get_detailed_quote(self, symbol):
         params = {'Symbol': 'NY:' + symbol}
@@ -90,8 +117,21 @@ class IEXCloudAPI(StockDataAPI):
         IEXRefDataEndpoint.SYMBOLS.name: 'get_symbols'
     }
 
-    def __init__(self, is_prod=True):
-        StockDataAPI.__init__(self, CONFIG['IEX_API_URL'] if is_prod else CONFIG['SANDBOX_IEX_API_URL'], is_prod)
+    # Data types accepted by the batch endpoint for each stock data endpoint
+    BATCH_TYPES = {
+        IEXStockDataEndpoint.ADVANCED_STATS.name: 'advanced-stats',
+        IEXStockDataEndpoint.CASH_FLOW.name: 'cash-flow',
+        IEXStockDataEndpoint.KEY_STATS.name: 'stats',
+        IEXStockDataEndpoint.PRICE.name: 'price'
+    }
+    MAX_BATCH_SIZE = 100
+
+    # Cheap endpoints fetched for every symbol during tiered ingestion, before strategy eligibility is evaluated
+    SCREENING_ENDPOINTS = [IEXStockDataEndpoint.KEY_STATS.name]
+
+    def __init__(self, is_prod=True, base_url=None, max_retries=0, retry_backoff=1.0):
+        default_url = CONFIG['IEX_API_URL'] if is_prod else CONFIG['SANDBOX_IEX_API_URL']
+        StockDataAPI.__init__(self, base_url or default_url, is_prod, max_retries, retry_backoff)
         self.params = {'token': CONFIG['IEX_API_KEY'] if is_prod else CONFIG['SANDBOX_IEX_API_KEY']}
 
     def get_advanced_stats(self, symbol):
@@ -110,6 +150,25 @@ class IEXCloudAPI(StockDataAPI):
         request_url = join(self.base_url, IEXStockDataEndpoint.PRICE.value % symbol)
         return self._get_response(request_url)
 
+    def get_batch(self, symbols, endpoints):
+        """ Fetches several endpoints for up to MAX_BATCH_SIZE symbols in a single request.
+
+        :param symbols: symbols to fetch.
+        :param endpoints: names of the endpoints to fetch.
+        :return: dictionary mapping each symbol to its payloads by endpoint (empty where the batch had none), or None if
+        the request itself failed (e.g. rate limited, a server error or a network error).
+        """
+
+        request_url = join(self.base_url, IEXMarketDataEndpoint.BATCH.value)
+        batch_types = [self.BATCH_TYPES[e] for e in endpoints]
+        params = merge_dictionaries([self.params, {'symbols': ','.join(symbols), 'types': ','.join(batch_types)}])
+        response = StockDataAPI._get_response(self, request_url, params)
+        if response is None:
+            return None
+
+        batch_json = json.loads(response.content or '{}')
+        return {s: {e: deep_get(batch_json, [s, self.BATCH_TYPES[e]], {}) for e in endpoints} for s in symbols}
+
     def get_symbols(self):
         request_url = join(self.base_url, IEXRefDataEndpoint.SYMBOLS.value)
         return self._get_response(request_url)
@@ -123,26 +182,121 @@ class IEXCloudAPI(StockDataAPI):
         symbols = sorted([t['symbol'] for t in filter(lambda j: j['type'] == 'cs', symbol_json)])
         save_file(RAW_DATA_DIR, output_name, '\n'.join(symbols))
 
-    def update_stock_data(self, symbols=None, endpoints=None, output_name='stock_data_'):
-        output_dir = join(PROCESSED_DATA_DIR, datetime.today().strftime('%Y%m%d') + '_partials')
+    def update_stock_data(self, symbols=None, endpoints=None, output_name='stock_data_', output_extension='.json',
+                          output_dir=None, universe=None, max_workers=1, on_partial=None):
+        """ Fetches stock data for every symbol in the universe, saving it in partials of 10 symbols which are then
+        merged into a single file alongside the partials directory.
+
+        :param symbols: (optional) symbols to ingest (defaults to all ticker symbols).
+        :param endpoints: (optional) names of the endpoints to fetch (defaults to all IEXStockDataEndpoints).
+        :param output_name: partial file name prefix.
+        :param output_extension: partial file extension (.json, .jsonl or .jsonl.gz).
+        :param output_dir: (optional) partials directory (defaults to today's partials directory).
+        :param universe: (optional) SymbolUniverse to prune symbols with (defaults to the persisted universe).
+        :param max_workers: number of symbols fetched concurrently.
+        :param on_partial: (optional) function called with each partial's stock data once it has been saved (e.g.
+        OnlineRanker.add).
+        """
+
+        output_dir = output_dir or self._partials_directory()
         create_directory(output_dir)
 
-        symbol_queue = symbols or load_stock_symbols()
-        ingest_endpoints = endpoints or [e.value for e in IEXStockDataEndpoint]
+        universe = universe or SymbolUniverse.load()
+        ingest_endpoints = endpoints or [e.name for e in IEXStockDataEndpoint]
+        symbol_queue, pruned_symbols = universe.prune(symbols if symbols is not None else load_stock_symbols())
         symbol_data = {}
         n = len(symbol_queue)
 
-        for i, symbol in enumerate(symbol_queue):
-            print('Processing symbol %s (%d of %d)' % (symbol, i + 1, n))
+        pruning_summary = 'Pruned %d symbols from the universe, saving %d requests' % (
+            len(pruned_symbols), len(pruned_symbols) * len(ingest_endpoints))
+        print(pruning_summary)
+        logging.info(pruning_summary)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            symbol_payloads = executor.map(self._get_symbol_data, symbol_queue, repeat(ingest_endpoints))
+            for i, (symbol, payloads) in enumerate(zip(symbol_queue, symbol_payloads)):
+                print('Processing symbol %s (%d of %d)' % (symbol, i + 1, n))
+
+                symbol_data[symbol] = payloads
+                universe.record_payloads(symbol, symbol_data[symbol])
+
+                # Dump data in segments
+                if (i + 1) % 10 == 0 or i == n - 1:
+                    print(str(symbol_data))
 
-            args = {'symbol': symbol}
-            symbol_data[symbol] = {e: getattr(self, self.ENDPOINT_FUNCTIONS[e])(**args) for e in ingest_endpoints}
+                    save_stock_data(output_dir, output_name + str(i + 1) + output_extension, symbol_data, True)
+                    if on_partial is not None:
+                        on_partial(symbol_data)
+                    symbol_data = {}
 
-            # Dump data in segments
-            if (i + 1) % 10 == 0 or i == n - 1:
-                print(str(symbol_data))
+        merge_stock_data_partials(output_dir, '_stock_data' + output_extension, dirname(output_dir))
 
-                save_json(output_dir, output_name + str(i + 1) + '.json', symbol_data, True)
-                symbol_data = {}
+    def update_stock_data_tiered(self, strategies, symbols=None, output_name='stock_data_', output_extension='.json'):
+        """ Ingests stock data in two tiers: SCREENING_ENDPOINTS are fetched in batches for every symbol, and the
+        remaining endpoints only for symbols that pass at least one strategy's eligibility predicates.
 
-        merge_stock_data_partials(output_dir)
+        :param strategies: strategy classes whose eligibility predicates to screen symbols against.
+        :param symbols: (optional) symbols to ingest (defaults to all ticker symbols).
+        :param output_name: partial file name prefix.
+        :param output_extension: partial file extension (.json, .jsonl or .jsonl.gz).
+        """
+
+        output_dir = self._partials_directory()
+        universe = SymbolUniverse.load()
+        symbol_queue, _ = universe.prune(symbols if symbols is not None else load_stock_symbols())
+        n = len(symbol_queue)
+
+        screening_data = {}
+        failed_batches = []
+        for i in range(0, n, self.MAX_BATCH_SIZE):
+            print('Screening symbols %d-%d of %d' % (i + 1, min(i + self.MAX_BATCH_SIZE, n), n))
+            batch = symbol_queue[i:i + self.MAX_BATCH_SIZE]
+            batch_data = self.get_batch(batch, self.SCREENING_ENDPOINTS)
+            if batch_data is None:
+                failed_batches.append(batch)
+            else:
+                screening_data.update(batch_data)
+
+        # Failed requests say nothing about their symbols, so they're retried once and never count against symbol health
+        unscreened_symbols = []
+        for batch in failed_batches:
+            batch_data = self.get_batch(batch, self.SCREENING_ENDPOINTS)
+            if batch_data is None:
+                unscreened_symbols.extend(batch)
+            else:
+                screening_data.update(batch_data)
+
+        if len(unscreened_symbols) > 0:
+            failure_summary = 'Screening requests failed for %d symbols, which are skipped this run: %s' % (
+                len(unscreened_symbols), ','.join(unscreened_symbols))
+            print(failure_summary)
+            logging.warning(failure_summary)
+
+        for symbol, payloads in screening_data.items():
+            universe.record_payloads(symbol, payloads)
+        save_stock_data(output_dir, output_name + 'screening' + output_extension, screening_data, True)
+
+        eligible_symbols = [s for s in symbol_queue if s in screening_data and
+                            any(st.is_eligible(screening_data[s]) for st in strategies)]
+        remaining_endpoints = [e.name for e in IEXStockDataEndpoint if e.name not in self.SCREENING_ENDPOINTS]
+
+        screening_summary = '%d of %d symbols passed screening, saving %d requests' % (
+            len(eligible_symbols), n, (n - len(eligible_symbols)) * len(remaining_endpoints))
+        print(screening_summary)
+        logging.info(screening_summary)
+
+        # Only the screening partial needs merging when no symbol passed screening
+        if len(eligible_symbols) == 0:
+            merge_stock_data_partials(output_dir, '_stock_data' + output_extension, dirname(output_dir))
+            return
+
+        self.update_stock_data(eligible_symbols, remaining_endpoints, output_name, output_extension, output_dir,
+                               universe)
+
+    def _get_symbol_data(self, symbol, endpoints):
+        return {e: getattr(self, self.ENDPOINT_FUNCTIONS[e])(symbol=symbol) for e in endpoints}
+
+    def _partials_directory(self):
+        output_dir = join(PROCESSED_DATA_DIR, datetime.today().strftime('%Y%m%d') + '_partials')
+        create_directory(output_dir)
+        return output_dir
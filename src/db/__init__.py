@@ -3,6 +3,9 @@ from SQLAlchemyDB import Database
 from src.definitions.config import DB_CONFIG
 
 
+# Symbols per query, keeping each IN list well under SQLite's bound variable limit (999 before 3.32)
+SYMBOL_QUERY_BATCH_SIZE = 500
+
 database = Database(DB_CONFIG)
 metadata = database.get_metadata()
 
@@ -0,0 +1,47 @@
+from sqlalchemy import Column, Integer, Sequence
+
+from src.db import Base, metadata
+
+
+class StockDataHistory(Base):
+    """
+    Represents the stock data history table in the DB (one row per symbol per day, see create_stock_history_table).
+    Postgres schema:
+
+                           Table "public.stock_data_history"
+            Column          |       Type        | Collation | Nullable |                 Default
+    ------------------------+-------------------+-----------+----------+-----------------------------------------
+     id                     | integer           |           | not null | nextval('stock_data_history_seq'::regclass)
+     symbol                 | character varying |           | not null |
+     as_of_date             | date              |           | not null |
+     price                  | double precision  |           |          |
+     market_cap             | double precision  |           |          |
+     pe_ratio               | double precision  |           |          |
+     price_to_book          | double precision  |           |          |
+     price_to_sales         | double precision  |           |          |
+     dividend_yield         | double precision  |           |          |
+     ebitda                 | double precision  |           |          |
+     enterprise_value       | double precision  |           |          |
+     operating_cash_flow    | double precision  |           |          |
+     month6_change_percent  | double precision  |           |          |
+     key_stats              | json              |           |          |
+     advanced_stats         | json              |           |          |
+     cash_flow              | json              |           |          |
+    Indexes:
+        "stock_data_history_pkey" PRIMARY KEY, btree (id)
+        "ix_stock_data_history_symbol_as_of_date" UNIQUE, btree (symbol, as_of_date)
+        "ix_stock_data_history_as_of_date" btree (as_of_date)
+        "ix_stock_data_history_id" UNIQUE, btree (id)
+    """
+
+    __tablename__ = 'stock_data_history'
+    __table_args__ = {'extend_existing': True}
+
+    id = Column(Integer, Sequence('stock_data_history_seq', metadata=metadata), primary_key=True, index=True,
+                unique=True)
+
+    def __eq__(self, other):
+        return self.id == other.id and self.__class__.__name__ == other.__class__.__name__
+
+    def __hash__(self):
+        return hash(self.__class__.__name__ + str(self.id))
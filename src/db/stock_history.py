@@ -0,0 +1,56 @@
+from sqlalchemy import select
+
+from src.db import SYMBOL_QUERY_BATCH_SIZE, database
+from src.db.entities.stock_history import StockDataHistory
+from src.definitions.stats import STOCK_DATA_HISTORY_METRICS
+from src.utils.data_utils import deep_get
+
+
+def get_history_metrics(symbol_data):
+    """ :returns: dictionary mapping every scalar metric column to its value in the stock data (None if missing or not
+    a number). """
+
+    metrics = {}
+    for column, path in STOCK_DATA_HISTORY_METRICS.items():
+        value = deep_get(symbol_data, path)
+        metrics[column] = value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+    return metrics
+
+
+def load_stock_data_history(symbols=None, start_date=None, end_date=None, columns=None):
+    """ Loads the history of a set of symbols over a date range in a single query, as columnar arrays.
+
+    :param symbols: (optional) symbols to load (defaults to every symbol).
+    :param start_date: (optional) first as of date to load (inclusive).
+    :param end_date: (optional) last as of date to load (inclusive).
+    :param columns: (optional) metric (or JSON) columns to load (defaults to every scalar metric column).
+    :return: dictionary mapping 'symbol', 'as_of_date' and each column to a list of values, ordered by symbol and then
+    as of date.
+    """
+
+    table = StockDataHistory.__table__
+    column_names = ['symbol', 'as_of_date'] + (columns or list(STOCK_DATA_HISTORY_METRICS.keys()))
+    query = select([table.c[c] for c in column_names]).order_by(table.c.symbol, table.c.as_of_date)
+
+    if start_date is not None:
+        query = query.where(table.c.as_of_date >= start_date)
+    if end_date is not None:
+        query = query.where(table.c.as_of_date <= end_date)
+
+    # Batches of sorted symbols keep the rows ordered by symbol across batches
+    if symbols is None:
+        queries = [query]
+    else:
+        symbols = sorted(set(symbols))
+        queries = [query.where(table.c.symbol.in_(symbols[i:i + SYMBOL_QUERY_BATCH_SIZE]))
+                   for i in range(0, len(symbols), SYMBOL_QUERY_BATCH_SIZE)]
+
+    rows = []
+    with database.get_engine().connect() as connection:
+        for batch_query in queries:
+            rows.extend(connection.execute(batch_query).fetchall())
+
+    # Transpose the rows into one list per column
+    column_values = list(zip(*rows)) or [()] * len(column_names)
+    return {c: list(values) for c, values in zip(column_names, column_values)}
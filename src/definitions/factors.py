@@ -0,0 +1,22 @@
+from enum import Enum
+
+
+class MissingValuePolicy(Enum):
+    # Missing values pad the distribution with its median and get the 50th percentile
+    MEDIAN = 'median'
+    # Missing values rank behind every present value
+    WORST = 'worst'
+
+
+class SortOrder(Enum):
+    # Lower values are better (e.g. P/E)
+    ASCENDING = 'ascending'
+    # Higher values are better (e.g. dividend yield)
+    DESCENDING = 'descending'
+
+
+class RankGroup(Enum):
+    # Factor percentiles are computed within each of these groups rather than across the whole universe
+    INDUSTRY = 'industry'
+    MARKET_CAP = 'marketcap'
+    SECTOR = 'sector'
@@ -15,3 +15,7 @@ class IEXStockDataEndpoint(Enum):
 
 class IEXRefDataEndpoint(Enum):
     SYMBOLS = 'ref-data/symbols'
+
+
+class IEXMarketDataEndpoint(Enum):
+    BATCH = 'stock/market/batch'
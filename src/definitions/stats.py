@@ -7,3 +7,19 @@ class KeyStat(Enum):
     MONTH_6_CHANGE_PERCENT = 'month6ChangePercent'
     PE_RATIO = 'peRatio'
     TTM_EPS = 'ttmEPS'
+
+
+# Scalar metric columns of the stock data history table, and the stock data paths they're extracted from
+STOCK_DATA_HISTORY_METRICS = {
+    'price': ['PRICE'],
+    'market_cap': ['ADVANCED_STATS', 'marketcap'],
+    'pe_ratio': ['ADVANCED_STATS', 'peRatio'],
+    'price_to_book': ['ADVANCED_STATS', 'priceToBook'],
+    'price_to_sales': ['ADVANCED_STATS', 'priceToSales'],
+    'dividend_yield': ['ADVANCED_STATS', 'dividendYield'],
+    'ebitda': ['ADVANCED_STATS', 'EBITDA'],
+    'enterprise_value': ['ADVANCED_STATS', 'enterpriseValue'],
+    'operating_cash_flow': ['CASH_FLOW', 'cashflow', 0, 'cashFlow'],
+    'month6_change_percent': ['ADVANCED_STATS', 'month6ChangePercent']
+}
+STOCK_DATA_HISTORY_JSON_COLUMNS = ['key_stats', 'advanced_stats', 'cash_flow']
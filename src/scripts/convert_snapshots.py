@@ -0,0 +1,21 @@
+import sys
+from os import listdir
+
+from src.definitions.config import PROCESSED_DATA_DIR
+from src.utils.snapshot_utils import convert_to_snapshot
+
+
+def convert_snapshots(compress=True, remove_source=False):
+    # Converts the master file and every merged daily (*_stock_data.json) file to the snapshot format
+    json_files = [
+        f for f in listdir(PROCESSED_DATA_DIR)
+        if f.endswith('.json') and (f.endswith('_stock_data.json') or f.startswith('stock_data_master'))
+    ]
+
+    for i, json_file in enumerate(sorted(json_files)):
+        snapshot_file = convert_to_snapshot(PROCESSED_DATA_DIR, json_file, compress, remove_source)
+        print('Converted %s to %s (%d of %d)' % (json_file, snapshot_file, i + 1, len(json_files)))
+
+
+if __name__ == '__main__':
+    convert_snapshots(remove_source='--remove-source' in sys.argv)
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Date, Float, Index, Integer, JSON, Sequence, String
+from SQLAlchemyDB import DBColumn, Table as DBTable
+
+from src.db import metadata
+from src.definitions.stats import STOCK_DATA_HISTORY_JSON_COLUMNS, STOCK_DATA_HISTORY_METRICS
+
+
+def create_table():
+    table = 'stock_data_history'
+
+    # Ids default to the next value of the table's sequence on Postgres (so bulk inserts never supply them), and to
+    # the integer primary key's rowid on SQLite, which has no sequences
+    id_sequence = Sequence(table + '_seq', metadata=metadata)
+    id_default = id_sequence.next_value() if metadata.bind.dialect.supports_sequences else None
+    id_column = Column('id', Integer, id_sequence, server_default=id_default, primary_key=True, index=True, unique=True)
+
+    symbol_column = DBColumn('symbol', String).create(metadata, table)
+    as_of_date_column = DBColumn('as_of_date', Date).as_index().create(metadata, table)
+    columns = [id_column, symbol_column, as_of_date_column]
+    columns.extend([DBColumn(mc, Float).as_nullable().create(metadata, table) for mc in STOCK_DATA_HISTORY_METRICS])
+    columns.extend([DBColumn(jc, JSON).as_nullable().create(metadata, table) for jc in STOCK_DATA_HISTORY_JSON_COLUMNS])
+
+    # One row per symbol per day; symbol-first ordering serves date range queries over a set of symbols, and the
+    # as_of_date index serves whole-universe date range queries (on both SQLite and Postgres)
+    DBTable(table, metadata, columns)
+    Index('ix_%s_symbol_as_of_date' % table, symbol_column, as_of_date_column, unique=True)
+    metadata.create_all()
+
+
+if __name__ == '__main__':
+    create_table()
@@ -0,0 +1,88 @@
+import contextlib
+import io
+import math
+import tempfile
+import time
+from os.path import join
+from tabulate import tabulate
+
+from src.api.emulator import FaultProfile, StockDataEmulator
+from src.api.stock_data_api import IEXCloudAPI
+from src.definitions.config import PROCESSED_DATA_DIR
+from src.definitions.routes import IEXStockDataEndpoint
+from src.utils.data_utils import is_empty
+from src.utils.snapshot_utils import load_stock_data
+from src.utils.universe_utils import SymbolUniverse
+
+
+def load_test_ingestion(num_symbols=200, stock_data_file=None, fault_profile=None, max_workers=1, max_retries=0,
+                        retry_backoff=0.1, output_extension='.json'):
+    """ Drives IEXCloudAPI.update_stock_data against a local emulator and measures its throughput and completeness.
+
+    :param num_symbols: number of (synthetic or recorded) symbols to ingest.
+    :param stock_data_file: (optional) processed stock data file whose payloads the emulator serves.
+    :param fault_profile: (optional) FaultProfile of faults the emulator injects.
+    :param max_workers: number of symbols fetched concurrently.
+    :param max_retries: retries per request on 429s, 5xx errors and broken responses.
+    :param retry_backoff: initial retry backoff in seconds.
+    :param output_extension: partial file extension.
+    :return: dictionary of load test results.
+    """
+
+    stock_data = load_stock_data(PROCESSED_DATA_DIR, stock_data_file) if stock_data_file else {}
+    symbols = sorted(stock_data.keys())[:num_symbols] or ['SYM%05d' % i for i in range(num_symbols)]
+    endpoints = [e.name for e in IEXStockDataEndpoint]
+
+    with StockDataEmulator(stock_data, fault_profile) as emulator, tempfile.TemporaryDirectory() as output_root:
+        api = IEXCloudAPI(False, emulator.base_url, max_retries, retry_backoff)
+        universe = SymbolUniverse([], health_directory=None)
+        output_dir = join(output_root, 'load_test_partials')
+
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            api.update_stock_data(symbols, endpoints, output_extension=output_extension, output_dir=output_dir,
+                                  universe=universe, max_workers=max_workers)
+        elapsed = time.time() - start
+
+        ingested = load_stock_data(output_root, 'load_test_partials_stock_data' + output_extension)
+        request_log = emulator.get_request_log()
+
+    expected = {(s, e): emulator.get_payload(s, e) for s in symbols for e in endpoints}
+    complete = [k for k, v in expected.items() if not is_empty(v) and ingested.get(k[0], {}).get(k[1]) == v]
+    latencies = sorted(seconds for _, _, seconds in request_log)
+
+    return {
+        'Workers': max_workers,
+        'Retries': max_retries,
+        'Requests': len(request_log),
+        'Errors': len([status for _, status, _ in request_log if status != 200]),
+        'Seconds': elapsed,
+        'Requests/s': len(request_log) / elapsed,
+        'p50 (ms)': 1000 * _percentile(latencies, 0.5),
+        'p95 (ms)': 1000 * _percentile(latencies, 0.95),
+        'p99 (ms)': 1000 * _percentile(latencies, 0.99),
+        'Complete': len(complete) / float(len([v for v in expected.values() if not is_empty(v)]) or 1)
+    }
+
+
+def print_load_test_results(results):
+    # One row per load test run
+    print(tabulate([[round(v, 3) if isinstance(v, float) else v for v in r.values()] for r in results],
+                   headers=list(results[0].keys())))
+
+
+def _percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    if len(sorted_values) == 0:
+        return 0.0
+    return sorted_values[max(int(math.ceil(fraction * len(sorted_values))) - 1, 0)]
+
+
+if __name__ == '__main__':
+    # Sweep concurrency and retries under 50-150ms latency, 5% rate limiting, 2% server errors and 2% truncation
+    faults = dict(latency=0.05, latency_jitter=0.1, rate_limit_rate=0.05, server_error_rate=0.02,
+                  truncation_rate=0.02, retry_after=0)
+    print_load_test_results([
+        load_test_ingestion(fault_profile=FaultProfile(seed=0, **faults), max_workers=w, max_retries=r)
+        for w in [1, 4, 16] for r in [0, 3]
+    ])
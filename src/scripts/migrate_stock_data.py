@@ -1,44 +1,47 @@
-import json
-from os.path import join
-
-from src.db import database
+from src.db import SYMBOL_QUERY_BATCH_SIZE, database
 from src.db.entities.stock import StockData
 from src.definitions.config import PROCESSED_DATA_DIR
 from src.utils.data_utils import compact_object, deep_get
+from src.utils.snapshot_utils import diff_stock_data, load_stock_data
+
+
+def migrate_stock_data(stock_data_file='stock_data_master.json', previous_file=None):
+    # Writes stock data rows; given the previously migrated file, only symbols added or modified since are written
+    stock_data = load_stock_data(PROCESSED_DATA_DIR, stock_data_file)
+    if previous_file is None:
+        symbols = sorted(stock_data.keys())
+    else:
+        changeset = diff_stock_data(PROCESSED_DATA_DIR, previous_file, stock_data_file)
+        print('Changes since %s: %s' % (previous_file, changeset))
+        symbols = changeset.get_changed_symbols()
+
+    session = database.create_session()
+    existing_rows = set()
+    for i in range(0, len(symbols), SYMBOL_QUERY_BATCH_SIZE):
+        batch = symbols[i:i + SYMBOL_QUERY_BATCH_SIZE]
+        existing_rows.update([r.symbol for r in session.query(StockData.symbol).filter(StockData.symbol.in_(batch))])
+    for symbol in symbols:
+        row = _stock_data_row(symbol, stock_data[symbol])
+        if symbol in existing_rows:
+            session.query(StockData).filter(StockData.symbol == symbol).update(row, synchronize_session=False)
+            session.commit()
+        else:
+            session.guarded_add(StockData(**row))
+        session = database.recreate_session_contingent(session)
 
 
-def migrate_stock_data():
-    mj_file = join(PROCESSED_DATA_DIR, 'stock_data_master.json')
-    ks_file = join(PROCESSED_DATA_DIR, '20210201_partials_stock_data.json')
-
-    with open(mj_file, 'r') as mjf, open(ks_file, 'r') as ksf:
-        master_json = json.load(mjf)
-        ks_json = json.load(ksf)
-        symbols = set(master_json.keys()).union(set(ks_json.keys()))
-
-        session = database.create_session()
-        existing_rows = set([r.symbol for r in session.query(StockData).all()])
-        for symbol in symbols:
-            if symbol in existing_rows:
-                continue
-
-            price = deep_get(master_json, [symbol, 'PRICE'])
-            key_stats = deep_get(ks_json, [symbol, 'KEY_STATS'])
-            advanced_stats = deep_get(master_json, [symbol, 'ADVANCED_STATS'])
-            cash_flow = deep_get(master_json, [symbol, 'CASH_FLOW', 'cashflow'], [])
-
-            row = compact_object(
-                {
-                    'symbol': symbol,
-                    'price': price,
-                    'key_stats': key_stats,
-                    'advanced_stats': advanced_stats,
-                    'cash_flow': None if len(cash_flow) == 0 else cash_flow[0]
-
-                }
-            )
-            session.guarded_add(StockData(**row))
-            session = database.recreate_session_contingent(session)
+def _stock_data_row(symbol, symbol_data):
+    cash_flow = deep_get(symbol_data, ['CASH_FLOW', 'cashflow'], [])
+
+    return compact_object(
+        {
+            'symbol': symbol,
+            'price': deep_get(symbol_data, ['PRICE']),
+            'key_stats': deep_get(symbol_data, ['KEY_STATS']),
+            'advanced_stats': deep_get(symbol_data, ['ADVANCED_STATS']),
+            'cash_flow': None if len(cash_flow) == 0 else cash_flow[0]
+        }
+    )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,48 @@
+from datetime import date
+
+from src.db import database
+from src.db.entities.stock_history import StockDataHistory
+from src.db.stock_history import get_history_metrics
+from src.definitions.config import PROCESSED_DATA_DIR
+from src.utils.data_utils import deep_get
+from src.utils.snapshot_utils import iter_stock_data
+
+
+# Rows inserted per statement
+HISTORY_INSERT_BATCH_SIZE = 1000
+
+
+def migrate_stock_data_history(stock_data_file='stock_data_master.json', as_of_date=None):
+    # Bulk inserts a day's stock data into the history table in one transaction; re-migrating a day replaces all of
+    # that day's rows
+    as_of_date = as_of_date or date.today()
+    table = StockDataHistory.__table__
+
+    with database.get_engine().begin() as connection:
+        connection.execute(table.delete().where(table.c.as_of_date == as_of_date))
+
+        rows = []
+        for symbol, symbol_data in iter_stock_data(PROCESSED_DATA_DIR, stock_data_file):
+            rows.append(_stock_data_history_row(symbol, symbol_data, as_of_date))
+            if len(rows) == HISTORY_INSERT_BATCH_SIZE:
+                connection.execute(table.insert(), rows)
+                rows = []
+        if len(rows) > 0:
+            connection.execute(table.insert(), rows)
+
+
+def _stock_data_history_row(symbol, symbol_data, as_of_date):
+    # Every row has every column, as executemany requires
+    cash_flow = deep_get(symbol_data, ['CASH_FLOW', 'cashflow'], [])
+
+    return dict({
+        'symbol': symbol,
+        'as_of_date': as_of_date,
+        'key_stats': deep_get(symbol_data, ['KEY_STATS']),
+        'advanced_stats': deep_get(symbol_data, ['ADVANCED_STATS']),
+        'cash_flow': None if len(cash_flow) == 0 else cash_flow[0]
+    }, **get_history_metrics(symbol_data))
+
+
+if __name__ == '__main__':
+    migrate_stock_data_history()
@@ -0,0 +1,23 @@
+import asyncio
+
+from src.analysis.superstar_momentum import SuperstarMomentum
+from src.api.quote_poller import QuotePoller
+from src.api.stock_data_api import IEXCloudAPI
+
+
+def poll_quotes(strategy, is_prod=True, interval=60, num_polls=None, num_printed=25):
+    # Keeps the strategy's ranking current with intraday prices, re-printing it whenever prices move
+    strategy.rank_stocks()
+
+    def on_update(moved_prices):
+        strategy.update_prices(moved_prices)
+        strategy.create_ranking_table()
+        print('%d prices moved' % len(moved_prices))
+        strategy.print_ranking(num_printed)
+
+    poller = QuotePoller(IEXCloudAPI(is_prod), strategy.get_symbols(), interval, on_update=on_update)
+    asyncio.run(poller.run(num_polls))
+
+
+if __name__ == '__main__':
+    poll_quotes(SuperstarMomentum())
@@ -0,0 +1,47 @@
+from tabulate import tabulate
+
+from src.analysis.online_ranking import OnlineRanker
+from src.api.stock_data_api import IEXCloudAPI
+from src.utils.universe_utils import SymbolUniverse
+
+
+def rank_during_ingestion(is_prod=True, symbols=None, num_printed=25, print_every=10, ranker=None):
+    """ Ingests stock data, printing a provisional Trending Value composite ranking (with error bounds) as partials are
+    saved and the exact ranking once ingestion completes.
+
+    :param is_prod: whether to ingest from the production IEX Cloud API.
+    :param symbols: (optional) symbols to ingest (defaults to all ticker symbols).
+    :param num_printed: number of stocks to print.
+    :param print_every: number of partials between provisional rankings.
+    :param ranker: (optional) OnlineRanker to rank with (defaults to Trending Value's Value Composite).
+    :return: the OnlineRanker.
+    """
+
+    universe = SymbolUniverse.load()
+    ranker = ranker or OnlineRanker(universe=universe)
+    num_partials = [0]
+
+    def on_partial(stock_data):
+        ranker.add(stock_data)
+        num_partials[0] += 1
+        if num_partials[0] % print_every == 0:
+            print_provisional_ranking(ranker, num_printed)
+
+    IEXCloudAPI(is_prod).update_stock_data(symbols, universe=universe, on_partial=on_partial)
+
+    print(tabulate([[i + 1, symbol, round(composite, 2)]
+                    for i, (symbol, composite) in enumerate(ranker.get_exact_top(num_printed))],
+                   headers=['Rank', 'Symbol', 'Value Composite']))
+    return ranker
+
+
+def print_provisional_ranking(ranker, num_printed=25):
+    # Provisional ranking of the stocks ingested so far; certain stocks can't drop out of the top num_printed
+    print('Provisional ranking of %d stocks:' % len(ranker.factor_values))
+    print(tabulate([[i + 1, symbol, round(composite, 2), round(error, 2), 'Yes' if is_certain else 'No']
+                    for i, (symbol, composite, error, is_certain) in enumerate(ranker.get_top(num_printed))],
+                   headers=['Rank', 'Symbol', 'Value Composite', '+/-', 'Certain']))
+
+
+if __name__ == '__main__':
+    rank_during_ingestion()
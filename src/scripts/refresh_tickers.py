@@ -1,13 +1,19 @@
 import json
 
 from src.api.stock_data_api import IEXCloudAPI
-from src.definitions.config import TICKER_DETAILS, TICKER_SYMBOLS
+from src.definitions.config import RAW_DATA_DIR, TICKER_DETAILS, TICKER_SYMBOLS
+from src.utils.file_utils import load_json
+from src.utils.universe_utils import ELIGIBLE_SYMBOL_TYPES, SYMBOL_HEALTH_FILE, SymbolUniverse
 
 
 def refresh_tickers():
     api = IEXCloudAPI(False)
-    ticker_data = list(filter(lambda j: j['type'] == 'cs', api.get_symbols()))
-    symbol_string = '\n'.join([t['symbol'] for t in ticker_data])
+    ticker_data = list(filter(lambda j: j['type'] in ELIGIBLE_SYMBOL_TYPES, api.get_symbols()))
+
+    # De-duplicate share classes/listings and drop filtered and dead (repeatedly empty) symbols
+    universe = SymbolUniverse(ticker_data, load_json(RAW_DATA_DIR, SYMBOL_HEALTH_FILE))
+    symbols = universe.get_symbols()
+    symbol_string = '\n'.join(symbols)
 
     with open(TICKER_DETAILS, 'w') as jf:
         json.dump(ticker_data, jf, indent=2)
@@ -15,12 +21,8 @@ def refresh_tickers():
     with open(TICKER_SYMBOLS, 'w') as tf:
         tf.write(symbol_string)
 
-    """
-    Symbol filtering
-    
-    - De-duplicate (e.g. stock splits, stock categories)
-    - Remove bankrupt and delisted stocks
-    """
+    print('Wrote %d of %d symbols (%d duplicate listings collapsed)' % (
+        len(symbols), len(ticker_data), len(universe.duplicates)))
 
 
 if __name__ == '__main__':
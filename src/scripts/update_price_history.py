@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from src.analysis.price_history import PriceHistoryStore, RollingMomentumEngine, append_snapshot_prices, \
+    parse_historical_data
+from src.api.stock_data_api import FinancialContentAPI
+from src.utils.file_utils import load_stock_symbols
+
+
+def backfill_price_history(symbols=None, num_months=12):
+    # Seeds the store with daily closes from Financial Content's historical data
+    api = FinancialContentAPI()
+    store = PriceHistoryStore()
+    today = datetime.today()
+    symbol_queue = symbols or load_stock_symbols()
+    n = len(symbol_queue)
+
+    for i, symbol in enumerate(symbol_queue):
+        historical_csv = api.get_historical_data(symbol, str(today.year), str(today.month), str(num_months))
+        appended = store.append(symbol, parse_historical_data(historical_csv))
+        print('Appended %d prices for %s (%d of %d)' % (appended, symbol, i + 1, n))
+
+    momentum_engine = RollingMomentumEngine.load(store)
+    momentum_engine.update()
+    momentum_engine.save()
+
+
+def append_daily_prices(stock_data_file, as_of_date=None):
+    # Appends a daily snapshot's prices and folds them into the rolling factor state
+    store = PriceHistoryStore()
+    appended = append_snapshot_prices(store, stock_data_file, as_of_date or datetime.today().date())
+    print('Appended %d prices from %s' % (appended, stock_data_file))
+
+    momentum_engine = RollingMomentumEngine.load(store)
+    momentum_engine.update()
+    momentum_engine.save()
+
+
+if __name__ == '__main__':
+    backfill_price_history()
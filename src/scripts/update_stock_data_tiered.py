@@ -0,0 +1,16 @@
+from src.analysis.superstar_momentum import SuperstarMomentum
+from src.analysis.trending_value import TrendingValue
+from src.api.stock_data_api import IEXCloudAPI
+
+
+# Strategies whose eligibility predicates symbols are screened against
+TIERED_STRATEGIES = [TrendingValue, SuperstarMomentum]
+
+
+def update_stock_data_tiered(is_prod):
+    api = IEXCloudAPI(is_prod)
+    api.update_stock_data_tiered(TIERED_STRATEGIES)
+
+
+if __name__ == '__main__':
+    update_stock_data_tiered(True)
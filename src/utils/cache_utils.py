@@ -0,0 +1,137 @@
+import pickle
+import time
+from hashlib import blake2b
+from os import remove, stat
+from os.path import exists, join
+
+from src.definitions.config import PROCESSED_DATA_DIR
+from src.utils.file_utils import JOURNAL_SUFFIX, STREAM_CHUNK_SIZE, atomic_write, create_directory, load_json, \
+    save_json, update_json
+from src.utils.snapshot_utils import HASH_DIGEST_SIZE, hash_payload, load_stock_data_hashes
+
+
+RANKING_CACHE_DIR = join(PROCESSED_DATA_DIR, 'ranking_cache')
+CACHE_INDEX_FILE = 'cache_index.json'
+CONTENT_HASHES_FILE = 'content_hashes.json'
+CACHE_ENTRY_EXTENSION = '.pickle'
+DEFAULT_MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+# The index is read on every lookup, so its journal is compacted as soon as it outgrows this and the base index (rather
+# than at MIN_COMPACTION_BYTES), bounding each lookup by the number of cache entries instead of the number of hits
+INDEX_MIN_COMPACTION_BYTES = 16 * 1024
+
+
+class RankingCache:
+    """ Size-bounded on-disk cache of ranking results with least-recently-used eviction. Each entry is pickled to its
+    own file; entry sizes and last use times are kept in a journaled index, so a hit only appends one index record
+    (the journal is compacted whenever it outgrows the index itself, so lookups don't slow down with use). """
+
+    def __init__(self, directory=RANKING_CACHE_DIR, max_bytes=DEFAULT_MAX_CACHE_BYTES):
+        """ Constructor.
+
+        :param directory: directory holding the cache entries and index.
+        :param max_bytes: maximum total size of the cache entries.
+        """
+
+        create_directory(directory)
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def get(self, key):
+        """ :returns: the value cached under the key (None on a miss), marking it as recently used. """
+
+        entry = self._load_index().get(key)
+        if entry is None or not exists(self._path(key)):
+            return None
+
+        with open(self._path(key), 'rb') as r:
+            value = pickle.load(r)
+
+        update_json(self.directory, CACHE_INDEX_FILE, {key: [entry[0], time.time()]}, indent=None,
+                    min_compaction_bytes=INDEX_MIN_COMPACTION_BYTES)
+        return value
+
+    def put(self, key, value):
+        """ Caches the value under the key, evicting least recently used entries to stay within max_bytes.
+
+        :param key: cache key (e.g. a content hash).
+        :param value: picklable value.
+        """
+
+        content = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(content) > self.max_bytes:
+            return
+
+        atomic_write(self._path(key), content, 'wb')
+        index = self._load_index()
+        index[key] = [len(content), time.time()]
+        index_updates = {key: index[key]}
+
+        total_bytes = sum(size for size, _ in index.values())
+        for evicted_key in sorted(index.keys(), key=lambda k: index[k][1]):
+            if total_bytes <= self.max_bytes:
+                break
+            if evicted_key == key:
+                continue
+            total_bytes -= index[evicted_key][0]
+            index_updates[evicted_key] = None
+            if exists(self._path(evicted_key)):
+                remove(self._path(evicted_key))
+
+        update_json(self.directory, CACHE_INDEX_FILE, index_updates, indent=None,
+                    min_compaction_bytes=INDEX_MIN_COMPACTION_BYTES)
+
+    def clear(self):
+        for key in self._load_index().keys():
+            if exists(self._path(key)):
+                remove(self._path(key))
+
+        save_json(self.directory, CACHE_INDEX_FILE, {}, indent=None)
+
+    def get_file_hash(self, file_path):
+        """ :returns: content hash of a file (and its journal), memoized by their sizes and modification times. """
+        return self._memoize_content_hash(file_path, lambda: _hash_file(file_path))
+
+    def get_stock_data_hash(self, input_dir, file_name):
+        """ :returns: content hash of a stock data file, derived from its per-symbol, per-endpoint content hashes. """
+
+        return self._memoize_content_hash(join(input_dir, file_name),
+                                          lambda: hash_payload(load_stock_data_hashes(input_dir, file_name)))
+
+    def _load_index(self):
+        # Evicted entries are recorded as None in the journal
+        return {k: v for k, v in load_json(self.directory, CACHE_INDEX_FILE).items() if v is not None}
+
+    def _memoize_content_hash(self, file_path, compute_hash):
+        signature = _file_signature(file_path)
+        memo = load_json(self.directory, CONTENT_HASHES_FILE).get(file_path)
+        if memo is not None and memo[0] == signature:
+            return memo[1]
+
+        content_hash = compute_hash()
+        update_json(self.directory, CONTENT_HASHES_FILE, {file_path: [signature, content_hash]}, indent=None)
+        return content_hash
+
+    def _path(self, key):
+        return join(self.directory, key + CACHE_ENTRY_EXTENSION)
+
+
+def _file_signature(file_path):
+    # Sizes and modification times of the file and its journal (None where missing)
+    signature = []
+    for path in [file_path, file_path + JOURNAL_SUFFIX]:
+        signature.append([stat(path).st_size, stat(path).st_mtime_ns] if exists(path) else None)
+
+    return signature
+
+
+def _hash_file(file_path):
+    file_hash = blake2b(digest_size=HASH_DIGEST_SIZE)
+    for path in [file_path, file_path + JOURNAL_SUFFIX]:
+        if not exists(path):
+            continue
+        with open(path, 'rb') as r:
+            for chunk in iter(lambda: r.read(STREAM_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+
+    return file_hash.hexdigest()
@@ -4,7 +4,8 @@ from os import listdir
 from os.path import basename, join
 from statistics import median
 
-from src.utils.file_utils import save_json
+from src.utils.snapshot_utils import COMPRESSED_SNAPSHOT_EXTENSION, SNAPSHOT_EXTENSION, copy_stock_data, \
+    diff_stock_data, is_snapshot, load_stock_data, load_stock_data_symbols, save_stock_data, update_stock_data_records
 
 
 CONFIG = json.load(open('config.json', 'r'))
@@ -25,9 +26,14 @@ def deep_get(nested_object, path, default=None):
     if n == 0:
         return default
 
+    # Integer path elements index into lists (e.g. ['CASH_FLOW', 'cashflow', 0, 'cashFlow'])
     value = nested_object
     for i in range(n):
-        value = value.get(path[i], None)
+        key = path[i]
+        if isinstance(value, list):
+            value = value[key] if isinstance(key, int) and -len(value) <= key < len(value) else None
+        else:
+            value = value.get(key, None) if isinstance(value, dict) else None
         if value is None:
             return default
 
@@ -46,31 +52,106 @@ def merge_dictionaries(dicts):
     return reduce(update_and_return, [{}] + dicts)
 
 
-def merge_stock_data_partials(input_dir, output_suffix='_stock_data.json'):
-    partial_files = [f for f in filter(lambda j: j.endswith('.json'), listdir(input_dir))]
+def merge_stock_data_partials(input_dir, output_suffix='_stock_data.json', output_dir=PROCESSED_DATA_DIR):
+    # Partials may be JSON files or snapshots; the output format follows the suffix's extension
+    partial_files = [f for f in filter(lambda j: j.endswith('.json') or is_snapshot(j), listdir(input_dir))]
     merged_data = {}
 
+    # Merge per endpoint, so partials covering different endpoints of the same symbol (e.g. tiered ingestion's
+    # screening pass) combine rather than overwrite each other
     for pf in partial_files:
-        partial_json = json.load(open(join(input_dir, pf), 'r'))
-        merged_data.update(partial_json)
-
-    save_json(PROCESSED_DATA_DIR, basename(input_dir) + output_suffix, merged_data, True)
-
+        partial_json = load_stock_data(input_dir, pf)
+        for symbol, symbol_data in partial_json.items():
+            merged_data.setdefault(symbol, {}).update(symbol_data)
+
+    save_stock_data(output_dir, basename(input_dir) + output_suffix, merged_data, True)
+
+
+def merge_stock_data_to_master(source_file, master_file='stock_data_master.json', output_file=None):
+    """ Merges the source's endpoint payloads into the master's symbols (symbols missing from the master are skipped).
+    Only payloads whose content hashes differ are read and merged. A JSON master (or its byte-for-byte copy, when the
+    output is another file of the same format) gets just the changed records appended to its journal; snapshots have no
+    journal, so they are rewritten.
+
+    :param source_file: JSON or snapshot file to merge from.
+    :param master_file: JSON or snapshot master file.
+    :param output_file: (optional) file to save the merged master to (defaults to the master file name + _updated).
+    :return: StockDataChangeset from the master to the source.
+    """
+
+    changeset = diff_stock_data(PROCESSED_DATA_DIR, master_file, source_file)
+    source_records = load_stock_data_symbols(PROCESSED_DATA_DIR, source_file, changeset.modified.keys())
+    master_records = load_stock_data_symbols(PROCESSED_DATA_DIR, master_file, changeset.modified.keys())
+
+    updated_records = {}
+    for symbol, endpoints in changeset.modified.items():
+        source_endpoints = [e for e in endpoints if e in source_records[symbol]]
+        if len(source_endpoints) > 0:
+            master_records[symbol].update({e: source_records[symbol][e] for e in source_endpoints})
+            updated_records[symbol] = master_records[symbol]
+
+    output_file = output_file or _updated_file_name(master_file)
+    if _split_extension(output_file)[1] != _split_extension(master_file)[1]:
+        # Converting between formats rewrites the whole master
+        master_json = load_stock_data(PROCESSED_DATA_DIR, master_file)
+        master_json.update(updated_records)
+        save_stock_data(PROCESSED_DATA_DIR, output_file, master_json, sort_keys=True)
+        return changeset
+
+    if output_file != master_file:
+        copy_stock_data(PROCESSED_DATA_DIR, master_file, output_file)
+    update_stock_data_records(PROCESSED_DATA_DIR, output_file, updated_records)
+
+    return changeset
+
+
+def project(nested_object, paths):
+    """ Copies only the values at the given paths (as passed to deep_get) into a new nested object.
+
+    :param nested_object: object to project.
+    :param paths: list of paths to keep.
+    :return: projected object.
+    """
+
+    projection = {}
+    for path in paths:
+        value = deep_get(nested_object, path)
+        if value is None:
+            continue
 
-def merge_stock_data_to_master(source_file):
-    source_json = json.load(open(join(PROCESSED_DATA_DIR, source_file), 'r'))
-    master_json = json.load(open(join(PROCESSED_DATA_DIR, 'stock_data_master.json'), 'r'))
+        target = projection
+        for key, next_key in zip(path[:-1], path[1:]):
+            empty_container = [] if isinstance(next_key, int) else {}
+            if isinstance(target, list):
+                target.extend([None] * (key + 1 - len(target)))
+                target[key] = target[key] if target[key] is not None else empty_container
+                target = target[key]
+            else:
+                target = target.setdefault(key, empty_container)
 
-    for symbol, symbol_data in source_json.items():
-        if symbol not in master_json:
-            continue
-        for stat_name, stat_value in symbol_data.items():
-            master_json[symbol][stat_name] = stat_value
+        if isinstance(target, list):
+            target.extend([None] * (path[-1] + 1 - len(target)))
+        target[path[-1]] = value
 
-    save_json(PROCESSED_DATA_DIR, 'stock_data_master_updated.json', master_json, sort_keys=True)
+    return projection
 
 
 def pad_with_median(numbers, n):
     diff = n - len(numbers)
     med = median(numbers)
     return numbers + [med] * diff
+
+
+def _split_extension(file_name):
+    # e.g. stock_data_master.jsonl.gz -> (stock_data_master, .jsonl.gz)
+    for extension in [COMPRESSED_SNAPSHOT_EXTENSION, SNAPSHOT_EXTENSION, '.json']:
+        if file_name.endswith(extension):
+            return file_name[:-len(extension)], extension
+
+    return file_name, ''
+
+
+def _updated_file_name(file_name):
+    # e.g. stock_data_master.json -> stock_data_master_updated.json
+    stem, extension = _split_extension(file_name)
+    return stem + '_updated' + extension
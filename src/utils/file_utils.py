@@ -1,10 +1,21 @@
 import json
-from os import makedirs
-from os.path import exists, join
+from os import fdopen, fsync, makedirs, remove, replace
+from os.path import basename, dirname, exists, getsize, join
+from tempfile import mkstemp
 
 from src.definitions.config import TICKER_SYMBOLS
 
 
+# Suffix of the JSON Lines journal that backs append-mode JSON writes (kept distinct from the .jsonl snapshot extension)
+JOURNAL_SUFFIX = '.journal'
+
+# Size of the chunks read when streaming a JSON file
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Journals are compacted into their base file once they grow past this size (or the base file's size, if larger)
+MIN_COMPACTION_BYTES = 16 * 1024 * 1024
+
+
 def touch(file_name):
     open(file_name, 'a').close()
 
@@ -14,9 +25,34 @@ def create_directory(directory_name):
         makedirs(directory_name)
 
 
+def atomic_write(file_path, content, mode='w'):
+    """ Writes content to a temp file in the target directory, then atomically renames it over the target path.
+
+    :param file_path: path of the file to write.
+    :param content: string (or bytes, if mode is 'wb') to write.
+    :param mode: file mode to write with.
+    """
+
+    fd, temp_path = mkstemp(dir=dirname(file_path) or '.', prefix='.' + basename(file_path) + '.', suffix='.tmp')
+    try:
+        with fdopen(fd, mode) as w:
+            w.write(content)
+            w.flush()
+            fsync(w.fileno())
+        replace(temp_path, file_path)
+    except BaseException:
+        if exists(temp_path):
+            remove(temp_path)
+        raise
+
+
 def save_file(output_dir, file_name, content, mode='w'):
-    with open(join(output_dir, file_name), mode) as w:
-        w.write(content)
+    if mode == 'a':
+        with open(join(output_dir, file_name), mode) as w:
+            w.write(content)
+        return
+
+    atomic_write(join(output_dir, file_name), content, mode)
 
 
 def update_file(output_dir, file_name, content):
@@ -24,18 +60,206 @@ def update_file(output_dir, file_name, content):
 
 
 def save_json(output_dir, file_name, content, sort_keys=False, indent=2, mode='w'):
+    if mode == 'a':
+        update_json(output_dir, file_name, content, sort_keys)
+        return
+
+    # A full write supersedes anything still sitting in the journal
+    journal_path = join(output_dir, file_name + JOURNAL_SUFFIX)
+    if exists(journal_path):
+        remove(journal_path)
+
+    atomic_write(join(output_dir, file_name), json.dumps(content, sort_keys=sort_keys, indent=indent))
+
+
+def update_json(output_dir, file_name, content, sort_keys=False, indent=2, min_compaction_bytes=MIN_COMPACTION_BYTES):
+    """ Appends content to the JSON file's journal as a single JSON Lines record. Later records take precedence over
+    earlier ones (and over the base file) when read back with load_json.
+
+    :param output_dir: directory containing the JSON file.
+    :param file_name: name of the JSON file.
+    :param content: dictionary to merge into the file's contents.
+    :param sort_keys: whether to sort keys when compacting.
+    :param indent: indentation to use when compacting.
+    :param min_compaction_bytes: journal size below which the journal is never compacted (it is compacted once it
+    outgrows both this and the base file).
+    """
+
+    journal_path = join(output_dir, file_name + JOURNAL_SUFFIX)
+    with open(journal_path, 'a') as w:
+        # Terminate any partial record left by an interrupted append so it can't corrupt this one
+        prefix = '\n' if _has_partial_record(journal_path) else ''
+        w.write(prefix + json.dumps(content, sort_keys=sort_keys) + '\n')
+
     json_path = join(output_dir, file_name)
-    touch(json_path)
-    with open(json_path, 'r+') as w:
-        previous_content = {} if mode != 'a' else json.load(w)
-        content.update(previous_content)
-        json.dump(content, w, sort_keys=sort_keys, indent=indent)
+    base_size = getsize(json_path) if exists(json_path) else 0
+    if getsize(journal_path) > max(base_size, min_compaction_bytes):
+        compact_json(output_dir, file_name, sort_keys, indent)
+
+
+def load_json(input_dir, file_name):
+    """ Loads a JSON file, merging in any records appended to its journal.
+
+    :param input_dir: directory containing the JSON file.
+    :param file_name: name of the JSON file.
+    :return: merged dictionary view of the file.
+    """
+
+    json_path = join(input_dir, file_name)
+    content = {}
+    if exists(json_path):
+        with open(json_path, 'r') as r:
+            content = json.load(r)
+
+    for record in _read_journal(join(input_dir, file_name + JOURNAL_SUFFIX)):
+        content.update(record)
+
+    return content
+
+
+def iter_json(input_dir, file_name, chunk_size=STREAM_CHUNK_SIZE):
+    """ Streams the (key, value) pairs of a JSON file's top-level object, parsing one value at a time so that only
+    a single value (plus any journal records) is held in memory.
+
+    :param input_dir: directory containing the JSON file.
+    :param file_name: name of the JSON file.
+    :param chunk_size: number of characters to read at a time.
+    """
+
+    journal_content = {}
+    for record in _read_journal(join(input_dir, file_name + JOURNAL_SUFFIX)):
+        journal_content.update(record)
+
+    json_path = join(input_dir, file_name)
+    if exists(json_path):
+        with open(json_path, 'r') as r:
+            for key, value in _JSONObjectStream(r, chunk_size).items():
+                yield key, journal_content.pop(key, value)
 
+    for key, value in journal_content.items():
+        yield key, value
 
-def update_json(output_dir, file_name, content, sort_keys=False, indent=2):
-    save_json(output_dir, file_name, content, sort_keys, indent, 'a')
+
+def compact_json(output_dir, file_name, sort_keys=False, indent=2):
+    """ Folds the JSON file's journal into the base file and removes the journal.
+
+    :param output_dir: directory containing the JSON file.
+    :param file_name: name of the JSON file.
+    :param sort_keys: whether to sort keys in the compacted file.
+    :param indent: indentation to use in the compacted file.
+    """
+
+    journal_path = join(output_dir, file_name + JOURNAL_SUFFIX)
+    if not exists(journal_path):
+        return
+
+    content = load_json(output_dir, file_name)
+    atomic_write(join(output_dir, file_name), json.dumps(content, sort_keys=sort_keys, indent=indent))
+
+    # Replaying the journal over the compacted file is idempotent, so a crash before this point loses nothing
+    remove(journal_path)
 
 
 def load_stock_symbols():
     with open(TICKER_SYMBOLS, 'r') as tf:
         return [s.strip() for s in tf.readlines()]
+
+
+def _has_partial_record(journal_path):
+    if getsize(journal_path) == 0:
+        return False
+
+    with open(journal_path, 'rb') as r:
+        r.seek(-1, 2)
+        return r.read(1) != b'\n'
+
+
+def _read_journal(journal_path):
+    # Yields journal records, skipping any torn line left behind by an interrupted append
+    if not exists(journal_path):
+        return
+
+    with open(journal_path, 'r') as r:
+        for line in r:
+            if line.strip() == '':
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+class _JSONObjectStream:
+    """ Incremental parser for a JSON file whose top level is an object. """
+
+    WHITESPACE = ' \t\r\n'
+    NUMBER_CHARACTERS = '0123456789+-.eE'
+
+    def __init__(self, reader, chunk_size):
+        self.reader = reader
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def items(self):
+        self._expect('{')
+        if self._peek() == '}':
+            return
+
+        while True:
+            key = self._decode()
+            self._expect(':')
+            value = self._decode()
+            yield key, value
+
+            if self._expect(',}') == '}':
+                return
+
+    def _decode(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+
+                # A number may continue in the next chunk (e.g. '-12' of '-12.5e3'), so a value is only complete once
+                # something other than a number character follows it
+                is_complete = end < len(self.buffer) and self.buffer[end] not in self.NUMBER_CHARACTERS
+                if is_complete or not self._read_chunk():
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if not self._read_chunk():
+                    raise
+
+    def _expect(self, characters):
+        character = self._peek()
+        if character is None or character not in characters:
+            raise ValueError('Expected one of "%s" at offset %d, found %s' % (characters, self.position, character))
+
+        self.position += 1
+        return character
+
+    def _peek(self):
+        # Skips whitespace and returns the next character (None at end of file)
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in self.WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._read_chunk():
+                return None
+
+    def _read_chunk(self):
+        if self.eof:
+            return False
+
+        chunk = self.reader.read(self.chunk_size)
+        if chunk == '':
+            self.eof = True
+            return False
+
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
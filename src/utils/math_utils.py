@@ -1,5 +1,9 @@
 import math
 import sys
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+from statistics import median
 
 
 MAX_VALUE = sys.maxsize
@@ -33,3 +37,90 @@ def is_close_to_zero(num):
     :return: True if input number close to 0, else False.
     """
     return abs(num) < ZERO_CUTOFF
+
+
+def calculate_percentiles(metric_values, reverse=False, pad_missing=True, default=50.0):
+    """ Calculate every metric's percentile with a single sort. Equivalent to calling calculate_percentile for each
+    value against the sorted, median-padded list of values, but O(n log n) rather than O(n^2).
+
+    :param metric_values: list of metric values (None for missing values).
+    :param reverse: whether higher values are better (i.e. rank first).
+    :param pad_missing: whether to pad the distribution with the median of present values in place of missing ones.
+    :param default: the percentile assigned to missing values.
+    :return: list of percentiles, in the same order as the input values.
+    """
+    return calculate_grouped_percentiles(metric_values, None, reverse, pad_missing, default)
+
+
+def calculate_grouped_percentiles(metric_values, groups, reverse=False, pad_missing=True, default=50.0):
+    """ Calculate every metric's percentile within its group (e.g. sector), using a single sort by (group, value)
+    across all groups. Within each group, the result matches calculate_percentiles applied to that group alone.
+
+    :param metric_values: list of metric values (None for missing values).
+    :param groups: list of group keys, parallel to metric_values (None to treat all values as a single group).
+    :param reverse: whether higher values are better (i.e. rank first).
+    :param pad_missing: whether to pad each group's distribution with its median in place of missing values.
+    :param default: the percentile assigned to missing values.
+    :return: list of percentiles, in the same order as the input values.
+    """
+
+    group_ids = [0] * len(metric_values) if groups is None else index_groups(groups)
+    entries = sort_percentile_entries(metric_values, group_ids, reverse)
+    return calculate_sorted_percentiles(entries, group_ids, reverse, pad_missing, default)
+
+
+def sort_percentile_entries(metric_values, group_ids, reverse=False, offset=0):
+    """ Sorts the present metric values by (group, value), as calculate_grouped_percentiles does. The entries of
+    consecutive slices of a list of values (each sorted with its offset) concatenate and re-sort into exactly the
+    entries of the whole list, so slices can be sorted separately and their runs merged.
+
+    :param metric_values: list of metric values (None for missing values).
+    :param group_ids: list of integer group ids (see index_groups), parallel to metric_values.
+    :param reverse: whether higher values are better (i.e. rank first).
+    :param offset: index of the first metric value in the whole list.
+    :return: sorted list of (group id, signed value, index) entries.
+    """
+
+    # Negating values when higher is better lets one ascending sort order every group
+    sign = -1 if reverse else 1
+    return sorted((group_ids[i], sign * v, offset + i) for i, v in enumerate(metric_values) if v is not None)
+
+
+def calculate_sorted_percentiles(entries, group_ids, reverse=False, pad_missing=True, default=50.0):
+    """ Calculate every metric's percentile within its group from its sorted entries (see sort_percentile_entries).
+
+    :param entries: sorted list of (group id, signed value, index) entries of the present metric values.
+    :param group_ids: list of integer group ids, one per metric value (present or missing).
+    :param reverse: whether higher values are better (i.e. rank first).
+    :param pad_missing: whether to pad each group's distribution with its median in place of missing values.
+    :param default: the percentile assigned to missing values.
+    :return: list of percentiles, in the same order as the metric values.
+    """
+
+    group_sizes = Counter(group_ids)
+    sign = -1 if reverse else 1
+    percentiles = [default] * len(group_ids)
+    for group_id, group_entries in groupby(entries, itemgetter(0)):
+        # Missing values are padded with the group median, which ranks ahead of every value it's strictly better than
+        segment = list(group_entries)
+        group_size = group_sizes[group_id]
+        padding = group_size - len(segment) if pad_missing else 0
+        signed_median = sign * median([sign * e[1] for e in segment]) if padding > 0 else None
+
+        # Ties share the percentile of their first entry, so it's only computed once per distinct value
+        previous_value = percentile = None
+        for j, (_, signed_value, i) in enumerate(segment):
+            if percentile is None or signed_value != previous_value:
+                rank = j + (padding if signed_median is not None and signed_median < signed_value else 0)
+                percentile = 100.0 * rank / group_size
+                previous_value = signed_value
+            percentiles[i] = percentile
+
+    return percentiles
+
+
+def index_groups(groups):
+    """ :returns: sortable integer ids for arbitrary (possibly unorderable) group keys, parallel to the keys. """
+
+    ids = {}
+    return [ids.setdefault(g, len(ids)) for g in groups]
@@ -0,0 +1,113 @@
+from bisect import bisect_left
+
+
+DEFAULT_SKETCH_CAPACITY = 512
+
+
+class QuantileSketch:
+    """ Mergeable quantile sketch: a hierarchy of compactors (as in KLL), where level h holds values of weight 2^h. When
+    a level fills up it is sorted and every other value is promoted to the next level, alternating between odd and
+    even positions. Each compaction at level h moves any value's estimated rank by at most 2^h, so the sketch tracks a
+    deterministic worst-case rank error as it goes. """
+
+    def __init__(self, capacity=DEFAULT_SKETCH_CAPACITY):
+        """ Constructor.
+
+        :param capacity: number of values a level holds before it is compacted (larger is more accurate).
+        """
+
+        self.capacity = capacity
+        self.levels = [[]]
+        self.count = 0
+        self.max_rank_error = 0
+        self.num_compactions = 0
+
+        # Every retained value in sorted order, with the cumulative weight before each (and the total weight last),
+        # kept until values are added so ranks and quantiles cost one binary search
+        self.sorted_values = None
+        self.cumulative_weights = None
+
+    def add(self, value):
+        self.levels[0].append(value)
+        self.count += 1
+        self.sorted_values = None
+        if len(self.levels[0]) >= self.capacity:
+            self._compact()
+
+    def merge(self, other):
+        """ Merges another sketch (e.g. from a parallel ingestion worker) into this one. Error bounds add up. """
+
+        for h, level in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append([])
+            self.levels[h].extend(level)
+
+        self.count += other.count
+        self.max_rank_error += other.max_rank_error
+        self.num_compactions += other.num_compactions
+        self.sorted_values = None
+        self._compact()
+
+    def rank(self, value):
+        """ :returns: estimated number of added values strictly less than the given value (within max_rank_error). """
+
+        self._index()
+        return self.cumulative_weights[bisect_left(self.sorted_values, value)]
+
+    def quantile(self, fraction):
+        """ :returns: estimated value at the given fraction (0-1) of the distribution (None if the sketch is empty). """
+
+        self._index()
+        if len(self.sorted_values) == 0:
+            return None
+
+        # First value whose cumulative weight (including its own) reaches the target
+        i = bisect_left(self.cumulative_weights, fraction * self.count, 1)
+        return self.sorted_values[min(i, len(self.sorted_values)) - 1]
+
+    def to_dict(self):
+        return {
+            'capacity': self.capacity,
+            'levels': self.levels,
+            'count': self.count,
+            'max_rank_error': self.max_rank_error,
+            'num_compactions': self.num_compactions
+        }
+
+    @staticmethod
+    def from_dict(sketch_dict):
+        sketch = QuantileSketch(sketch_dict['capacity'])
+        sketch.levels = sketch_dict['levels']
+        sketch.count = sketch_dict['count']
+        sketch.max_rank_error = sketch_dict['max_rank_error']
+        sketch.num_compactions = sketch_dict['num_compactions']
+        return sketch
+
+    def _compact(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) >= self.capacity:
+                level.sort()
+
+                # Compact an even number of values, leaving any odd one out at this level so total weight is preserved
+                num_compacted = len(level) - len(level) % 2
+                promoted = level[self.num_compactions % 2:num_compacted:2]
+                self.levels[h] = level[num_compacted:]
+                if h + 1 == len(self.levels):
+                    self.levels.append([])
+                self.levels[h + 1].extend(promoted)
+
+                self.num_compactions += 1
+                self.max_rank_error += 1 << h
+            h += 1
+
+    def _index(self):
+        if self.sorted_values is not None:
+            return
+
+        weighted_values = sorted((v, 1 << h) for h, level in enumerate(self.levels) for v in level)
+        self.sorted_values = [v for v, _ in weighted_values]
+        self.cumulative_weights = [0]
+        for _, weight in weighted_values:
+            self.cumulative_weights.append(self.cumulative_weights[-1] + weight)
@@ -0,0 +1,410 @@
+import gzip
+import json
+import zlib
+from collections import defaultdict
+from hashlib import blake2b
+from os import remove
+from os.path import exists, getmtime, join
+from shutil import copyfile
+
+from src.utils.file_utils import JOURNAL_SUFFIX, STREAM_CHUNK_SIZE, atomic_write, iter_json, load_json, save_json, \
+    update_json
+
+
+SNAPSHOT_EXTENSION = '.jsonl'
+COMPRESSED_SNAPSHOT_EXTENSION = '.jsonl.gz'
+INDEX_SUFFIX = '.idx'
+HASHES_SUFFIX = '.hashes'
+
+# Bytes per content hash (hex-encoded in the hashes sidecar)
+HASH_DIGEST_SIZE = 8
+
+# Number of records per independently compressed gzip member; bounds the cost of a random-access read
+RECORDS_PER_BLOCK = 64
+
+
+def is_snapshot(file_name):
+    return file_name.endswith(SNAPSHOT_EXTENSION) or file_name.endswith(COMPRESSED_SNAPSHOT_EXTENSION)
+
+
+def is_compressed_snapshot(file_name):
+    return file_name.endswith(COMPRESSED_SNAPSHOT_EXTENSION)
+
+
+def snapshot_name(file_name, compress=True):
+    """ Derives a snapshot file name from a JSON file name (e.g. stock_data_master.json -> stock_data_master.jsonl.gz).
+
+    :param file_name: JSON file name.
+    :param compress: whether the snapshot is gzip-compressed.
+    :return: snapshot file name.
+    """
+
+    stem = file_name[:-len('.json')] if file_name.endswith('.json') else file_name
+    return stem + (COMPRESSED_SNAPSHOT_EXTENSION if compress else SNAPSHOT_EXTENSION)
+
+
+def write_snapshot(output_dir, file_name, stock_data, sort_keys=False):
+    """ Writes stock data as one {"symbol": ..., "data": ...} JSON record per line, along with sidecar offset index and
+    content hashes. Files ending in .jsonl.gz are written as a sequence of gzip members of RECORDS_PER_BLOCK records
+    each, which together form a valid gzip stream but can also be decompressed individually.
+
+    :param output_dir: output directory.
+    :param file_name: snapshot file name (.jsonl or .jsonl.gz).
+    :param stock_data: dictionary mapping symbols to stock data.
+    :param sort_keys: whether to write symbols (and payload keys) in sorted order.
+    """
+
+    symbols = sorted(stock_data.keys()) if sort_keys else list(stock_data.keys())
+    compress = is_compressed_snapshot(file_name)
+
+    chunks = []
+    index = {}
+    offset = 0
+
+    for block_start in range(0, len(symbols), RECORDS_PER_BLOCK if compress else 1):
+        block_symbols = symbols[block_start:block_start + (RECORDS_PER_BLOCK if compress else 1)]
+        lines = [_encode_record(s, stock_data[s], sort_keys) for s in block_symbols]
+        chunk = b''.join(lines)
+        if compress:
+            chunk = gzip.compress(chunk, mtime=0)
+
+        for line_number, symbol in enumerate(block_symbols):
+            index[symbol] = [offset, len(chunk), line_number]
+
+        chunks.append(chunk)
+        offset += len(chunk)
+
+    atomic_write(join(output_dir, file_name), b''.join(chunks), 'wb')
+    save_json(output_dir, file_name + INDEX_SUFFIX, index, indent=None)
+    save_json(output_dir, file_name + HASHES_SUFFIX, hash_stock_data(stock_data), indent=None)
+
+
+def iter_snapshot(input_dir, file_name):
+    """ Streams (symbol, stock data) pairs from a snapshot without loading the whole file.
+
+    :param input_dir: input directory.
+    :param file_name: snapshot file name.
+    """
+
+    opener = gzip.open if is_compressed_snapshot(file_name) else open
+    with opener(join(input_dir, file_name), 'rb') as r:
+        for line in r:
+            if line.strip() == b'':
+                continue
+            record = json.loads(line)
+            yield record['symbol'], record['data']
+
+
+def load_snapshot(input_dir, file_name):
+    return {symbol: data for symbol, data in iter_snapshot(input_dir, file_name)}
+
+
+def load_snapshot_index(input_dir, file_name):
+    """ Loads a snapshot's offset index. If the sidecar file is missing, it's rebuilt by scanning the snapshot's lines
+    (or gzip members) in a single streaming pass; the snapshot itself is never rewritten.
+
+    :param input_dir: input directory.
+    :param file_name: snapshot file name.
+    :return: dictionary mapping symbols to [block offset, block length, line within block].
+    """
+
+    if exists(join(input_dir, file_name + INDEX_SUFFIX)):
+        return load_json(input_dir, file_name + INDEX_SUFFIX)
+
+    index = {}
+    for offset, length, block in _iter_snapshot_blocks(input_dir, file_name):
+        for line_number, line in enumerate(block.splitlines()):
+            if line.strip() != b'':
+                index[json.loads(line)['symbol']] = [offset, length, line_number]
+
+    save_json(input_dir, file_name + INDEX_SUFFIX, index, indent=None)
+    return index
+
+
+def read_snapshot_symbol(input_dir, file_name, symbol, index=None):
+    """ Reads a single symbol's stock data from a snapshot by seeking to its indexed block.
+
+    :param input_dir: input directory.
+    :param file_name: snapshot file name.
+    :param symbol: symbol to read.
+    :param index: (optional) previously loaded offset index.
+    :return: the symbol's stock data, or None if the snapshot doesn't contain it.
+    """
+
+    entry = (index if index is not None else load_snapshot_index(input_dir, file_name)).get(symbol)
+    if entry is None:
+        return None
+
+    offset, length, line_number = entry
+    with open(join(input_dir, file_name), 'rb') as r:
+        lines = _read_snapshot_block(r, file_name, offset, length)
+
+    return json.loads(lines[line_number])['data']
+
+
+def load_stock_data(input_dir, file_name):
+    """ Loads stock data from either a JSON file or a snapshot.
+
+    :param input_dir: input directory.
+    :param file_name: JSON or snapshot file name.
+    :return: dictionary mapping symbols to stock data.
+    """
+
+    if is_snapshot(file_name):
+        return load_snapshot(input_dir, file_name)
+
+    return load_json(input_dir, file_name)
+
+
+def load_stock_data_symbols(input_dir, file_name, symbols):
+    """ Loads only the given symbols' stock data, reading just their indexed blocks from a snapshot or streaming a JSON
+    file one symbol at a time.
+
+    :param input_dir: input directory.
+    :param file_name: JSON or snapshot file name.
+    :param symbols: symbols to load.
+    :return: dictionary mapping the symbols the file contains to stock data.
+    """
+
+    symbols = set(symbols)
+    if len(symbols) == 0:
+        return {}
+
+    if is_snapshot(file_name):
+        # Each block is read and decompressed once, however many of the requested symbols it holds
+        index = load_snapshot_index(input_dir, file_name)
+        block_lines = defaultdict(list)
+        for symbol in symbols & index.keys():
+            offset, length, line_number = index[symbol]
+            block_lines[(offset, length)].append((symbol, line_number))
+
+        stock_data = {}
+        with open(join(input_dir, file_name), 'rb') as r:
+            for offset, length in sorted(block_lines):
+                lines = _read_snapshot_block(r, file_name, offset, length)
+                for symbol, line_number in block_lines[(offset, length)]:
+                    stock_data[symbol] = json.loads(lines[line_number])['data']
+
+        return {s: stock_data[s] for s in sorted(stock_data)}
+
+    return {symbol: data for symbol, data in iter_json(input_dir, file_name) if symbol in symbols}
+
+
+def iter_stock_data(input_dir, file_name):
+    """ Streams (symbol, stock data) pairs from either a JSON file or a snapshot, one symbol at a time.
+
+    :param input_dir: input directory.
+    :param file_name: JSON or snapshot file name.
+    """
+
+    if is_snapshot(file_name):
+        return iter_snapshot(input_dir, file_name)
+
+    return iter_json(input_dir, file_name)
+
+
+def save_stock_data(output_dir, file_name, stock_data, sort_keys=False):
+    """ Saves stock data as either a JSON file or a snapshot, depending on the file name's extension, along with its
+    content hashes.
+
+    :param output_dir: output directory.
+    :param file_name: JSON or snapshot file name.
+    :param stock_data: dictionary mapping symbols to stock data.
+    :param sort_keys: whether to sort keys.
+    """
+
+    if is_snapshot(file_name):
+        write_snapshot(output_dir, file_name, stock_data, sort_keys)
+    else:
+        save_json(output_dir, file_name, stock_data, sort_keys)
+        save_json(output_dir, file_name + HASHES_SUFFIX, hash_stock_data(stock_data), indent=None)
+
+
+def update_stock_data_records(output_dir, file_name, records):
+    """ Replaces the given symbols' stock data, writing only those records (and their content hashes) to the JSON
+    file's journal. Snapshots have no journal, so they are rewritten.
+
+    :param output_dir: output directory.
+    :param file_name: JSON or snapshot file name.
+    :param records: dictionary mapping symbols to their complete updated stock data.
+    """
+
+    if len(records) == 0:
+        return
+
+    if is_snapshot(file_name):
+        stock_data = load_snapshot(output_dir, file_name)
+        stock_data.update(records)
+        write_snapshot(output_dir, file_name, stock_data, True)
+    else:
+        update_json(output_dir, file_name, records)
+        update_json(output_dir, file_name + HASHES_SUFFIX, hash_stock_data(records), indent=None)
+
+
+def copy_stock_data(input_dir, file_name, output_file):
+    """ Copies a stock data file byte for byte, along with its journal and sidecars. Sidecars are copied after the file,
+    so they stay at least as new as it; any of the output's own that the source lacks are removed.
+
+    :param input_dir: directory containing the file (the copy is written alongside it).
+    :param file_name: JSON or snapshot file name.
+    :param output_file: file name to copy to (with the same extension).
+    """
+
+    for suffix in ['', JOURNAL_SUFFIX, INDEX_SUFFIX, HASHES_SUFFIX, HASHES_SUFFIX + JOURNAL_SUFFIX]:
+        source_path, output_path = join(input_dir, file_name + suffix), join(input_dir, output_file + suffix)
+        if exists(source_path):
+            copyfile(source_path, output_path)
+        elif exists(output_path):
+            remove(output_path)
+
+
+def hash_payload(payload):
+    """ :returns: hex digest of the payload's canonical (key-sorted, compact) JSON encoding. """
+
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return blake2b(encoded, digest_size=HASH_DIGEST_SIZE).hexdigest()
+
+
+def hash_stock_data(stock_data):
+    """ :returns: dictionary mapping symbols to dictionaries of content hashes by endpoint. """
+    return {symbol: {e: hash_payload(p) for e, p in symbol_data.items()} for symbol, symbol_data in stock_data.items()}
+
+
+def load_stock_data_hashes(input_dir, file_name):
+    """ Loads a stock data file's content hashes, recomputing them (with a single streaming pass over the file) if the
+    sidecar is missing or older than the file.
+
+    :param input_dir: input directory.
+    :param file_name: JSON or snapshot file name.
+    :return: dictionary mapping symbols to dictionaries of content hashes by endpoint.
+    """
+
+    hashes_file = file_name + HASHES_SUFFIX
+    if _last_modified(input_dir, hashes_file) >= _last_modified(input_dir, file_name):
+        return load_json(input_dir, hashes_file)
+
+    hashes = {symbol: hash_stock_data({symbol: d})[symbol] for symbol, d in iter_stock_data(input_dir, file_name)}
+    save_json(input_dir, hashes_file, hashes, indent=None)
+    return hashes
+
+
+def diff_stock_data(input_dir, old_file, new_file):
+    """ Compares two stock data files by their content hashes.
+
+    :param input_dir: directory containing both files.
+    :param old_file: earlier JSON or snapshot file name.
+    :param new_file: later JSON or snapshot file name.
+    :return: StockDataChangeset from the old file to the new one.
+    """
+
+    return StockDataChangeset.from_hashes(load_stock_data_hashes(input_dir, old_file),
+                                          load_stock_data_hashes(input_dir, new_file))
+
+
+class StockDataChangeset:
+    """ Symbols added, removed and modified between two stock data files. """
+
+    def __init__(self, added=None, removed=None, modified=None):
+        """ Constructor.
+
+        :param added: symbols only in the new file.
+        :param removed: symbols only in the old file.
+        :param modified: dictionary mapping symbols in both files to the endpoints whose payloads differ (including
+        endpoints present in only one of them).
+        """
+
+        self.added = added or []
+        self.removed = removed or []
+        self.modified = modified or {}
+
+    @staticmethod
+    def from_hashes(old_hashes, new_hashes):
+        modified = {}
+        for symbol in old_hashes.keys() & new_hashes.keys():
+            old_symbol_hashes, new_symbol_hashes = old_hashes[symbol], new_hashes[symbol]
+            if old_symbol_hashes != new_symbol_hashes:
+                endpoints = old_symbol_hashes.keys() | new_symbol_hashes.keys()
+                modified[symbol] = sorted(e for e in endpoints if old_symbol_hashes.get(e) != new_symbol_hashes.get(e))
+
+        return StockDataChangeset(sorted(new_hashes.keys() - old_hashes.keys()),
+                                  sorted(old_hashes.keys() - new_hashes.keys()), modified)
+
+    def get_changed_symbols(self):
+        """ :returns: sorted list of symbols whose stock data the new file adds or modifies. """
+        return sorted(self.added + list(self.modified.keys()))
+
+    def is_empty(self):
+        return len(self.added) == 0 and len(self.removed) == 0 and len(self.modified) == 0
+
+    def __str__(self):
+        return '%d added, %d removed, %d modified' % (len(self.added), len(self.removed), len(self.modified))
+
+
+def convert_to_snapshot(input_dir, file_name, compress=True, remove_source=False):
+    """ Converts a JSON stock data file into a snapshot.
+
+    :param input_dir: directory containing the JSON file (the snapshot is written alongside it).
+    :param file_name: JSON file name.
+    :param compress: whether to gzip-compress the snapshot.
+    :param remove_source: whether to delete the JSON file once the snapshot has been written.
+    :return: snapshot file name.
+    """
+
+    output_name = snapshot_name(file_name, compress)
+    write_snapshot(input_dir, output_name, load_json(input_dir, file_name), True)
+
+    if remove_source:
+        remove(join(input_dir, file_name))
+
+    return output_name
+
+
+def _iter_snapshot_blocks(input_dir, file_name):
+    # Yields (offset, length, decompressed records) of each gzip member of a compressed snapshot, else of each line
+    with open(join(input_dir, file_name), 'rb') as r:
+        if not is_compressed_snapshot(file_name):
+            offset = 0
+            for line in r:
+                yield offset, len(line), line
+                offset += len(line)
+            return
+
+        # Bytes of the file before the current chunk, and of the member being decompressed
+        position = member_offset = 0
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        records = []
+        for chunk in iter(lambda: r.read(STREAM_CHUNK_SIZE), b''):
+            while len(chunk) > 0:
+                records.append(decompressor.decompress(chunk))
+                if not decompressor.eof:
+                    position += len(chunk)
+                    break
+
+                # The member ended within this chunk; the rest of the chunk starts the next member
+                member_end = position + len(chunk) - len(decompressor.unused_data)
+                yield member_offset, member_end - member_offset, b''.join(records)
+                chunk = decompressor.unused_data
+                position = member_offset = member_end
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                records = []
+
+
+def _read_snapshot_block(r, file_name, offset, length):
+    # Reads the block (gzip member or line) at the given offset of an open snapshot and returns its record lines
+    r.seek(offset)
+    chunk = r.read(length)
+    if is_compressed_snapshot(file_name):
+        chunk = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(chunk)
+
+    return chunk.splitlines()
+
+
+def _last_modified(input_dir, file_name):
+    # Latest modification time of the file or its journal (0 if neither exists)
+    paths = [join(input_dir, file_name), join(input_dir, file_name + JOURNAL_SUFFIX)]
+    return max([getmtime(p) for p in paths if exists(p)] or [0])
+
+
+def _encode_record(symbol, data, sort_keys):
+    record = json.dumps({'symbol': symbol, 'data': data}, sort_keys=sort_keys, separators=(',', ':'))
+    return (record + '\n').encode('utf-8')
@@ -0,0 +1,175 @@
+import json
+import re
+from collections import defaultdict
+from os.path import exists
+from time import time
+
+from src.definitions.config import FILTERED_SYMBOLS, RAW_DATA_DIR, TICKER_DETAILS
+from src.utils.data_utils import is_empty
+from src.utils.file_utils import load_json, update_json
+
+
+ELIGIBLE_SYMBOL_TYPES = ['cs']
+MAX_CONSECUTIVE_FAILURES = 3
+SYMBOL_HEALTH_FILE = 'symbol_health.json'
+
+# Dead symbols are retried once their last failure is this old (one more failure makes them dead for another window)
+DEAD_SYMBOL_RETRY_SECONDS = 30 * 24 * 60 * 60
+
+ISSUER_NAME_NOISE = re.compile(r'\b(class [a-z]|series [a-z]|common stock|ordinary shares|shares|the)\b|[^a-z0-9 ]')
+
+
+class SymbolUniverse:
+    """ Index of the symbols worth ingesting and ranking: built from ticker details, with duplicate listings of the same
+    issuer collapsed and symbols that keep returning empty payloads pruned until their retry window passes. An issuer's
+    retained listing is the preferred one that isn't dead, so a dead primary listing is replaced by the next one. """
+
+    def __init__(self, ticker_details, symbol_health=None, filtered_symbols=FILTERED_SYMBOLS,
+                 health_directory=RAW_DATA_DIR):
+        """ Constructor.
+
+        :param ticker_details: list of IEX ref-data symbol records (as saved to TICKER_DETAILS).
+        :param symbol_health: dictionary mapping symbols to [number of consecutive empty/error responses, time of the
+        last one] (or just the number, which is retried as if the last failure were long ago).
+        :param filtered_symbols: symbols to always exclude.
+        :param health_directory: directory symbol health is persisted to (None keeps it in memory only).
+        """
+
+        self.symbol_health = symbol_health or {}
+        self.health_directory = health_directory
+        self.filtered_symbols = set(filtered_symbols or [])
+
+        self.details = {}
+        self.by_exchange = defaultdict(set)
+        self.by_issuer = defaultdict(set)
+        self.by_type = defaultdict(set)
+        self.issuers = {}
+        for detail in ticker_details:
+            symbol = detail.get('symbol')
+            if symbol is None or detail.get('isEnabled') is False:
+                continue
+            self.details[symbol] = detail
+            self.issuers[symbol] = _issuer_key(detail)
+            self.by_exchange[detail.get('exchange')].add(symbol)
+            self.by_issuer[self.issuers[symbol]].add(symbol)
+            self.by_type[detail.get('type')].add(symbol)
+
+        # Maps each collapsed duplicate listing to the symbol retained for its issuer
+        self.duplicates = {}
+        for issuer_symbols in self.by_issuer.values():
+            self._collapse_duplicates(issuer_symbols)
+
+    @staticmethod
+    def load():
+        """ :returns: universe built from the TICKER_DETAILS file and the persisted symbol health. """
+
+        ticker_details = []
+        if exists(TICKER_DETAILS):
+            with open(TICKER_DETAILS, 'r') as jf:
+                ticker_details = json.load(jf)
+
+        return SymbolUniverse(ticker_details, load_json(RAW_DATA_DIR, SYMBOL_HEALTH_FILE))
+
+    def get_symbols(self, types=ELIGIBLE_SYMBOL_TYPES):
+        """ :returns: sorted list of included symbols of the given types. """
+
+        symbols = set().union(*[self.by_type[t] for t in types]) if types else set(self.details.keys())
+        return sorted(filter(self.is_included, symbols))
+
+    def get_detail(self, symbol, key, default=None):
+        return self.details.get(symbol, {}).get(key, default)
+
+    def is_dead(self, symbol):
+        """ :returns: whether the symbol failed MAX_CONSECUTIVE_FAILURES times in a row, the last time within the retry
+        window. """
+
+        failures, last_failure = self._get_health(symbol)
+        return failures >= MAX_CONSECUTIVE_FAILURES and time() - last_failure < DEAD_SYMBOL_RETRY_SECONDS
+
+    def is_included(self, symbol):
+        """ Whether the symbol should be ingested and ranked. Without ticker details, only filtered and dead symbols
+        are excluded. """
+
+        if symbol in self.filtered_symbols or symbol in self.duplicates or self.is_dead(symbol):
+            return False
+
+        return len(self.details) == 0 or symbol in self.details
+
+    def prune(self, symbols):
+        """ Splits the given symbols into those to keep and those pruned from the universe. A dead symbol's issuer's
+        next listing is kept in its place (candidate lists such as TICKER_SYMBOLS only hold the listing retained when
+        they were written).
+
+        :param symbols: list of candidate symbols.
+        :return: tuple of (kept symbols, pruned symbols).
+        """
+
+        candidates = set(symbols)
+        kept = []
+        pruned = []
+        for symbol in symbols:
+            if self.is_included(symbol):
+                kept.append(symbol)
+                continue
+
+            pruned.append(symbol)
+            promoted = self.duplicates.get(symbol)
+            if self.is_dead(symbol) and promoted is not None and promoted not in candidates and \
+                    self.is_included(promoted):
+                kept.append(promoted)
+                candidates.add(promoted)
+
+        return kept, pruned
+
+    def record_payloads(self, symbol, payloads):
+        """ Updates the symbol's health given the payloads fetched for it during ingestion.
+
+        :param symbol: ingested symbol.
+        :param payloads: dictionary mapping endpoint names to fetched payloads.
+        """
+
+        failures, _ = self._get_health(symbol)
+        if all(is_empty(p) for p in payloads.values()):
+            updated_health = [failures + 1, time()]
+        elif failures > 0:
+            updated_health = 0
+        else:
+            return
+
+        was_dead = self.is_dead(symbol)
+        self.symbol_health[symbol] = updated_health
+        if self.health_directory is not None:
+            update_json(self.health_directory, SYMBOL_HEALTH_FILE, {symbol: updated_health})
+
+        if self.is_dead(symbol) != was_dead and symbol in self.issuers:
+            self._collapse_duplicates(self.by_issuer[self.issuers[symbol]])
+
+    def _collapse_duplicates(self, issuer_symbols):
+        # Retains the issuer's preferred listing that isn't dead (or the preferred one, if every listing is dead)
+        live_symbols = [s for s in issuer_symbols if not self.is_dead(s)] or list(issuer_symbols)
+        primary = min(live_symbols, key=_listing_preference)
+        for symbol in issuer_symbols:
+            if symbol == primary:
+                self.duplicates.pop(symbol, None)
+            else:
+                self.duplicates[symbol] = primary
+
+    def _get_health(self, symbol):
+        # (consecutive failures, time of the last one); bare failure counts predate the retry window
+        health = self.symbol_health.get(symbol, 0)
+        return (health, 0) if isinstance(health, int) else tuple(health)
+
+
+def _issuer_key(detail):
+    # Share classes of the same company share a CIK; fall back to a normalized company name
+    cik = detail.get('cik')
+    if cik:
+        return (detail.get('type'), 'cik', str(cik).lstrip('0'))
+
+    name = ISSUER_NAME_NOISE.sub('', (detail.get('name') or '').lower())
+    return (detail.get('type'), 'name', ' '.join(name.split()) or detail.get('symbol'))
+
+
+def _listing_preference(symbol):
+    # Prefer plain tickers over suffixed share classes (BRK.B, PBR-A), then shorter, then alphabetical
+    return any(c in symbol for c in '.-+=^'), len(symbol), symbol
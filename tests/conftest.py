@@ -0,0 +1,37 @@
+import json
+import os
+import tempfile
+from os.path import join
+
+import pytest
+
+
+# Modules read config.json from the working directory at import time, so point it at a scratch data directory first
+TEST_ROOT = tempfile.mkdtemp(prefix='investment_analytics_test_')
+DATA_DIR = join(TEST_ROOT, 'data')
+for directory in [join(DATA_DIR, 'processed'), join(DATA_DIR, 'raw'), join(TEST_ROOT, 'logs')]:
+    os.makedirs(directory)
+
+with open(join(TEST_ROOT, 'config.json'), 'w') as config_file:
+    json.dump({
+        'DATA_DIRECTORY': DATA_DIR,
+        'LOG_DIRECTORY': join(TEST_ROOT, 'logs'),
+        'FINANCIAL_CONTENT_API_URL': 'http://127.0.0.1:1',
+        'IEX_API_KEY': 'test',
+        'IEX_API_URL': 'http://127.0.0.1:1',
+        'SANDBOX_IEX_API_KEY': 'test',
+        'SANDBOX_IEX_API_URL': 'http://127.0.0.1:1',
+        'DB_CONFIG': {
+            'DB_USER': 'test', 'DB_PASSWORD': 'test', 'DB_HOST': 'localhost', 'DB_PORT': 5432, 'DB_NAME': 'test'
+        },
+        'FILTERED_SYMBOLS': [],
+        'TICKER_DETAILS': join(DATA_DIR, 'raw', 'ticker_details.json'),
+        'TICKER_SYMBOLS': join(DATA_DIR, 'raw', 'tickers.txt')
+    }, config_file)
+
+os.chdir(TEST_ROOT)
+
+
+@pytest.fixture(scope='session')
+def data_dir():
+    return DATA_DIR
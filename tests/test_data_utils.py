@@ -0,0 +1,66 @@
+import pytest
+
+from src.definitions.config import PROCESSED_DATA_DIR
+from src.utils.data_utils import merge_stock_data_to_master
+from src.utils.file_utils import load_json
+from src.utils.snapshot_utils import diff_stock_data, load_stock_data, save_stock_data
+
+MASTER = {
+    'AAPL': {'PRICE': 100, 'KEY_STATS': {'marketcap': 1}},
+    'MSFT': {'PRICE': 200, 'KEY_STATS': {'marketcap': 2}},
+    'IBM': {'PRICE': 300}
+}
+SOURCE = {
+    'AAPL': {'PRICE': 101},
+    'MSFT': {'PRICE': 200, 'KEY_STATS': {'marketcap': 2}},
+    'NEW': {'PRICE': 1}
+}
+MERGED = {
+    'AAPL': {'PRICE': 101, 'KEY_STATS': {'marketcap': 1}},
+    'MSFT': {'PRICE': 200, 'KEY_STATS': {'marketcap': 2}},
+    'IBM': {'PRICE': 300}
+}
+
+
+@pytest.mark.parametrize('extension', ['.json', '.jsonl', '.jsonl.gz'])
+def test_merge_stock_data_to_master(extension):
+    master_file, source_file = 'merge_master' + extension, 'merge_source' + extension
+    save_stock_data(PROCESSED_DATA_DIR, master_file, MASTER)
+    save_stock_data(PROCESSED_DATA_DIR, source_file, SOURCE)
+
+    changeset = merge_stock_data_to_master(source_file, master_file)
+    assert changeset.modified == {'AAPL': ['KEY_STATS', 'PRICE']}
+    assert changeset.added == ['NEW'] and changeset.removed == ['IBM']
+
+    # The master is untouched, and the updated copy's content hashes are current
+    output_file = 'merge_master_updated' + extension
+    assert load_stock_data(PROCESSED_DATA_DIR, master_file) == MASTER
+    assert load_stock_data(PROCESSED_DATA_DIR, output_file) == MERGED
+    assert diff_stock_data(PROCESSED_DATA_DIR, output_file, master_file).modified == {'AAPL': ['PRICE']}
+
+
+def test_merge_json_master_in_place():
+    save_stock_data(PROCESSED_DATA_DIR, 'in_place_master.json', MASTER)
+    save_stock_data(PROCESSED_DATA_DIR, 'in_place_source.json', SOURCE)
+
+    merge_stock_data_to_master('in_place_source.json', 'in_place_master.json', 'in_place_master.json')
+    assert load_json(PROCESSED_DATA_DIR, 'in_place_master.json') == MERGED
+
+
+def test_merge_to_another_format():
+    save_stock_data(PROCESSED_DATA_DIR, 'convert_master.json', MASTER)
+    save_stock_data(PROCESSED_DATA_DIR, 'convert_source.json', SOURCE)
+
+    merge_stock_data_to_master('convert_source.json', 'convert_master.json', 'convert_master.jsonl.gz')
+    assert load_stock_data(PROCESSED_DATA_DIR, 'convert_master.jsonl.gz') == MERGED
+
+
+def test_merge_replaces_stale_output():
+    save_stock_data(PROCESSED_DATA_DIR, 'stale_master.json', MASTER)
+    save_stock_data(PROCESSED_DATA_DIR, 'stale_source.json', SOURCE)
+    merge_stock_data_to_master('stale_source.json', 'stale_master.json')
+
+    # Merging an unchanged source again must not replay the previous output's journal
+    save_stock_data(PROCESSED_DATA_DIR, 'stale_source.json', MASTER)
+    merge_stock_data_to_master('stale_source.json', 'stale_master.json')
+    assert load_stock_data(PROCESSED_DATA_DIR, 'stale_master_updated.json') == MASTER
@@ -0,0 +1,51 @@
+from multiprocessing import get_start_method
+from random import Random
+
+import pytest
+
+from src.analysis import factors
+from src.analysis.factors import FactorEngine, FactorSpec, earnings_yield
+from src.analysis.stock import Stock
+from src.definitions.factors import MissingValuePolicy, SortOrder
+
+FACTOR_SPECS = [
+    FactorSpec('Price', 0, [['PRICE']], ranked=False, composite=False),
+    FactorSpec('P/E', 1, [['ADVANCED_STATS', 'peRatio']]),
+    FactorSpec('EY%', 2, [['ADVANCED_STATS', 'EBITDA'], ['ADVANCED_STATS', 'enterpriseValue']], earnings_yield,
+               sort_order=SortOrder.DESCENDING),
+    FactorSpec('Symbol Length', 3, [lambda stock: len(stock.symbol)], missing_value_policy=MissingValuePolicy.WORST)
+]
+
+
+def _stocks(n):
+    random = Random(n)
+    stocks = []
+    for i in range(n):
+        advanced_stats = {'peRatio': random.choice([None, 10.0, 20.0, random.uniform(-20, 60)]),
+                          'EBITDA': random.uniform(-1e8, 1e9), 'enterpriseValue': random.uniform(-1e8, 1e10)}
+        stock_data = {'PRICE': random.uniform(1, 500), 'ADVANCED_STATS': advanced_stats}
+        stocks.append(Stock('S' * (i % 4 + 1) + str(i), stock_data))
+    return stocks
+
+
+@pytest.mark.skipif(get_start_method() != 'fork', reason='sharded evaluation requires forked worker processes')
+@pytest.mark.parametrize('grouped', [False, True])
+def test_sharded_evaluation_matches_single_process(monkeypatch, grouped):
+    monkeypatch.setattr(factors, 'MIN_SHARD_SIZE', 50)
+    stocks = _stocks(400)
+    groups = [i % 3 for i in range(len(stocks))] if grouped else None
+
+    expected = FactorEngine(FACTOR_SPECS).evaluate(stocks, groups)
+    assert FactorEngine(FACTOR_SPECS, num_processes=3).evaluate(stocks, groups) == expected
+
+
+def test_update_source_after_sharded_evaluation(monkeypatch):
+    monkeypatch.setattr(factors, 'MIN_SHARD_SIZE', 50)
+    stocks = _stocks(200)
+    engine = FactorEngine(FACTOR_SPECS, num_processes=2)
+    engine.evaluate(stocks)
+
+    stocks[0].stock_data['ADVANCED_STATS']['EBITDA'] = 1e12
+    factor_values, _ = engine.update_source(['ADVANCED_STATS', 'EBITDA'], {0: 1e12})
+    assert factor_values == FactorEngine(FACTOR_SPECS).evaluate(stocks)[0]
+    assert factor_values[0]['EY%'] == 0.0
@@ -0,0 +1,54 @@
+import json
+from os.path import join
+
+import pytest
+
+from src.utils.file_utils import JOURNAL_SUFFIX, iter_json, load_json, save_json, update_json
+
+CONTENT = {
+    'AAPL': {'PRICE': 123.456, 'KEY_STATS': {'companyName': 'Apple Inc.', 'marketcap': 2 * 10 ** 12}},
+    'BRK.B': [1, -2.5e-3, True, False, None, '', 'quote " and \\u00e9 é'],
+    'EMPTY': {},
+    'NUMBER': 1234567890123,
+    'NESTED': {'a': [{'b': [[], {}]}]}
+}
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 1024 * 1024])
+def test_iter_json_matches_load_json(tmp_path, indent, chunk_size):
+    save_json(str(tmp_path), 'content.json', CONTENT, indent=indent)
+    assert list(iter_json(str(tmp_path), 'content.json', chunk_size)) == list(CONTENT.items())
+
+
+@pytest.mark.parametrize('text', ['{}', ' { } ', '{"a": 1}', '{"a":1,"b":-12.5e3}\n'])
+def test_iter_json_small_objects(tmp_path, text):
+    (tmp_path / 'small.json').write_text(text)
+    for chunk_size in [1, 2, 1024]:
+        assert dict(iter_json(str(tmp_path), 'small.json', chunk_size)) == json.loads(text)
+
+
+def test_iter_json_merges_journal(tmp_path):
+    save_json(str(tmp_path), 'journaled.json', {'A': 1, 'B': 2})
+    update_json(str(tmp_path), 'journaled.json', {'B': 3, 'C': 4})
+    update_json(str(tmp_path), 'journaled.json', {'C': 5})
+
+    # Torn records left by an interrupted append are skipped
+    with open(join(str(tmp_path), 'journaled.json' + JOURNAL_SUFFIX), 'a') as w:
+        w.write('{"A": ')
+
+    assert list(iter_json(str(tmp_path), 'journaled.json', 3)) == [('A', 1), ('B', 3), ('C', 5)]
+    assert load_json(str(tmp_path), 'journaled.json') == {'A': 1, 'B': 3, 'C': 5}
+
+
+def test_iter_json_journal_only(tmp_path):
+    update_json(str(tmp_path), 'journal_only.json', {'A': 1})
+    assert list(iter_json(str(tmp_path), 'journal_only.json')) == [('A', 1)]
+    assert list(iter_json(str(tmp_path), 'missing.json')) == []
+
+
+@pytest.mark.parametrize('text', ['[1, 2]', '{"a": 1', '{"a" 1}', '{"a": 1,}'])
+def test_iter_json_malformed(tmp_path, text):
+    (tmp_path / 'malformed.json').write_text(text)
+    with pytest.raises(ValueError):
+        list(iter_json(str(tmp_path), 'malformed.json', 2))
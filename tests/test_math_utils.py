@@ -0,0 +1,69 @@
+from random import Random
+
+import pytest
+
+from src.utils.data_utils import pad_with_median
+from src.utils.math_utils import calculate_grouped_percentiles, calculate_percentile, calculate_percentiles, \
+    calculate_sorted_percentiles, index_groups, sort_percentile_entries
+
+
+def _values(seed, n=200):
+    random = Random(seed)
+    return [random.choice([None, 1.0, 2.0, random.randint(-50, 50), random.uniform(-50, 50)]) for _ in range(n)]
+
+
+def _reference_percentiles(values, reverse=False, pad_missing=True, default=50.0):
+    # The original quadratic calculation: each value's position in the sorted (median-padded) list
+    present = [v for v in values if v is not None]
+    ordered = sorted(pad_with_median(present, len(values)) if pad_missing and present else present, reverse=reverse)
+    return [calculate_percentile(v, ordered, len(values), default) for v in values]
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('reverse', [False, True])
+@pytest.mark.parametrize('pad_missing, default', [(True, 50.0), (False, 100.0)])
+def test_calculate_percentiles_matches_calculate_percentile(seed, reverse, pad_missing, default):
+    values = _values(seed)
+    assert calculate_percentiles(values, reverse, pad_missing, default) == \
+        _reference_percentiles(values, reverse, pad_missing, default)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('reverse', [False, True])
+def test_grouped_percentiles_match_each_group_alone(seed, reverse):
+    values = _values(seed)
+    groups = [('Tech', 'Energy', None, 3)[i % 4] for i in range(len(values))]
+    percentiles = calculate_grouped_percentiles(values, groups, reverse)
+
+    for group in set(groups):
+        indexes = [i for i, g in enumerate(groups) if g == group]
+        expected = calculate_percentiles([values[i] for i in indexes], reverse)
+        assert [percentiles[i] for i in indexes] == expected
+
+
+def test_grouped_percentiles_without_groups():
+    values = _values(7)
+    assert calculate_grouped_percentiles(values, None) == calculate_percentiles(values)
+
+
+def test_group_without_present_values():
+    assert calculate_grouped_percentiles([None, None, 1.0, 2.0], ['A', 'A', 'B', 'B'], default=42.0) == \
+        [42.0, 42.0, 0.0, 50.0]
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('reverse', [False, True])
+def test_merged_runs_of_slices_match_whole_sort(seed, reverse):
+    values = _values(seed)
+    groups = [('Tech', 'Energy', None)[i % 3] for i in range(len(values))]
+    group_ids = index_groups(groups)
+    bounds = [0, 37, 38, 120, len(values)]
+
+    entries = []
+    for start, end in zip(bounds, bounds[1:]):
+        entries.extend(sort_percentile_entries(values[start:end], group_ids[start:end], reverse, start))
+    entries.sort()
+
+    assert entries == sort_percentile_entries(values, group_ids, reverse)
+    expected = calculate_grouped_percentiles(values, groups, reverse)
+    assert calculate_sorted_percentiles(entries, group_ids, reverse) == expected
@@ -0,0 +1,69 @@
+from datetime import date, timedelta
+
+import pytest
+
+from src.analysis.price_history import CLOSES_EXTENSION, DATES_EXTENSION, PriceHistoryStore, RollingMomentumEngine
+
+START_DATE = date(2020, 1, 1)
+
+
+def _dated_prices(num_days, first_day=0):
+    return [(START_DATE + timedelta(days=i), 100.0 + i) for i in range(first_day, first_day + num_days)]
+
+
+def test_append_round_trip(tmp_path):
+    store = PriceHistoryStore(str(tmp_path))
+    assert store.append('AAPL', _dated_prices(3)[::-1]) == 3
+    assert store.append('AAPL', _dated_prices(4)) == 1
+    assert store.append('AAPL', [(START_DATE + timedelta(days=5), None)]) == 0
+
+    # A new store reads the same arrays back from disk
+    loaded = PriceHistoryStore(str(tmp_path))
+    assert loaded.get_symbols() == ['AAPL']
+    assert [date.fromordinal(d) for d in loaded.get_dates('AAPL')] == [d for d, _ in _dated_prices(4)]
+    assert list(loaded.get_closes('AAPL')) == [p for _, p in _dated_prices(4)]
+    assert loaded.get_last_date('AAPL') == START_DATE + timedelta(days=3)
+
+
+def test_append_keeps_last_price_of_duplicate_dates(tmp_path):
+    store = PriceHistoryStore(str(tmp_path))
+    assert store.append('AAPL', [(START_DATE, 1.0), (START_DATE, 2.0)]) == 1
+    assert list(store.get_closes('AAPL')) == [2.0]
+
+
+def test_missing_symbol(tmp_path):
+    store = PriceHistoryStore(str(tmp_path))
+    assert len(store.get_dates('AAPL')) == 0 and len(store.get_closes('AAPL')) == 0
+    assert store.get_last_date('AAPL') is None
+
+
+def test_interrupted_append(tmp_path):
+    store = PriceHistoryStore(str(tmp_path))
+    store.append('AAPL', _dated_prices(3))
+
+    # Simulate an append interrupted after writing the dates and part of a close
+    with open(str(tmp_path / ('AAPL' + DATES_EXTENSION)), 'ab') as df:
+        df.write(b'\x01\x00\x00\x00' * 2)
+    with open(str(tmp_path / ('AAPL' + CLOSES_EXTENSION)), 'ab') as cf:
+        cf.write(b'\x00' * 5)
+
+    store = PriceHistoryStore(str(tmp_path))
+    assert len(store.get_dates('AAPL')) == 3 and len(store.get_closes('AAPL')) == 3
+
+    assert store.append('AAPL', _dated_prices(2, 3)) == 2
+    assert [date.fromordinal(d) for d in store.get_dates('AAPL')] == [d for d, _ in _dated_prices(5)]
+    assert list(store.get_closes('AAPL')) == [p for _, p in _dated_prices(5)]
+
+
+def test_rolling_momentum_state_round_trip(tmp_path):
+    store = PriceHistoryStore(str(tmp_path))
+    store.append('AAPL', _dated_prices(200))
+    engine = RollingMomentumEngine.load(store)
+    engine.update()
+    engine.save()
+
+    # Folding in newly appended prices matches computing from scratch
+    store.append('AAPL', _dated_prices(100, 200))
+    factors = RollingMomentumEngine.load(store).compute()
+    assert factors['AAPL'] == pytest.approx(RollingMomentumEngine(store).compute()['AAPL'])
+    assert factors['AAPL']['3M RET'] == pytest.approx(399.0 / (399.0 - 63) - 1)
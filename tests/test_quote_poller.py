@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from src.api.emulator import FaultProfile, StockDataEmulator
+from src.api.quote_poller import QuotePoller
+from src.api.stock_data_api import IEXCloudAPI
+from src.definitions.routes import IEXMarketDataEndpoint, IEXStockDataEndpoint
+
+
+@pytest.mark.parametrize('batch_size', [IEXCloudAPI.MAX_BATCH_SIZE, 1])
+def test_poll_updates_moved_prices_and_keeps_last_price_on_failure(batch_size):
+    stock_data = {'AA': {'PRICE': 10}, 'BB': {'PRICE': 20}, 'CC': {'PRICE': 30}}
+    with StockDataEmulator(stock_data, synthesize=False) as emulator:
+        poller = QuotePoller(IEXCloudAPI(False, emulator.base_url), ['AA', 'BB', 'CC', 'UNKNOWN'],
+                             batch_size=batch_size)
+
+        # Unknown symbols have no price to keep
+        assert asyncio.run(poller.poll()) == {'AA': 10, 'BB': 20, 'CC': 30}
+        routes = sorted(route for route, _, _ in emulator.get_request_log())
+        if batch_size == 1:
+            assert routes == [IEXStockDataEndpoint.PRICE.name] * 4
+        else:
+            assert routes == [IEXMarketDataEndpoint.BATCH.name]
+
+        stock_data['AA']['PRICE'] = 11
+        assert asyncio.run(poller.poll()) == {'AA': 11}
+
+        stock_data['BB']['PRICE'] = 21
+        emulator.fault_profile = FaultProfile(server_error_rate=1.0)
+        assert asyncio.run(poller.poll()) == {}
+        assert poller.prices == {'AA': 11, 'BB': 20, 'CC': 30}
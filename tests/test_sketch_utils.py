@@ -0,0 +1,95 @@
+from bisect import bisect_left
+from random import Random
+
+import pytest
+
+from src.utils.sketch_utils import QuantileSketch
+
+
+def _assert_within_bounds(sketch, values):
+    values = sorted(values)
+    assert sketch.count == len(values)
+    for value in values[::7] + [values[0] - 1, values[-1] + 1]:
+        assert abs(sketch.rank(value) - bisect_left(values, value)) <= sketch.max_rank_error
+
+
+@pytest.mark.parametrize('capacity', [8, 32, 128])
+def test_rank_within_max_rank_error(capacity):
+    random = Random(capacity)
+    values = [random.gauss(0, 1) for _ in range(5000)]
+
+    sketch = QuantileSketch(capacity)
+    for value in values:
+        sketch.add(value)
+
+    assert sketch.max_rank_error > 0
+    _assert_within_bounds(sketch, values)
+
+
+def test_rank_exact_before_compaction():
+    values = [5, 1, 3, 3, 2]
+    sketch = QuantileSketch(16)
+    for value in values:
+        sketch.add(value)
+
+    assert sketch.max_rank_error == 0
+    assert [sketch.rank(v) for v in [0, 1, 2, 3, 4, 5, 6]] == [0, 0, 1, 2, 4, 4, 5]
+    assert sketch.quantile(0.5) == 3
+
+
+def test_merge_adds_error_bounds():
+    random = Random(1)
+    sketches, values = [], []
+    for _ in range(4):
+        sketch = QuantileSketch(32)
+        for _ in range(1000):
+            value = random.randint(-500, 500)
+            sketch.add(value)
+            values.append(value)
+        sketches.append(sketch)
+
+    merged = QuantileSketch(32)
+    for sketch in sketches:
+        merged.merge(sketch)
+
+    assert merged.max_rank_error >= sum(s.max_rank_error for s in sketches)
+    _assert_within_bounds(merged, values)
+
+
+def test_rank_reflects_added_values():
+    sketch = QuantileSketch(16)
+    sketch.add(1)
+    assert sketch.rank(2) == 1
+
+    # Values added after a rank is computed must still be counted
+    sketch.add(0)
+    assert sketch.rank(2) == 2
+
+
+def test_quantile_within_max_rank_error():
+    values = list(range(10000))
+    Random(2).shuffle(values)
+
+    sketch = QuantileSketch(64)
+    for value in values:
+        sketch.add(value)
+
+    # Values are their own ranks, so the estimated quantile's distance from the true one is its rank error
+    for fraction in [0.0, 0.1, 0.5, 0.9, 1.0]:
+        assert abs(sketch.quantile(fraction) - fraction * len(values)) <= sketch.max_rank_error + 1
+
+
+def test_empty_sketch():
+    sketch = QuantileSketch()
+    assert sketch.rank(0) == 0
+    assert sketch.quantile(0.5) is None
+
+
+def test_round_trip():
+    sketch = QuantileSketch(16)
+    for value in range(100):
+        sketch.add(value)
+
+    loaded = QuantileSketch.from_dict(sketch.to_dict())
+    assert loaded.count == sketch.count and loaded.max_rank_error == sketch.max_rank_error
+    assert [loaded.rank(v) for v in range(0, 100, 9)] == [sketch.rank(v) for v in range(0, 100, 9)]
@@ -0,0 +1,54 @@
+import os
+from os.path import join
+
+import pytest
+
+from src.definitions.config import PROCESSED_DATA_DIR
+from src.utils import snapshot_utils
+from src.utils.file_utils import load_json
+from src.utils.snapshot_utils import INDEX_SUFFIX, RECORDS_PER_BLOCK, load_snapshot_index, load_stock_data_symbols, \
+    read_snapshot_symbol, write_snapshot
+
+STOCK_DATA = {
+    'S%03d' % i: {'PRICE': i, 'KEY_STATS': {'companyName': 'Co %d' % i}} for i in range(3 * RECORDS_PER_BLOCK)
+}
+
+
+@pytest.mark.parametrize('file_name', ['index_snapshot.jsonl', 'index_snapshot.jsonl.gz'])
+@pytest.mark.parametrize('chunk_size', [7, 1024 * 1024])
+def test_rebuild_missing_index(monkeypatch, file_name, chunk_size):
+    monkeypatch.setattr(snapshot_utils, 'STREAM_CHUNK_SIZE', chunk_size)
+    write_snapshot(PROCESSED_DATA_DIR, file_name, STOCK_DATA, True)
+    written_index = load_json(PROCESSED_DATA_DIR, file_name + INDEX_SUFFIX)
+    with open(join(PROCESSED_DATA_DIR, file_name), 'rb') as r:
+        snapshot_bytes = r.read()
+
+    os.remove(join(PROCESSED_DATA_DIR, file_name + INDEX_SUFFIX))
+    assert load_snapshot_index(PROCESSED_DATA_DIR, file_name) == written_index
+    assert load_json(PROCESSED_DATA_DIR, file_name + INDEX_SUFFIX) == written_index
+
+    # Only the sidecar is written
+    with open(join(PROCESSED_DATA_DIR, file_name), 'rb') as r:
+        assert r.read() == snapshot_bytes
+
+
+def test_read_snapshot_symbol_with_empty_index():
+    write_snapshot(PROCESSED_DATA_DIR, 'empty_index_snapshot.jsonl.gz', STOCK_DATA, True)
+    assert read_snapshot_symbol(PROCESSED_DATA_DIR, 'empty_index_snapshot.jsonl.gz', 'S001', {}) is None
+    assert read_snapshot_symbol(PROCESSED_DATA_DIR, 'empty_index_snapshot.jsonl.gz', 'S001') == STOCK_DATA['S001']
+
+
+@pytest.mark.parametrize('file_name', ['symbols_snapshot.jsonl', 'symbols_snapshot.jsonl.gz'])
+def test_load_stock_data_symbols_reads_each_block_once(monkeypatch, file_name):
+    write_snapshot(PROCESSED_DATA_DIR, file_name, STOCK_DATA, True)
+    block_reads = []
+    read_snapshot_block = snapshot_utils._read_snapshot_block
+    monkeypatch.setattr(snapshot_utils, '_read_snapshot_block',
+                        lambda *args: block_reads.append(args[2]) or read_snapshot_block(*args))
+
+    symbols = ['S000', 'S001', 'S%03d' % (2 * RECORDS_PER_BLOCK), 'S%03d' % (2 * RECORDS_PER_BLOCK + 1), 'MISSING']
+    stock_data = load_stock_data_symbols(PROCESSED_DATA_DIR, file_name, symbols)
+
+    assert stock_data == {s: STOCK_DATA[s] for s in symbols[:-1]}
+    index = load_snapshot_index(PROCESSED_DATA_DIR, file_name)
+    assert sorted(block_reads) == sorted({index[s][0] for s in symbols[:-1]})
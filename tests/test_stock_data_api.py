@@ -0,0 +1,71 @@
+import os
+import shutil
+from os.path import basename
+
+import pytest
+
+from src.analysis.trending_value import MIN_MARKET_CAP, TrendingValue
+from src.api.emulator import FaultProfile, StockDataEmulator
+from src.api.stock_data_api import IEXCloudAPI
+from src.definitions.config import PROCESSED_DATA_DIR, RAW_DATA_DIR, TICKER_SYMBOLS
+from src.definitions.routes import IEXMarketDataEndpoint, IEXStockDataEndpoint
+from src.utils.file_utils import load_json
+from src.utils.universe_utils import SYMBOL_HEALTH_FILE
+
+
+def _stock_data(market_cap):
+    return {e.name: {'marketcap': market_cap} if e == IEXStockDataEndpoint.KEY_STATS else {} for e in
+            IEXStockDataEndpoint}
+
+
+@pytest.fixture
+def ticker_symbols():
+    # Symbols in the ticker file that the tiered run is not asked to ingest
+    with open(TICKER_SYMBOLS, 'w') as tf:
+        tf.write('\n'.join(['OTHER1', 'OTHER2', 'OTHER3']))
+    yield
+    shutil.rmtree(PROCESSED_DATA_DIR)
+    os.makedirs(PROCESSED_DATA_DIR)
+
+
+def test_update_stock_data_tiered_without_eligible_symbols(ticker_symbols):
+    stock_data = {'SMALL1': _stock_data(MIN_MARKET_CAP / 10), 'SMALL2': _stock_data(MIN_MARKET_CAP / 10)}
+    with StockDataEmulator(stock_data, synthesize=False) as emulator:
+        api = IEXCloudAPI(False, emulator.base_url)
+        api.update_stock_data_tiered([TrendingValue], ['SMALL1', 'SMALL2'])
+        routes = [route for route, _, _ in emulator.get_request_log()]
+
+    assert routes == [IEXMarketDataEndpoint.BATCH.name]
+    merged = load_json(PROCESSED_DATA_DIR, _merged_file(api))
+    assert sorted(merged.keys()) == ['SMALL1', 'SMALL2']
+
+
+def test_update_stock_data_tiered_fetches_eligible_symbols_only(ticker_symbols):
+    stock_data = {'LARGE': _stock_data(MIN_MARKET_CAP * 10), 'SMALL': _stock_data(MIN_MARKET_CAP / 10)}
+    with StockDataEmulator(stock_data, synthesize=False) as emulator:
+        api = IEXCloudAPI(False, emulator.base_url)
+        api.update_stock_data_tiered([TrendingValue], ['LARGE', 'SMALL'])
+        routes = sorted(route for route, _, _ in emulator.get_request_log())
+
+    remaining_endpoints = [e.name for e in IEXStockDataEndpoint if e.name not in IEXCloudAPI.SCREENING_ENDPOINTS]
+    assert routes == sorted([IEXMarketDataEndpoint.BATCH.name] + remaining_endpoints)
+    merged = load_json(PROCESSED_DATA_DIR, _merged_file(api))
+    assert sorted(merged['LARGE'].keys()) == sorted(e.name for e in IEXStockDataEndpoint)
+    assert list(merged['SMALL'].keys()) == [IEXStockDataEndpoint.KEY_STATS.name]
+
+
+def test_update_stock_data_tiered_retries_failed_batches_without_recording_failures(ticker_symbols):
+    stock_data = {'LARGE': _stock_data(MIN_MARKET_CAP * 10), 'SMALL': _stock_data(MIN_MARKET_CAP / 10)}
+    symbol_health = load_json(RAW_DATA_DIR, SYMBOL_HEALTH_FILE)
+    with StockDataEmulator(stock_data, FaultProfile(server_error_rate=1.0), synthesize=False) as emulator:
+        api = IEXCloudAPI(False, emulator.base_url)
+        api.update_stock_data_tiered([TrendingValue], ['LARGE', 'SMALL'])
+        routes = [route for route, _, _ in emulator.get_request_log()]
+
+    assert routes == [IEXMarketDataEndpoint.BATCH.name] * 2
+    assert load_json(RAW_DATA_DIR, SYMBOL_HEALTH_FILE) == symbol_health
+    assert load_json(PROCESSED_DATA_DIR, _merged_file(api)) == {}
+
+
+def _merged_file(api):
+    return basename(api._partials_directory()) + '_stock_data.json'
@@ -0,0 +1,69 @@
+from datetime import date
+from os.path import join
+
+import pytest
+
+from src.utils.file_utils import save_json
+
+sqlalchemy = pytest.importorskip('sqlalchemy')
+SQLAlchemyDB = pytest.importorskip('SQLAlchemyDB')
+
+
+@pytest.fixture(scope='module')
+def history_db(data_dir):
+    # SQLAlchemyDB always connects to Postgres; run the same schema and queries against a local SQLite file instead
+    engine = sqlalchemy.create_engine('sqlite:///' + join(data_dir, 'history.db'))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(SQLAlchemyDB.database, 'create_engine', lambda conn_string: engine)
+
+        from src.scripts.create_stock_history_table import create_table
+        create_table()
+
+        from src.db.stock_history import load_stock_data_history
+        from src.scripts.migrate_stock_data_history import migrate_stock_data_history
+        yield migrate_stock_data_history, load_stock_data_history
+
+
+def _symbol_data(price, pe_ratio):
+    return {
+        'PRICE': price,
+        'ADVANCED_STATS': {'peRatio': pe_ratio, 'marketcap': 10 ** 9, 'dividendYield': 'n/a'},
+        'CASH_FLOW': {'cashflow': [{'cashFlow': 5 * 10 ** 7}]}
+    }
+
+
+def test_load_stock_data_history(history_db, data_dir):
+    migrate_stock_data_history, load_stock_data_history = history_db
+    processed_dir = join(data_dir, 'processed')
+
+    save_json(processed_dir, 'history_day1.json', {'AAA': _symbol_data(10.0, 5.0), 'BBB': _symbol_data(20.0, None)})
+    save_json(processed_dir, 'history_day2.json', {'AAA': _symbol_data(11.0, 6.0), 'BBB': _symbol_data(21.0, 7.0),
+                                                   'CCC': _symbol_data(30.0, 8.0)})
+    migrate_stock_data_history('history_day1.json', date(2026, 1, 2))
+    migrate_stock_data_history('history_day2.json', date(2026, 1, 5))
+
+    # Re-migrating a day replaces its rows rather than duplicating them
+    migrate_stock_data_history('history_day2.json', date(2026, 1, 5))
+
+    history = load_stock_data_history(['AAA', 'BBB'], date(2026, 1, 1), date(2026, 1, 31), ['price', 'pe_ratio'])
+    assert history == {
+        'symbol': ['AAA', 'AAA', 'BBB', 'BBB'],
+        'as_of_date': [date(2026, 1, 2), date(2026, 1, 5), date(2026, 1, 2), date(2026, 1, 5)],
+        'price': [10.0, 11.0, 20.0, 21.0],
+        'pe_ratio': [5.0, 6.0, None, 7.0]
+    }
+
+    latest = load_stock_data_history(start_date=date(2026, 1, 5))
+    assert latest['symbol'] == ['AAA', 'BBB', 'CCC']
+    assert latest['operating_cash_flow'] == [5 * 10 ** 7] * 3
+    assert latest['dividend_yield'] == [None] * 3
+
+    assert load_stock_data_history(['ZZZ']) == {c: [] for c in latest.keys()}
+
+    # Symbols are queried in batches, still ordered by symbol across batches
+    from src.db import stock_history
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(stock_history, 'SYMBOL_QUERY_BATCH_SIZE', 1)
+        batched = load_stock_data_history(['CCC', 'AAA', 'BBB', 'AAA'], start_date=date(2026, 1, 5))
+    assert batched == latest
+    assert load_stock_data_history([]) == {c: [] for c in latest.keys()}
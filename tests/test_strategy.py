@@ -0,0 +1,179 @@
+import os
+import pickle
+from os.path import exists, join
+
+import pytest
+
+from src.analysis.factors import FactorSpec, callable_name
+from src.analysis.trending_value import MIN_MARKET_CAP, TrendingValue, VALUE_FACTOR_SPECS
+from src.definitions.config import PROCESSED_DATA_DIR
+from src.utils.cache_utils import CACHE_INDEX_FILE, INDEX_MIN_COMPACTION_BYTES, RankingCache
+from src.utils.file_utils import JOURNAL_SUFFIX
+from src.utils.snapshot_utils import save_stock_data
+
+
+def _ranking(strategy):
+    return [(s.get_symbol(), s.get_rank_factors()) for s in strategy.get_ranked_stocks()]
+
+
+def _save_cached_stock_data(file_name, pe_ratios):
+    save_stock_data(PROCESSED_DATA_DIR, file_name, {
+        'S%02d' % i: {'ADVANCED_STATS': {'marketcap': MIN_MARKET_CAP * 2, 'peRatio': pe_ratio,
+                                         'month6ChangePercent': 0.01 * i}}
+        for i, pe_ratio in enumerate(pe_ratios)
+    })
+
+
+def _scaled(factor):
+    return lambda stock: factor * len(stock.get_symbol())
+
+
+def test_callable_names_distinguish_lambdas():
+    first, second = lambda stock: stock.get_symbol(), lambda stock: stock.get_company_name()
+    assert callable_name(first) != callable_name(second)
+    assert callable_name(first) == callable_name(lambda stock: stock.get_symbol())
+
+    # Closures over different values are different functions
+    assert callable_name(_scaled(1)) != callable_name(_scaled(2))
+    assert callable_name(_scaled(1)) == callable_name(_scaled(1))
+    assert callable_name(TrendingValue) == 'src.analysis.trending_value.TrendingValue'
+
+
+def test_lambda_factor_specs_have_separate_cache_entries(tmp_path):
+    save_stock_data(PROCESSED_DATA_DIR, 'lambda_stock_data.json', {
+        'AA': {'ADVANCED_STATS': {'marketcap': MIN_MARKET_CAP * 2, 'peRatio': 1}},
+        'BBB': {'ADVANCED_STATS': {'marketcap': MIN_MARKET_CAP * 2, 'peRatio': 2}}
+    })
+    cache = RankingCache(str(tmp_path))
+
+    def rank(source):
+        factor_specs = VALUE_FACTOR_SPECS + [FactorSpec('Length', 11, [source])]
+        strategy = TrendingValue(stock_data_file='lambda_stock_data.json', factor_specs=factor_specs,
+                                 ranking_cache=cache)
+        strategy.rank_stocks()
+        return strategy
+
+    rank(lambda stock: len(stock.get_symbol()))
+    strategy = rank(lambda stock: -len(stock.get_symbol()))
+
+    # A cache hit would have left the stock data unloaded
+    assert strategy.stock_data is not None
+
+
+def test_stocks_load_lazily_with_ranking_cache(tmp_path):
+    save_stock_data(PROCESSED_DATA_DIR, 'lazy_stock_data.json', {
+        'AA': {'ADVANCED_STATS': {'marketcap': MIN_MARKET_CAP * 2}}, 'B': {'ADVANCED_STATS': {'marketcap': 1}}
+    })
+    strategy = TrendingValue(stock_data_file='lazy_stock_data.json', ranking_cache=RankingCache(str(tmp_path)))
+    assert strategy.stock_data is None
+
+    assert [stock.get_symbol() for stock in strategy.stocks] == ['AA']
+    assert strategy.num_stocks == 1
+
+
+@pytest.mark.parametrize('file_name', ['streaming_stock_data.json', 'streaming_stock_data.jsonl.gz'])
+def test_streaming_ranks_like_full_load_and_keeps_declared_fields_only(file_name):
+    stock_data = {
+        'S%d' % i: {
+            'ADVANCED_STATS': {'marketcap': MIN_MARKET_CAP * (i + 1), 'peRatio': 10.5 - i, 'priceToBook': i * 1.25,
+                               'month6ChangePercent': 0.1 * i, 'employees': 100 * i},
+            'CASH_FLOW': {'cashflow': [{'cashFlow': 1000 * i}]}, 'PRICE': 10 + i
+        }
+        for i in range(12)
+    }
+    stock_data['SMALL'] = {'ADVANCED_STATS': {'marketcap': 1, 'peRatio': 1}}
+    save_stock_data(PROCESSED_DATA_DIR, file_name, stock_data)
+
+    full = TrendingValue(stock_data_file=file_name)
+    full.rank_stocks()
+    streamed = TrendingValue(stock_data_file=file_name, streaming=True)
+    streamed.rank_stocks()
+
+    assert [s.get_symbol() for s in streamed.get_ranked_stocks()] == [s.get_symbol() for s in full.get_ranked_stocks()]
+    assert [s.get_rank_factors() for s in streamed.get_ranked_stocks()] == \
+        [s.get_rank_factors() for s in full.get_ranked_stocks()]
+
+    assert 'SMALL' not in streamed.stock_data
+    assert all('employees' not in data['ADVANCED_STATS'] for data in streamed.stock_data.values())
+    assert all(data['ADVANCED_STATS']['employees'] == 100 * int(s[1:]) for s, data in full.stock_data.items()
+               if s != 'SMALL')
+
+
+def test_repeat_ranking_hits_cache(tmp_path):
+    _save_cached_stock_data('hit_stock_data.jsonl.gz', range(30))
+    cache = RankingCache(str(tmp_path))
+    first = TrendingValue(stock_data_file='hit_stock_data.jsonl.gz', ranking_cache=cache)
+    first.rank_stocks()
+
+    second = TrendingValue(stock_data_file='hit_stock_data.jsonl.gz', ranking_cache=cache)
+    second.rank_stocks()
+
+    assert second.stock_data is None
+    assert len(_ranking(first)) == 3
+    assert _ranking(second) == _ranking(first)
+
+
+def test_ranking_cache_invalidated_by_changed_snapshot(tmp_path):
+    _save_cached_stock_data('changed_stock_data.jsonl.gz', range(30))
+    cache = RankingCache(str(tmp_path))
+    original = TrendingValue(stock_data_file='changed_stock_data.jsonl.gz', ranking_cache=cache)
+    original.rank_stocks()
+
+    _save_cached_stock_data('changed_stock_data.jsonl.gz', range(30, 0, -1))
+    strategy = TrendingValue(stock_data_file='changed_stock_data.jsonl.gz', ranking_cache=cache)
+    strategy.rank_stocks()
+    uncached = TrendingValue(stock_data_file='changed_stock_data.jsonl.gz')
+    uncached.rank_stocks()
+
+    assert strategy.stock_data is not None
+    assert _ranking(strategy) == _ranking(uncached)
+    assert _ranking(strategy) != _ranking(original)
+
+
+def test_ranking_cache_evicts_least_recently_used(tmp_path):
+    value = list(range(100))
+    cache = RankingCache(str(tmp_path), max_bytes=2 * len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+    cache.put('first', value)
+    cache.put('second', value)
+
+    # Using the first entry makes the second the least recently used
+    assert cache.get('first') == value
+    cache.put('third', value)
+
+    assert cache.get('second') is None
+    assert cache.get('first') == value
+    assert cache.get('third') == value
+
+
+def test_ranking_cache_index_journal_stays_bounded(tmp_path):
+    cache = RankingCache(str(tmp_path))
+    cache.put('key', 'value')
+    for _ in range(1000):
+        assert cache.get('key') == 'value'
+
+    journal_path = join(str(tmp_path), CACHE_INDEX_FILE + JOURNAL_SUFFIX)
+    assert not exists(journal_path) or os.path.getsize(journal_path) <= INDEX_MIN_COMPACTION_BYTES + 100
+
+
+def test_rankings_with_live_prices_are_not_cached(tmp_path):
+    save_stock_data(PROCESSED_DATA_DIR, 'live_stock_data.jsonl.gz', {
+        'S%02d' % i: {'ADVANCED_STATS': {'marketcap': MIN_MARKET_CAP * 2, 'month6ChangePercent': 0.01 * i},
+                      'CASH_FLOW': {'cashflow': [{'cashFlow': 100}]}, 'PRICE': 10 + i}
+        for i in range(30)
+    })
+    cache = RankingCache(str(tmp_path))
+    cached = TrendingValue(stock_data_file='live_stock_data.jsonl.gz', ranking_cache=cache)
+    cached.rank_stocks()
+
+    live = TrendingValue(stock_data_file='live_stock_data.jsonl.gz', ranking_cache=cache)
+    live.rank_stocks()
+    live.update_prices({'S%02d' % i: 1000 - i for i in range(10)})
+    live_ranking = _ranking(live)
+    live.rank_stocks()
+
+    # Neither read from (which would drop the live prices) nor written to the snapshot's cache entry
+    assert _ranking(live) == live_ranking != _ranking(cached)
+    uncached = TrendingValue(stock_data_file='live_stock_data.jsonl.gz', ranking_cache=cache)
+    uncached.rank_stocks()
+    assert uncached.stock_data is None
+    assert _ranking(uncached) == _ranking(cached)
@@ -0,0 +1,82 @@
+import logging
+
+import pytest
+
+from src.analysis.factors import price_to_cash_flow_ratio
+from src.analysis.superstar_momentum import SuperstarMomentum
+from src.analysis.trending_value import MIN_MARKET_CAP, MISSING_RANK_GROUP, TrendingValue, VALUE_FACTOR_SPECS
+from src.definitions.config import PROCESSED_DATA_DIR
+from src.definitions.factors import RankGroup
+from src.utils.snapshot_utils import save_stock_data
+
+
+def _save_stock_data(file_name, sectors):
+    save_stock_data(PROCESSED_DATA_DIR, file_name, {
+        'S%d' % i: {'ADVANCED_STATS': dict({'marketcap': MIN_MARKET_CAP * 2, 'peRatio': i},
+                                           **({} if sector is None else {'sector': sector}))}
+        for i, sector in enumerate(sectors)
+    })
+
+
+def test_missing_rank_groups_are_ranked_together(caplog):
+    _save_stock_data('rank_group_stock_data.json', ['Tech', 'Tech', None, '', None])
+    strategy = TrendingValue(stock_data_file='rank_group_stock_data.json', rank_group=RankGroup.SECTOR)
+
+    with caplog.at_level(logging.WARNING):
+        strategy.rank_stocks()
+
+    assert [strategy._get_rank_group(stock) for stock in strategy.stocks] == ['Tech', 'Tech', None, None, None]
+    assert {s.get_symbol(): s.get_rank_factors()['P/E'] for s in strategy.stocks} == \
+        {'S0': 0.0, 'S1': 50.0, 'S2': 0.0, 'S3': 100.0 / 3, 'S4': 200.0 / 3}
+    assert MISSING_RANK_GROUP in caplog.text
+
+
+def test_mostly_present_rank_groups_do_not_warn(caplog):
+    _save_stock_data('present_rank_group_stock_data.json', ['Tech', 'Energy', None])
+    with caplog.at_level(logging.WARNING):
+        TrendingValue(stock_data_file='present_rank_group_stock_data.json', rank_group=RankGroup.SECTOR).rank_stocks()
+
+    assert caplog.text == ''
+
+
+def _save_priced_stock_data(file_name, prices):
+    save_stock_data(PROCESSED_DATA_DIR, file_name, {
+        'S%02d' % i: {
+            'ADVANCED_STATS': {'marketcap': MIN_MARKET_CAP * 2, 'peRatio': (7 * i) % 30, 'priceToBook': (11 * i) % 30,
+                               'month6ChangePercent': 0.01 * i},
+            'CASH_FLOW': {'cashflow': [{'cashFlow': 100 + i}]}, 'PRICE': price
+        }
+        for i, price in enumerate(prices)
+    })
+
+
+def _ranking(strategy):
+    return [(s.get_symbol(), s.get_rank_factors()) for s in strategy.get_ranked_stocks()]
+
+
+@pytest.mark.parametrize('strategy_class', [TrendingValue, SuperstarMomentum])
+def test_update_prices_matches_full_ranking(monkeypatch, strategy_class):
+    prices = [10 + i for i in range(30)]
+    live_prices = {'S%02d' % i: 1000 - i for i in range(0, 30, 6)}
+    _save_priced_stock_data('update_prices_stock_data.json', prices)
+    _save_priced_stock_data('updated_prices_stock_data.json',
+                            [live_prices.get('S%02d' % i, price) for i, price in enumerate(prices)])
+
+    full = strategy_class(stock_data_file='updated_prices_stock_data.json')
+    full.rank_stocks()
+    strategy = strategy_class(stock_data_file='update_prices_stock_data.json')
+    strategy.rank_stocks()
+    assert _ranking(strategy) != _ranking(full)
+
+    # Only the moved stocks' P/CF is recomputed
+    p_cf_spec = next(spec for spec in VALUE_FACTOR_SPECS if spec.name == 'P/CF')
+    p_cf_prices = []
+    monkeypatch.setattr(p_cf_spec, 'formula', lambda price, cash_flow: p_cf_prices.append(price) or
+                        price_to_cash_flow_ratio(price, cash_flow))
+
+    # Unchanged prices don't move anything
+    assert strategy.update_prices({'S01': 11, 'S02': 'n/a'}) == []
+    assert sorted(strategy.update_prices(dict(live_prices, S01=11))) == sorted(live_prices)
+
+    assert _ranking(strategy) == _ranking(full)
+    assert sorted(p_cf_prices) == sorted(live_prices.values())
@@ -0,0 +1,67 @@
+from time import time
+
+from src.utils.universe_utils import DEAD_SYMBOL_RETRY_SECONDS, MAX_CONSECUTIVE_FAILURES, SymbolUniverse
+
+TICKER_DETAILS = [
+    {'symbol': 'BRK.A', 'cik': '0001067983', 'type': 'cs', 'name': 'Berkshire Hathaway Inc. Class A'},
+    {'symbol': 'BRK.B', 'cik': '1067983', 'type': 'cs', 'name': 'Berkshire Hathaway Inc. Class B'},
+    {'symbol': 'AAPL', 'cik': '320193', 'type': 'cs', 'name': 'Apple Inc.'}
+]
+EMPTY_PAYLOADS = {'ADVANCED_STATS': {}, 'PRICE': None}
+
+
+def _universe(symbol_health=None):
+    return SymbolUniverse(TICKER_DETAILS, symbol_health, filtered_symbols=[], health_directory=None)
+
+
+def _fail(universe, symbol, times=MAX_CONSECUTIVE_FAILURES):
+    for _ in range(times):
+        universe.record_payloads(symbol, EMPTY_PAYLOADS)
+
+
+def test_dead_symbols_are_pruned():
+    universe = _universe()
+    _fail(universe, 'AAPL', MAX_CONSECUTIVE_FAILURES - 1)
+    assert not universe.is_dead('AAPL')
+
+    _fail(universe, 'AAPL', 1)
+    assert universe.is_dead('AAPL')
+    assert universe.prune(['AAPL', 'BRK.A']) == (['BRK.A'], ['AAPL'])
+
+    # A successful fetch revives the symbol
+    universe.record_payloads('AAPL', {'PRICE': 1.0})
+    assert universe.symbol_health['AAPL'] == 0 and not universe.is_dead('AAPL')
+
+
+def test_dead_symbols_are_retried_after_window():
+    long_ago = time() - DEAD_SYMBOL_RETRY_SECONDS - 1
+    universe = _universe({'AAPL': [MAX_CONSECUTIVE_FAILURES, long_ago], 'BRK.A': MAX_CONSECUTIVE_FAILURES})
+    assert not universe.is_dead('AAPL') and not universe.is_dead('BRK.A')
+    assert universe.prune(['AAPL', 'BRK.A']) == (['AAPL', 'BRK.A'], [])
+
+    # Failing the retry makes the symbol dead for another window
+    _fail(universe, 'AAPL', 1)
+    assert universe.is_dead('AAPL')
+
+
+def test_next_listing_is_promoted_when_primary_dies():
+    universe = _universe()
+    assert universe.duplicates == {'BRK.B': 'BRK.A'}
+
+    _fail(universe, 'BRK.A')
+    assert universe.duplicates == {'BRK.A': 'BRK.B'}
+    assert universe.get_symbols() == ['AAPL', 'BRK.B']
+    assert universe.prune(['AAPL', 'BRK.A']) == (['AAPL', 'BRK.B'], ['BRK.A'])
+
+    # Once the primary is retried and revives, it's retained again
+    universe.record_payloads('BRK.A', {'PRICE': 1.0})
+    assert universe.duplicates == {'BRK.B': 'BRK.A'}
+
+
+def test_dead_listings_at_construction():
+    universe = _universe({'BRK.A': [MAX_CONSECUTIVE_FAILURES, time()]})
+    assert universe.duplicates == {'BRK.A': 'BRK.B'}
+
+    # With every listing dead, the preferred one is retained
+    universe = _universe({'BRK.A': [MAX_CONSECUTIVE_FAILURES, time()], 'BRK.B': [MAX_CONSECUTIVE_FAILURES, time()]})
+    assert universe.duplicates == {'BRK.B': 'BRK.A'} and universe.get_symbols() == ['AAPL']